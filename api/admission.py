@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+准入控制 - 按模型和全局限制同时进行的上游请求数
+
+每个模型有独立的并发上限和有界等待队列，慢模型的请求只会占满自己的名额和队列，
+不会阻塞其他模型。请求先取得模型名额，再取得全局名额；队列已满或排队超时时拒绝请求，
+由调用方返回HTTP 429和Retry-After。
+"""
+
+import math
+import time
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入"""
+
+    def __init__(self, model: str, reason: str, retry_after: int):
+        """
+        Args:
+            model: 模型ID
+            reason: 拒绝原因，"queue_full"或"queue_timeout"
+            retry_after: 建议的重试等待时间（秒）
+        """
+        super().__init__(f"模型 {model} 当前请求过多（{reason}），请 {retry_after} 秒后重试")
+        self.model = model
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Lane:
+    """一组并发名额及其等待队列"""
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        # 请求占用名额时间的指数移动平均，用于估算Retry-After
+        self.avg_hold = 1.0
+
+    def retry_after(self) -> int:
+        """估算队列排空所需的时间"""
+        rounds = (self.waiting + self.active) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(rounds * self.avg_hold))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_hold_seconds": round(self.avg_hold, 3)
+        }
+
+
+class AdmissionTicket:
+    """已取得的并发名额，可作为上下文管理器使用，release可重复调用"""
+
+    def __init__(self, controller: "AdmissionController", lane: _Lane):
+        self._controller = controller
+        self._lane = lane
+        self._started_at = time.monotonic()
+        self._released = False
+
+    def release(self):
+        """释放名额"""
+        if not self._released:
+            self._released = True
+            self._controller._release(self._lane, time.monotonic() - self._started_at)
+
+    def __enter__(self) -> "AdmissionTicket":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class AdmissionController:
+    """按模型和全局的并发准入控制"""
+
+    def __init__(self, max_concurrency: int = 64, max_queue: int = 256, queue_timeout: float = 30,
+                 model_concurrency: int = 16, model_queue: int = 64,
+                 models: Optional[Dict[str, Dict[str, int]]] = None):
+        """
+        初始化准入控制
+
+        Args:
+            max_concurrency: 全局最多同时进行的上游请求数
+            max_queue: 全局最多等待的请求数
+            queue_timeout: 请求最长排队时间（秒），超时后拒绝
+            model_concurrency: 每个模型默认的并发上限
+            model_queue: 每个模型默认的等待队列长度
+            models: 按模型覆盖的设置，如 {"gpt-4": {"max_concurrency": 4, "max_queue": 16}}
+        """
+        self.queue_timeout = queue_timeout
+        self.model_concurrency = model_concurrency
+        self.model_queue = model_queue
+        self.model_overrides = models or {}
+        self._global = _Lane(max_concurrency, max_queue)
+        self._models: Dict[str, _Lane] = {}
+        self._cond = threading.Condition()
+
+    def _lane_of(self, model: str) -> _Lane:
+        """获取模型的名额，调用方需持有self._cond"""
+        lane = self._models.get(model)
+        if lane is None:
+            override = self.model_overrides.get(model, {})
+            lane = self._models[model] = _Lane(
+                override.get("max_concurrency", self.model_concurrency),
+                override.get("max_queue", self.model_queue)
+            )
+        return lane
+
+    def _wait_for(self, lane: _Lane, model: str, deadline: float):
+        """在lane上排队直到取得名额，调用方需持有self._cond"""
+        if lane.active < lane.max_concurrency and lane.waiting == 0:
+            lane.active += 1
+            return
+        if lane.waiting >= lane.max_queue:
+            lane.rejected += 1
+            raise AdmissionRejected(model, "queue_full", lane.retry_after())
+
+        lane.waiting += 1
+        try:
+            while lane.active >= lane.max_concurrency:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    lane.timeouts += 1
+                    raise AdmissionRejected(model, "queue_timeout", lane.retry_after())
+                self._cond.wait(remaining)
+        finally:
+            lane.waiting -= 1
+        lane.active += 1
+
+    def acquire(self, model: str) -> AdmissionTicket:
+        """
+        取得模型和全局的并发名额
+
+        Args:
+            model: 模型ID
+
+        Returns:
+            名额，使用完后调用release或在with语句中使用
+
+        Raises:
+            AdmissionRejected: 队列已满或排队超时
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            lane = self._lane_of(model)
+            self._wait_for(lane, model, deadline)
+            try:
+                # 先取得模型名额再排全局队列，排队中的慢模型请求不占用全局名额
+                self._wait_for(self._global, model, deadline)
+            except AdmissionRejected:
+                lane.active -= 1
+                self._cond.notify_all()
+                raise
+            lane.admitted += 1
+            self._global.admitted += 1
+        return AdmissionTicket(self, lane)
+
+    def try_acquire(self, model: str) -> Optional[AdmissionTicket]:
+        """
+        不排队地取得模型和全局的并发名额，用于对冲等可以放弃的请求
+
+        Args:
+            model: 模型ID
+
+        Returns:
+            名额，模型或全局没有空闲名额、或已有请求在排队时返回None
+        """
+        with self._cond:
+            lane = self._lane_of(model)
+            for item in (lane, self._global):
+                # 有请求在排队时不插队，名额留给排队的请求
+                if item.active >= item.max_concurrency or item.waiting > 0:
+                    return None
+            for item in (lane, self._global):
+                item.active += 1
+                item.admitted += 1
+        return AdmissionTicket(self, lane)
+
+    async def acquire_async(self, model: str) -> AdmissionTicket:
+        """
+        协程版acquire：有空闲名额时直接取得，需要排队时在默认线程池中等待，不阻塞事件循环
+
+        Args:
+            model: 模型ID
+
+        Returns:
+            名额
+
+        Raises:
+            AdmissionRejected: 队列已满或排队超时
+        """
+        ticket = self.try_acquire(model)
+        if ticket is not None:
+            return ticket
+        waiting = asyncio.get_running_loop().run_in_executor(None, self.acquire, model)
+        try:
+            return await asyncio.shield(waiting)
+        except asyncio.CancelledError:
+            # 排队的线程无法中断，取得名额后立即释放
+            waiting.add_done_callback(
+                lambda future: future.cancelled() or future.exception() is not None or future.result().release())
+            raise
+
+    def _release(self, lane: _Lane, hold: float):
+        with self._cond:
+            for item in (lane, self._global):
+                item.active -= 1
+                item.avg_hold = 0.8 * item.avg_hold + 0.2 * hold
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取各模型和全局的队列深度"""
+        with self._cond:
+            return {
+                "global": self._global.snapshot(),
+                "models": {model: lane.snapshot() for model, lane in self._models.items()},
+                "queue_timeout": self.queue_timeout
+            }
@@ -8,21 +8,51 @@
 
 import os
 import json
+import time
 import socket
 import getpass
 import sys
-from flask import Flask, request, jsonify
+# 最先导入启动跟踪器，之后的导入都计入启动耗时
+from api.startup import STARTUP
+from flask import Flask, Response, request, jsonify, g, stream_with_context
 from flask_cors import CORS
 from api.meituan_agent import MeituanAIAgent
 from api.conversation_manager import ConversationManager
-from api.models_config import SUPPORTED_MODELS, DEFAULT_MODEL, get_models_by_category, is_model_supported, get_model_info
+from api.session_store import SessionStore
+from api.context_manager import ContextManager
+from api.response_cache import ResponseCache
+from api.batch import run_batch
+from api.admission import AdmissionController, AdmissionRejected
+from api.hedging import Hedger
+from api.resilience import CircuitBreakers, RetryPolicy
+from api.router import FAILOVER_REASONS, ModelRouter, attempt_info, outcome_of
+from api import metrics
+from api.logger import get_logger, lazy, setup_logging, shutdown_logging
+from api.models_config import (SUPPORTED_MODELS, DEFAULT_MODEL, DEFAULT_IMAGE_MODEL, get_models_by_category,
+                               is_model_supported, is_image_model_supported, get_model_info)
 from api import config
-from mcp import MCPManager
+
+STARTUP.mark("imports")
+
+# 日志由后台线程写出，请求线程只负责入队
+logging_settings = config.get_logging_settings()
+setup_logging(
+    level=logging_settings["level"],
+    output_format=logging_settings["format"],
+    queue_size=logging_settings["queue_size"],
+    sample_rates=logging_settings["sample_rates"]
+)
+logger = get_logger("api_server")
+STARTUP.mark("logging")
+
+# 会话ID的请求头和Cookie名称
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "session_id"
 
 # 初始化Flask应用
 app = Flask(__name__)
 # 允许跨域请求，方便本地开发
-CORS(app)
+CORS(app, expose_headers=[SESSION_HEADER])
 
 # 检查配置
 if not config.is_configured():
@@ -47,15 +77,164 @@ if not config.is_configured():
     config.configure(tenant_id, app_id)
     print("配置已保存到config.json文件")
 
-# 创建AI Agent实例
-agent = MeituanAIAgent()
+STARTUP.mark("config")
+
+# 创建响应缓存（可选），完全相同的请求直接返回缓存的回复
+cache_settings = config.get_response_cache_settings()
+response_cache = None
+if cache_settings["enabled"]:
+    response_cache = ResponseCache(
+        max_entries=cache_settings["max_entries"],
+        ttl=cache_settings["ttl"],
+        disk_path=cache_settings["disk_path"]
+    )
+
+# 创建语义缓存（可选），措辞略有不同的问题也可以命中
+semantic_settings = config.get_semantic_cache_settings()
+semantic_cache = None
+if semantic_settings["enabled"]:
+    from api.semantic_cache import SemanticCache
+    semantic_cache = SemanticCache(
+        max_entries=semantic_settings["max_entries"],
+        threshold=semantic_settings["threshold"],
+        ttl=semantic_settings["ttl"]
+    )
+
+# 按模型和全局限制同时进行的上游请求数，队列已满或排队超时时返回429
+admission_settings = config.get_admission_settings()
+admission = AdmissionController(
+    max_concurrency=admission_settings["max_concurrency"],
+    max_queue=admission_settings["max_queue"],
+    queue_timeout=admission_settings["queue_timeout"],
+    model_concurrency=admission_settings["model_concurrency"],
+    model_queue=admission_settings["model_queue"],
+    models=admission_settings["models"]
+)
+
+# 上游请求超过近期延迟的分位数仍未返回时发送备份请求，对冲请求的比例受预算和准入名额限制
+hedging_settings = config.get_hedging_settings()
+hedger = None
+if hedging_settings["enabled"]:
+    hedger = Hedger(
+        percentile=hedging_settings["percentile"],
+        min_samples=hedging_settings["min_samples"],
+        window=hedging_settings["window"],
+        budget_ratio=hedging_settings["budget_ratio"],
+        burst=hedging_settings["burst"],
+        backup_models=hedging_settings["backup_models"],
+        admission=admission
+    )
+
+# 连接失败和429、502、503等可重试的失败按退避策略重试，连续失败的模型由熔断器快速返回提示回复
+retry_settings = config.get_retry_settings()
+retry_policy = RetryPolicy(
+    max_attempts=retry_settings["max_attempts"],
+    base_delay=retry_settings["base_delay"],
+    max_delay=retry_settings["max_delay"],
+    max_retry_after=retry_settings["max_retry_after"],
+    retry_statuses=retry_settings["retry_statuses"]
+)
+breaker_settings = config.get_circuit_breaker_settings()
+breakers = None
+if breaker_settings["enabled"]:
+    breakers = CircuitBreakers(
+        failure_threshold=breaker_settings["failure_threshold"],
+        recovery_timeout=breaker_settings["recovery_timeout"],
+        half_open_max_calls=breaker_settings["half_open_max_calls"]
+    )
+
+# 创建AI Agent实例，agent_mode为async时上游请求在共享的事件循环和连接池中执行
+agent_options = {
+    "cache": response_cache,
+    "coalesce": config.get_coalesce_requests(),
+    "hedger": hedger,
+    "retry_policy": retry_policy,
+    "breakers": breakers
+}
+if config.get_agent_mode() == "async":
+    from api.async_meituan_agent import AsyncAgentRunner
+    agent = AsyncAgentRunner(**agent_options)
+else:
+    agent = MeituanAIAgent(check_health=False, **agent_options)
+STARTUP.mark("agent")
+
+# 上游健康检查和MCP管理器的启动（需要导入aiohttp）默认在后台执行，不阻塞工作进程开始接收请求
+startup_settings = config.get_startup_settings()
+require_upstream = startup_settings["require_upstream"]
+STARTUP.run(
+    "upstream",
+    agent.health_check,
+    required=require_upstream,
+    background=startup_settings["background"],
+    retry_interval=startup_settings["health_check_interval"] if require_upstream else None
+)
+
+# MCP管理器在后台启动完成前为None，通过get_mcp_manager()获取
+mcp_manager = None
+# MCP接口等待MCP管理器启动的最长时间（秒）
+MCP_STARTUP_WAIT = 10
+
+def _start_mcp_manager():
+    """创建并启动MCP管理器"""
+    global mcp_manager
+    from mcp import MCPManager
+    manager = MCPManager(str(config.CONFIG_FILE))
+    manager.start()
+    mcp_manager = manager
+    return manager
+
+def get_mcp_manager():
+    """
+    获取MCP管理器，后台启动尚未完成时最多等待MCP_STARTUP_WAIT秒
 
-# 创建对话管理器
-conversation_manager = ConversationManager()
+    Returns:
+        MCP管理器，启动失败或等待超时时返回None
+    """
+    if mcp_manager is None:
+        STARTUP.wait("mcp", MCP_STARTUP_WAIT)
+    return mcp_manager
+
+# 聊天不依赖MCP，MCP启动失败时服务器仍然就绪，MCP接口返回503
+STARTUP.run("mcp", _start_mcp_manager, required=False, background=startup_settings["background"])
+
+# 响应缓存的磁盘层在写入时定期清理过期条目，启动时先清理一次上次运行留下的
+if response_cache is not None and response_cache.disk_path:
+    STARTUP.run("response_cache_purge", response_cache.purge_expired, required=False,
+                background=startup_settings["background"])
+
+def _on_config_change(previous, current):
+    """配置文件变化时替换上游地址、凭据和超时，进行中的请求不受影响；MCP管理器自行同步连接"""
+    if previous is not None:
+        agent.reload_config()
+
+# 监视配置文件，修改后不需要重启工作进程
+config.get_config_store().subscribe(_on_config_change)
+config_reload_settings = config.get_config_reload_settings()
+config_watcher = None
+if config_reload_settings["enabled"]:
+    config_watcher = config.ConfigWatcher(config.get_config_store(), interval=config_reload_settings["interval"])
+    config_watcher.start()
+
+# 对话列表分页的默认页大小和最大页大小
+CONVERSATION_PAGE_SIZE = 50
+MAX_CONVERSATION_PAGE_SIZE = 500
+# 对话搜索默认和最多返回的结果数
+SEARCH_RESULT_LIMIT = 20
+MAX_SEARCH_RESULT_LIMIT = 100
 
-# 创建MCP管理器
-mcp_manager = MCPManager()
-mcp_manager.start()
+# 创建对话管理器
+conversation_settings = config.get_conversation_settings()
+conversation_manager = ConversationManager(
+    save_dir=conversation_settings["dir"],
+    backend=conversation_settings["backend"],
+    sqlite_path=conversation_settings["sqlite_path"],
+    fsync_interval=conversation_settings["fsync_interval"],
+    compact_ratio=conversation_settings["compact_ratio"],
+    autosave=conversation_settings["autosave"],
+    autosave_interval=conversation_settings["autosave_interval"],
+    autosave_batch=conversation_settings["autosave_batch"],
+    search=conversation_settings["search"]
+)
 
 # 预定义角色列表
 predefined_roles = {
@@ -75,30 +254,151 @@ try:
                 if role_name not in predefined_roles or role_name not in ["assistant", "programmer", "creative"]:
                     predefined_roles[role_name] = role_prompt
 except Exception as e:
-    print(f"加载自定义角色失败: {e}")
+    logger.error("roles.load", "加载自定义角色失败: %s", e)
+
+# 按会话ID存储消息历史和当前角色
+session_settings = config.get_session_settings()
+session_store = SessionStore(
+    max_sessions=session_settings["max_sessions"],
+    idle_ttl=session_settings["idle_ttl"],
+    max_memory_bytes=int(session_settings["max_memory_mb"] * 1024 * 1024)
+)
+
+# 按模型的上下文长度裁剪发送给模型的对话历史
+context_settings = config.get_context_settings()
+context_manager = ContextManager(
+    fraction=context_settings["fraction"],
+    reserve_tokens=context_settings["reserve_tokens"]
+)
+# tiktoken首次加载可能需要下载词表，在启动任务中加载，加载完成前按估算的token数裁剪
+STARTUP.run("tokenizer", context_manager.counter.load, required=False, background=startup_settings["background"])
+
+# 请求指定路由组时，按各模型的实时延迟、错误率和上下文长度选择模型，失败时切换到下一个
+router_settings = config.get_router_settings()
+router = ModelRouter(
+    context_manager,
+    groups=router_settings["groups"],
+    max_attempts=router_settings["max_attempts"],
+    ewma_alpha=router_settings["ewma_alpha"],
+    default_latency=router_settings["default_latency"],
+    error_penalty=router_settings["error_penalty"],
+    error_half_life=router_settings["error_half_life"]
+)
+STARTUP.mark("components")
+
+def _collect_cache_lookups():
+    lookups = {}
+    if response_cache is not None:
+        stats = response_cache.stats()
+        lookups[("exact", "hit")] = stats["hits"]
+        lookups[("exact", "miss")] = stats["misses"]
+    if semantic_cache is not None:
+        stats = semantic_cache.stats()
+        lookups[("semantic", "hit")] = stats["hits"]
+        lookups[("semantic", "miss")] = stats["misses"]
+    return lookups
+
+def _collect_coalesced():
+    if agent.single_flight is None:
+        return {}
+    stats = agent.single_flight.stats()
+    return {("chat",): stats["coalesced"], ("stream",): stats["stream_coalesced"]}
+
+def _collect_admission(field):
+    stats = admission.stats()
+    values = {("__global__",): stats["global"][field]}
+    values.update({(model,): lane[field] for model, lane in stats["models"].items()})
+    return values
+
+def _collect_admission_rejected():
+    values = {}
+    for model, lane in admission.stats()["models"].items():
+        values[(model, "queue_full")] = lane["rejected"]
+        values[(model, "queue_timeout")] = lane["timeouts"]
+    return values
+
+def _collect_circuit_state():
+    if agent.breakers is None:
+        return {}
+    states = {"closed": 0, "half_open": 1, "open": 2}
+    return {(model,): states[breaker["state"]] for model, breaker in agent.breakers.stats()["models"].items()}
+
+# 已由缓存、会话存储、准入控制和熔断器统计的值在导出指标时读取
+metrics.CACHE_LOOKUPS.set_function(_collect_cache_lookups)
+metrics.COALESCED_REQUESTS.set_function(_collect_coalesced)
+metrics.SESSIONS.set_function(lambda: {(): session_store.stats()["sessions"]})
+metrics.AUTOSAVE_PENDING.set_function(lambda: {(): conversation_manager.pending_count()})
+metrics.AUTOSAVED_CONVERSATIONS.set_function(lambda: {
+    ("ok",): conversation_manager.autosaved, ("error",): conversation_manager.autosave_errors})
+metrics.ADMISSION_ACTIVE.set_function(lambda: _collect_admission("active"))
+metrics.ADMISSION_WAITING.set_function(lambda: _collect_admission("waiting"))
+metrics.ADMISSION_REJECTED.set_function(_collect_admission_rejected)
+metrics.CIRCUIT_BREAKER_STATE.set_function(_collect_circuit_state)
+
+def _admission_rejected_response(error):
+    """将未准入的请求转换为429响应"""
+    logger.warning("admission.rejected", "拒绝请求", model=error.model, reason=error.reason,
+                   retry_after=error.retry_after)
+    response = jsonify({
+        "error": str(error),
+        "reason": error.reason,
+        "model": error.model,
+        "retry_after": error.retry_after
+    })
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
 
-# 存储当前会话的消息历史
-current_messages = [
-    {"role": "system", "content": predefined_roles["assistant"]}
-]
+def get_session():
+    """
+    获取当前请求对应的会话，会话ID来自请求头或Cookie，不存在时创建新会话
 
-# 当前角色
-current_role = "assistant"
+    Returns:
+        当前请求的会话
+    """
+    if "chat_session" not in g:
+        session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+        g.chat_session, _ = session_store.get_or_create(session_id, predefined_roles["assistant"])
+    return g.chat_session
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """记录请求数和处理耗时，路由使用URL规则而不是实际路径，避免标签数量无限增长"""
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=metrics.status_class(response.status_code))
+    started_at = g.get("request_started_at")
+    if started_at is not None:
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started_at, route=route, method=request.method)
+    return response
+
+@app.after_request
+def attach_session_id(response):
+    """在响应中返回会话ID，便于客户端在后续请求中携带"""
+    session = g.get("chat_session")
+    if session is not None:
+        response.headers[SESSION_HEADER] = session.session_id
+        if request.cookies.get(SESSION_COOKIE) != session.session_id:
+            response.set_cookie(SESSION_COOKIE, session.session_id, httponly=True, samesite="Lax")
+    return response
 
 @app.route('/api/role', methods=['GET'])
 def get_role():
     """获取当前角色和所有预定义角色"""
-    global current_role
+    session = get_session()
 
     return jsonify({
-        "current_role": current_role,
+        "current_role": session.role,
         "predefined_roles": {k: v.split('，')[0] for k, v in predefined_roles.items()}  # 只返回角色描述的第一部分作为简短描述
     })
 
 @app.route('/api/role', methods=['POST'])
 def set_role():
     """设置AI角色"""
-    global current_messages, current_role
+    session = get_session()
 
     data = request.json
     if data is None:
@@ -110,89 +410,148 @@ def set_role():
     # 如果是预定义角色
     if role_type in predefined_roles and not custom_prompt:
         system_content = predefined_roles[role_type]
-        current_role = role_type
+        role = role_type
     # 如果是自定义角色
     elif custom_prompt:
         system_content = custom_prompt
-        current_role = "custom"
+        role = "custom"
     # 默认回退到助手角色
     else:
         system_content = predefined_roles["assistant"]
-        current_role = "assistant"
+        role = "assistant"
 
     # 更新系统消息
-    if current_messages and current_messages[0]["role"] == "system":
-        current_messages[0]["content"] = system_content
-    else:
-        current_messages = [{"role": "system", "content": system_content}] + current_messages
+    with session.lock:
+        session.role = role
+        session.set_system_content(system_content)
 
     return jsonify({
         "success": True, 
-        "role": current_role,
+        "role": role,
         "system_content": system_content
     })
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """处理聊天请求"""
-    global current_messages
-
     # 获取请求数据
     data = request.json
     user_message = data.get('message', '')
     model = data.get('model', DEFAULT_MODEL)
     web_search = data.get('web_search', False)
-
-    # 验证模型是否支持
-    if not is_model_supported(model):
-        print(f"错误: 不支持的模型: {model}")
-        print(f"支持的模型列表: {list(SUPPORTED_MODELS.keys())}")
+    use_cache = data.get('cache', True)
+    route = data.get('route')
+
+    if route is not None:
+        # 路由模式下由服务端选择模型，忽略model参数
+        if not router.has_group(route):
+            return jsonify({"error": f"未知的路由组: {route}"}), 400
+    elif not is_model_supported(model):
+        # 验证模型是否支持
+        logger.warning("chat.bad_model", "不支持的模型: %s", model)
         return jsonify({"error": f"不支持的模型: {model}"}), 400
 
     if not user_message:
         return jsonify({"error": "消息不能为空"}), 400
 
+    session = get_session()
+    # 同一会话内的请求按顺序执行，不同会话之间互不阻塞
+    with session.lock:
+        return _chat_turn(session, user_message, model, use_cache, route)
+
+def _send_chat(messages, model, use_cache):
+    """
+    向指定模型发送一轮对话：按模型裁剪上下文，先查找语义缓存和响应缓存，都未命中时才在准入控制下请求模型
+
+    Returns:
+        (回复, 上下文统计)
+
+    Raises:
+        AdmissionRejected: 未取得模型的并发名额
+    """
+    request_messages, context_info = context_manager.fit(messages, model)
+    if context_info["trimmed_turns"]:
+        logger.info("context.trimmed", "上下文超出预算，已移出较早的对话", model=model,
+                    trimmed_turns=context_info["trimmed_turns"])
+    response = _lookup_cached_reply(model, request_messages, use_cache)
+    if response is None:
+        with admission.acquire(model):
+            response = agent.chat(request_messages, model=model, use_cache=use_cache)
+        if use_cache:
+            _store_semantic_cache(model, request_messages, response)
+    return response, context_info
+
+def _chat_turn(session, user_message, model, use_cache=True, route=None):
+    """在持有会话锁的情况下执行一轮对话，指定route时按路由组选择模型"""
     # 添加用户消息到历史
-    current_messages.append({"role": "user", "content": user_message})
+    session.append({"role": "user", "content": user_message})
 
     # 记录请求信息
-    print(f"处理聊天请求: 模型={model}, 消息长度={len(user_message)}")
-    
-    # 获取模型信息
-    model_info = get_model_info(model)
-    print(f"模型信息: {json.dumps(model_info, ensure_ascii=False)}")
+    logger.info("chat.request", "处理聊天请求", model=model, route=route, message_length=len(user_message))
 
     try:
         # 发送请求到AI
-        print(f"开始请求模型 {model}...")
-        response = agent.chat(current_messages, model=model)
-        print(f"模型 {model} 请求完成")
+        route_info = None
+        if route is None:
+            response, context_info = _send_chat(session.messages, model, use_cache)
+        else:
+            context_infos = {}
+
+            def send(candidate):
+                reply, context_infos[candidate] = _send_chat(session.messages, candidate, use_cache)
+                return reply
+
+            response, route_info = router.route(route, session.messages, send)
+            model = route_info["model"]
+            context_info = context_infos[model]
+            logger.info("chat.routed", "路由选择模型", route=route, model=model,
+                        attempts=lazy(lambda: json.dumps(route_info["attempts"], ensure_ascii=False)))
+
+        # 获取模型信息
+        model_info = get_model_info(model)
+        logger.debug("chat.model_info", "模型信息", model=model,
+                     info=lazy(lambda: json.dumps(model_info, ensure_ascii=False)))
 
         if "choices" in response and len(response["choices"]) > 0:
             ai_message = response["choices"][0]["message"]["content"]
-            print(f"AI回复长度: {len(ai_message)}")
+            logger.info("chat.response", "聊天请求完成", model=model, reply_length=len(ai_message),
+                        cache=response.get("cache"), fallback=bool(response.get("fallback")))
 
-            current_messages.append({"role": "assistant", "content": ai_message})
+            session.append({"role": "assistant", "content": ai_message})
+            session.model = model
+            session_store.enforce_limits()
+            conversation_manager.mark_dirty(session)
 
             return jsonify({
                 "message": ai_message,
-                "history": current_messages,
+                "history": session.messages,
                 "model": model,
-                "model_info": model_info
+                "model_info": model_info,
+                "trimmed_turns": context_info["trimmed_turns"],
+                "prompt_tokens": context_info["prompt_tokens"],
+                "cached": bool(response.get("cache")),
+                "coalesced": bool(response.get("coalesced")),
+                "cache": response.get("cache"),
+                "route": route_info
             })
         else:
-            print(f"错误: 无法解析AI回复: {json.dumps(response, ensure_ascii=False)}")
+            logger.error("chat.bad_response", "无法解析AI回复", model=model,
+                         response=lazy(lambda: json.dumps(response, ensure_ascii=False)))
             return jsonify({
                 "error": "无法解析AI回复", 
                 "response": response,
                 "model": model
             }), 500
 
+    except AdmissionRejected as e:
+        # 未发送到模型的请求不保留在历史中
+        session.pop()
+        return _admission_rejected_response(e)
+
     except Exception as e:
         import traceback
         error_traceback = traceback.format_exc()
-        print(f"错误: 请求处理失败: {str(e)}")
-        print(f"错误详情: {error_traceback}")
+        logger.exception("chat.error", "请求处理失败: %s", e, model=model)
         
         # 返回更详细的错误信息
         return jsonify({
@@ -201,12 +560,445 @@ def chat():
             "traceback": error_traceback.split("\n")[-5:] if error_traceback else None
         }), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    处理流式聊天请求，以Server-Sent Events返回模型的增量输出
+
+    事件类型:
+        delta: 回复正文增量，data为 {"content": "..."}
+        reasoning: 推理过程增量（如DeepSeek R1），data为 {"content": "..."}
+        done: 回复完成，data包含完整回复、历史和模型信息
+    """
+    # 获取请求数据
+    data = request.json or {}
+    user_message = data.get('message', '')
+    model = data.get('model', DEFAULT_MODEL)
+    use_cache = data.get('cache', True)
+    route = data.get('route')
+
+    if route is not None:
+        # 路由模式下由服务端选择模型，忽略model参数
+        if not router.has_group(route):
+            return jsonify({"error": f"未知的路由组: {route}"}), 400
+    elif not is_model_supported(model):
+        # 验证模型是否支持
+        logger.warning("chat.bad_model", "不支持的模型: %s", model)
+        return jsonify({"error": f"不支持的模型: {model}"}), 400
+
+    if not user_message:
+        return jsonify({"error": "消息不能为空"}), 400
+
+    session = get_session()
+    logger.info("chat.stream_request", "处理流式聊天请求", model=model, route=route, message_length=len(user_message))
+
+    user_entry = {"role": "user", "content": user_message}
+    candidates = router.candidates(route, session.messages + [user_entry]) if route is not None else [model]
+    attempts = []
+
+    # 已查找过缓存的模型：{模型: (裁剪后的消息, 缓存的回复)}，会话历史未变化时不再重复查找
+    prechecked = {}
+
+    def precheck(candidate):
+        request_messages, _ = context_manager.fit(session.messages + [user_entry], candidate)
+        cached = _lookup_cached_reply(candidate, request_messages, use_cache)
+        prechecked[candidate] = (request_messages, cached)
+        return cached is not None
+
+    # 第一个候选模型命中缓存时不占用名额；否则在开始流式响应之前取得名额，未准入时仍能返回429
+    if precheck(candidates[0]):
+        ticket, first_index = None, 0
+    else:
+        try:
+            ticket, first_index = _acquire_candidate(candidates, 0, attempts)
+        except AdmissionRejected as e:
+            return _admission_rejected_response(e)
+    # 当前持有的名额，切换模型时追加，命中缓存的模型为None
+    tickets = [ticket]
+
+    def release():
+        if tickets[-1] is not None:
+            tickets[-1].release()
+
+    def generate():
+        # 同一会话内的请求按顺序执行，锁在流结束或客户端断开时释放
+        with session.lock:
+            index = first_index
+            while True:
+                model = candidates[index]
+                request_messages, context_info = context_manager.fit(session.messages + [user_entry], model)
+                start = time.monotonic()
+
+                checked = prechecked.pop(model, None)
+                if checked is not None and checked[0] == request_messages:
+                    cached = checked[1]
+                else:
+                    cached = _lookup_cached_reply(model, request_messages, use_cache)
+                if cached is not None:
+                    choice = cached["choices"][0]
+                    events = [
+                        {"type": "delta", "content": choice["message"]["content"]},
+                        {"type": "done", "message": choice["message"]["content"],
+                         "finish_reason": choice.get("finish_reason"), "cache": cached["cache"]}
+                    ]
+                else:
+                    if tickets[-1] is None:
+                        # 检查后缓存条目过期或会话历史已变化，未命中缓存时再取得名额
+                        try:
+                            tickets[-1] = admission.acquire(model)
+                        except AdmissionRejected as e:
+                            yield _sse_event("error", {"error": str(e), "model": e.model,
+                                                       "retry_after": e.retry_after})
+                            return
+                    events = agent.chat_stream(request_messages, model=model, use_cache=use_cache)
+
+                forwarded = False
+                done = None
+                for event in events:
+                    if event["type"] != "done":
+                        forwarded = True
+                        yield _sse_event(event["type"], {"content": event["content"]})
+                    else:
+                        done = event
+                release()
+
+                if route is None:
+                    break
+                outcome = outcome_of(done)
+                representative = cached is None and not done.get("cache") and not done.get("coalesced")
+                router.observe(model, outcome, time.monotonic() - start if representative else None)
+                attempts.append(attempt_info(model, outcome, start))
+                # 已经向客户端发送了增量内容时不能再切换模型
+                if forwarded or outcome not in FAILOVER_REASONS:
+                    break
+                if index + 1 >= len(candidates):
+                    break
+                if precheck(candidates[index + 1]):
+                    tickets.append(None)
+                    index += 1
+                    continue
+                try:
+                    next_ticket, next_index = _acquire_candidate(candidates, index + 1, attempts)
+                except AdmissionRejected:
+                    break
+                if next_ticket is None:
+                    break
+                tickets.append(next_ticket)
+                index = next_index
+
+            # 只有完整收到回复后才写入历史，客户端中途断开时历史保持不变
+            ai_message = done["message"]
+            if cached is None and use_cache and not done.get("cache") and not done.get("fallback"):
+                completion = MeituanAIAgent._build_completion(ai_message, done.get("finish_reason"))
+                _store_semantic_cache(model, request_messages, completion)
+            session.append(user_entry)
+            session.append({"role": "assistant", "content": ai_message})
+            session.model = model
+            session_store.enforce_limits()
+            conversation_manager.mark_dirty(session)
+
+            yield _sse_event("done", {
+                "message": ai_message,
+                "finish_reason": done.get("finish_reason"),
+                "fallback": done.get("fallback", False),
+                "history": session.messages,
+                "model": model,
+                "model_info": get_model_info(model),
+                "trimmed_turns": context_info["trimmed_turns"],
+                "prompt_tokens": context_info["prompt_tokens"],
+                "cached": bool(done.get("cache")),
+                "coalesced": bool(done.get("coalesced")),
+                "cache": done.get("cache"),
+                "route": router.report(route, model, attempts) if route is not None else None
+            })
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 禁止反向代理缓冲，保证增量内容及时送达
+            "X-Accel-Buffering": "no"
+        }
+    )
+    # 客户端断开或生成器未开始执行时同样释放名额
+    response.call_on_close(release)
+    return response
+
+def _acquire_candidate(candidates, start, attempts):
+    """
+    从第start个候选模型开始依次尝试取得并发名额，未准入的模型记入attempts
+
+    Returns:
+        (名额, 候选模型的序号)，没有剩余的候选模型时返回 (None, None)
+
+    Raises:
+        AdmissionRejected: 剩余的候选模型都未准入
+    """
+    rejected = None
+    for index in range(start, len(candidates)):
+        attempt_start = time.monotonic()
+        try:
+            return admission.acquire(candidates[index]), index
+        except AdmissionRejected as e:
+            rejected = e
+            attempts.append(attempt_info(candidates[index], e.reason, attempt_start))
+    if rejected is not None:
+        raise rejected
+    return None, None
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """
+    批量对话：并发请求多组独立的对话，以NDJSON逐行返回每组的结果
+
+    请求体:
+        items: 请求列表，每项包含messages、model（可选）、route（可选，指定后按路由组选择模型）、
+               temperature（可选）和id（可选）
+        concurrency: 并发数（可选），不超过配置的max_concurrency
+    """
+    data = request.json or {}
+    items = data.get('items')
+    batch_settings = config.get_batch_settings()
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items必须是非空列表"}), 400
+    if len(items) > batch_settings["max_items"]:
+        return jsonify({"error": f"单次最多提交 {batch_settings['max_items']} 个请求"}), 400
+
+    try:
+        concurrency = int(data.get('concurrency', batch_settings["max_concurrency"]))
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency必须是整数"}), 400
+    concurrency = max(1, min(concurrency, batch_settings["max_concurrency"]))
+    use_cache = data.get('cache', True)
+
+    logger.info("chat.batch_request", "处理批量聊天请求", items=len(items), concurrency=concurrency)
+
+    def validate(item):
+        """检查请求项，有错误时返回错误结果"""
+        messages = item.get('messages')
+        model = item.get('model', DEFAULT_MODEL)
+        route = item.get('route')
+        if not isinstance(messages, list) or not messages:
+            return {"error": "messages必须是非空列表", "model": model}
+        if route is not None:
+            if not router.has_group(route):
+                return {"error": f"未知的路由组: {route}", "route": route}
+        elif not is_model_supported(model):
+            return {"error": f"不支持的模型: {model}", "model": model}
+        return None
+
+    def handle(item):
+        error = validate(item)
+        if error is not None:
+            return error
+        messages = item['messages']
+        model = item.get('model', DEFAULT_MODEL)
+        route = item.get('route')
+        context_infos = {}
+
+        def send(candidate):
+            request_messages, context_infos[candidate] = context_manager.fit(messages, candidate)
+            temperature = item.get('temperature', 0.7)
+            cached = agent.cached_chat(request_messages, temperature=temperature, model=candidate, use_cache=use_cache)
+            if cached is not None:
+                return cached
+            with admission.acquire(candidate):
+                return agent.chat(request_messages, temperature=temperature, model=candidate, use_cache=use_cache)
+
+        route_info = None
+        try:
+            if route is None:
+                response = send(model)
+            else:
+                response, route_info = router.route(route, messages, send)
+                model = route_info["model"]
+        except AdmissionRejected as e:
+            return {"error": str(e), "model": e.model, "retry_after": e.retry_after}
+        return batch_result(response, model, context_infos[model], route_info)
+
+    async def ahandle(item):
+        """协程版handle，在异步客户端的事件循环中执行，等待上游时不占用线程"""
+        error = validate(item)
+        if error is not None:
+            return error
+        messages = item['messages']
+        model = item.get('model', DEFAULT_MODEL)
+        route = item.get('route')
+        context_infos = {}
+
+        async def send(candidate):
+            request_messages, context_infos[candidate] = context_manager.fit(messages, candidate)
+            temperature = item.get('temperature', 0.7)
+            cached = agent.cached_chat(request_messages, temperature=temperature, model=candidate, use_cache=use_cache)
+            if cached is not None:
+                return cached
+            with await admission.acquire_async(candidate):
+                return await agent.agent.chat(request_messages, temperature=temperature,
+                                              model=candidate, use_cache=use_cache)
+
+        route_info = None
+        try:
+            if route is None:
+                response = await send(model)
+            else:
+                response, route_info = await router.aroute(route, messages, send)
+                model = route_info["model"]
+        except AdmissionRejected as e:
+            return {"error": str(e), "model": e.model, "retry_after": e.retry_after}
+        return batch_result(response, model, context_infos[model], route_info)
+
+    def batch_result(response, model, context_info, route_info):
+        if not response.get("choices"):
+            return {"error": "无法解析AI回复", "model": model, "response": response}
+
+        return {
+            "message": response["choices"][0]["message"]["content"],
+            "model": model,
+            "fallback": bool(response.get("fallback")),
+            "cached": bool(response.get("cache")),
+            "coalesced": bool(response.get("coalesced")),
+            "usage": response.get("usage"),
+            "trimmed_turns": context_info["trimmed_turns"],
+            "route": route_info
+        }
+
+    def generate():
+        start_time = time.time()
+        succeeded = failed = 0
+        if not isinstance(agent, MeituanAIAgent):
+            # 异步模式下整批在事件循环中并发执行，只占用当前请求线程
+            results = agent.run_batch(items, ahandle, concurrency)
+        else:
+            results = run_batch(items, handle, concurrency)
+        for result in results:
+            if "error" in result or result.get("fallback"):
+                failed += 1
+            else:
+                succeeded += 1
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+        yield json.dumps({
+            "summary": True,
+            "total": len(items),
+            "succeeded": succeeded,
+            "failed": failed,
+            "concurrency": concurrency,
+            "elapsed_ms": round((time.time() - start_time) * 1000, 1)
+        }, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _lookup_semantic_cache(model, messages, use_cache):
+    """查找语义缓存，命中时返回带有"cache": "semantic"标记的回复，否则返回None"""
+    if semantic_cache is None or not use_cache:
+        return None
+    hit = semantic_cache.lookup(model, messages)
+    if hit is None:
+        return None
+    response, similarity = hit
+    logger.info("cache.semantic_hit", "命中语义缓存", model=model, similarity=f"{similarity:.3f}")
+    return dict(response, cache="semantic", similarity=round(similarity, 4))
+
+def _lookup_cached_reply(model, messages, use_cache):
+    """依次查找语义缓存和响应缓存，命中的请求不发送到模型，不需要准入名额"""
+    response = _lookup_semantic_cache(model, messages, use_cache)
+    if response is None:
+        response = agent.cached_chat(messages, model=model, use_cache=use_cache)
+    return response
+
+def _store_semantic_cache(model, messages, response):
+    """将模型的新回复写入语义缓存，提示回复和缓存命中的回复不写入"""
+    if semantic_cache is None or response.get("fallback") or response.get("cache"):
+        return
+    if "choices" in response and response["choices"]:
+        semantic_cache.store(model, messages, response)
+
+def _sse_event(event, data):
+    """编码一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """获取响应缓存的命中统计"""
+    stats = {"enabled": False} if response_cache is None else dict(response_cache.stats(), enabled=True)
+    stats["semantic"] = {"enabled": False} if semantic_cache is None else dict(semantic_cache.stats(), enabled=True)
+    single_flight = agent.single_flight
+    stats["single_flight"] = {"enabled": False} if single_flight is None else dict(single_flight.stats(), enabled=True)
+    return jsonify(stats)
+
+@app.route('/api/router/stats', methods=['GET'])
+def get_router_stats():
+    """获取路由组和各模型的延迟、错误率统计"""
+    return jsonify(router.stats())
+
+@app.route('/api/hedging/stats', methods=['GET'])
+def get_hedging_stats():
+    """获取请求对冲的次数、备份请求获胜率和各模型的触发阈值"""
+    if agent.hedger is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(agent.hedger.stats(), enabled=True))
+
+@app.route('/api/circuit-breakers', methods=['GET'])
+def get_circuit_breakers():
+    """获取各模型熔断器的状态"""
+    if agent.breakers is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(agent.breakers.stats(), enabled=True))
+
+@app.route('/api/circuit-breakers/reset', methods=['POST'])
+def reset_circuit_breakers():
+    """手动关闭熔断器，请求体中的model为空时关闭所有模型的熔断器"""
+    if agent.breakers is None:
+        return jsonify({"error": "熔断器未启用"}), 400
+    model = (request.get_json(silent=True) or {}).get('model')
+    agent.breakers.reset(model)
+    logger.info("circuit.reset", "手动关闭熔断器", model=model or "all")
+    return jsonify(dict(agent.breakers.stats(), enabled=True))
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """以Prometheus文本格式导出监控指标"""
+    return Response(metrics.REGISTRY.expose(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/ready', methods=['GET'])
+def get_ready():
+    """就绪检查，所有必需的启动任务完成前返回503"""
+    status = STARTUP.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route('/api/admission/stats', methods=['GET'])
+def get_admission_stats():
+    """获取各模型和全局的并发数与排队深度"""
+    return jsonify(admission.stats())
+
+@app.route('/api/cache/clear', methods=['POST'])
+def clear_cache():
+    """清空响应缓存"""
+    if response_cache is None:
+        return jsonify({"error": "响应缓存未启用"}), 400
+    response_cache.clear()
+    return jsonify({"success": True})
+
+def _mcp_unavailable_response():
+    """MCP管理器尚未启动完成或启动失败时返回503"""
+    return jsonify({
+        "success": False,
+        "error": "MCP管理器尚未就绪",
+        "startup": STARTUP.status()["checks"].get("mcp")
+    }), 503
+
 # 添加MCP相关的API接口
 @app.route('/api/mcp/servers', methods=['GET'])
 def get_mcp_servers():
     """获取可用的MCP服务器列表"""
-    servers = mcp_manager.get_available_servers()
-    status = mcp_manager.get_connection_status()
+    manager = get_mcp_manager()
+    if manager is None:
+        return _mcp_unavailable_response()
+    servers = manager.get_available_servers()
+    status = manager.get_connection_status()
     
     result = []
     for server_id in servers:
@@ -222,32 +1014,41 @@ def get_mcp_servers():
 @app.route('/api/mcp/servers/<server_id>/connect', methods=['POST'])
 def connect_mcp_server(server_id):
     """连接到指定的MCP服务器"""
-    if not mcp_manager.is_server_available(server_id):
+    manager = get_mcp_manager()
+    if manager is None:
+        return _mcp_unavailable_response()
+    if not manager.is_server_available(server_id):
         return jsonify({
             "success": False,
             "error": f"MCP服务器不存在: {server_id}"
         }), 404
     
-    success = mcp_manager.connect_to_server(server_id)
+    success = manager.connect_to_server(server_id)
     
     return jsonify({
         "success": success,
-        "status": mcp_manager.get_connection_status(server_id).get(server_id, "unknown")
+        "status": manager.get_connection_status(server_id).get(server_id, "unknown")
     })
 
 @app.route('/api/mcp/servers/<server_id>/disconnect', methods=['POST'])
 def disconnect_mcp_server(server_id):
     """断开与指定MCP服务器的连接"""
-    success = mcp_manager.disconnect_from_server(server_id)
+    manager = get_mcp_manager()
+    if manager is None:
+        return _mcp_unavailable_response()
+    success = manager.disconnect_from_server(server_id)
     
     return jsonify({
         "success": success,
-        "status": mcp_manager.get_connection_status(server_id).get(server_id, "unknown")
+        "status": manager.get_connection_status(server_id).get(server_id, "unknown")
     })
 
 @app.route('/api/mcp/servers', methods=['POST'])
 def add_mcp_server():
     """添加MCP服务器配置"""
+    manager = get_mcp_manager()
+    if manager is None:
+        return _mcp_unavailable_response()
     data = request.json
     if not data:
         return jsonify({
@@ -264,7 +1065,7 @@ def add_mcp_server():
             "error": "服务器ID和配置不能为空"
         }), 400
     
-    success = mcp_manager.add_server(server_id, server_config)
+    success = manager.add_server(server_id, server_config)
     
     return jsonify({
         "success": success
@@ -273,7 +1074,10 @@ def add_mcp_server():
 @app.route('/api/mcp/servers/<server_id>', methods=['DELETE'])
 def remove_mcp_server(server_id):
     """移除MCP服务器配置"""
-    success = mcp_manager.remove_server(server_id)
+    manager = get_mcp_manager()
+    if manager is None:
+        return _mcp_unavailable_response()
+    success = manager.remove_server(server_id)
     
     return jsonify({
         "success": success
@@ -286,24 +1090,29 @@ def generate_image():
     data = request.json
     prompt = data.get('prompt', '')
     size = data.get('size', '1024x1024')
-    model = data.get('model', 'dall-e-3')
+    model = data.get('model', DEFAULT_IMAGE_MODEL)
     quality = data.get('quality', 'standard')
     style = data.get('style', 'vivid')
     n = data.get('n', 1)
 
     if not prompt:
         return jsonify({"error": "图像描述不能为空"}), 400
+    if not is_image_model_supported(model):
+        # 准入控制按模型创建名额，未知模型不能进入
+        logger.warning("image.bad_model", "不支持的图像生成模型: %s", model)
+        return jsonify({"error": f"不支持的模型: {model}"}), 400
 
     try:
         # 发送图像生成请求
-        response = agent.generate_image(
-            prompt=prompt,
-            model=model,
-            size=size,
-            quality=quality,
-            style=style,
-            n=n
-        )
+        with admission.acquire(model):
+            response = agent.generate_image(
+                prompt=prompt,
+                model=model,
+                size=size,
+                quality=quality,
+                style=style,
+                n=n
+            )
 
         # 检查是否成功
         if "data" in response and len(response["data"]) > 0:
@@ -320,29 +1129,85 @@ def generate_image():
         # 如果没有成功，返回错误信息
         return jsonify({"error": "图像生成失败", "response": response}), 500
 
+    except AdmissionRejected as e:
+        return _admission_rejected_response(e)
+
     except Exception as e:
         return jsonify({"error": f"图像生成请求处理失败: {str(e)}"}), 500
 
 @app.route('/api/conversations', methods=['GET'])
 def list_conversations():
-    """获取保存的对话列表"""
+    """
+    获取保存的对话列表
+
+    不带查询参数时返回完整的对话数组（兼容旧客户端）；带limit、cursor或筛选参数时分页返回
+    {"conversations": [...], "next_cursor": ...}
+    """
+    params = {key: value for key, value in request.args.items() if value != ""}
     try:
-        conversations = conversation_manager.list_conversations()
-        return jsonify(conversations)
+        if not params:
+            return jsonify(conversation_manager.list_conversations())
+
+        unknown = set(params) - {"limit", "cursor", "since", "until", "title_prefix", "model", "role"}
+        if unknown:
+            return jsonify({"error": f"不支持的查询参数: {', '.join(sorted(unknown))}"}), 400
+        try:
+            limit = int(params.get("limit", CONVERSATION_PAGE_SIZE))
+            since = int(params["since"]) if "since" in params else None
+            until = int(params["until"]) if "until" in params else None
+        except ValueError:
+            return jsonify({"error": "limit、since和until必须是整数"}), 400
+        if not 1 <= limit <= MAX_CONVERSATION_PAGE_SIZE:
+            return jsonify({"error": f"limit必须在1到{MAX_CONVERSATION_PAGE_SIZE}之间"}), 400
+
+        try:
+            conversations, next_cursor = conversation_manager.query_conversations(
+                limit, params.get("cursor"), since=since, until=until, title_prefix=params.get("title_prefix"),
+                model=params.get("model"), role=params.get("role"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"conversations": conversations, "next_cursor": next_cursor})
     except Exception as e:
         return jsonify({"error": f"获取对话列表失败: {str(e)}"}), 500
 
+@app.route('/api/conversations/search', methods=['GET'])
+def search_conversations():
+    """全文搜索已保存对话的标题和消息内容"""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "搜索词不能为空"}), 400
+    try:
+        limit = int(request.args.get("limit", SEARCH_RESULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit必须是整数"}), 400
+    if not 1 <= limit <= MAX_SEARCH_RESULT_LIMIT:
+        return jsonify({"error": f"limit必须在1到{MAX_SEARCH_RESULT_LIMIT}之间"}), 400
+
+    try:
+        results = conversation_manager.search_conversations(query, limit)
+        if results is None:
+            return jsonify({"error": "对话搜索不可用"}), 503
+        return jsonify({"query": query, "results": results})
+    except Exception as e:
+        return jsonify({"error": f"搜索对话失败: {str(e)}"}), 500
+
 @app.route('/api/conversations', methods=['POST'])
 def save_conversation():
     """保存当前对话"""
-    global current_messages
+    session = get_session()
 
     # 获取请求数据
     data = request.json
     title = data.get('title', None)
 
     try:
-        filepath = conversation_manager.save_conversation(current_messages, title)
+        with session.lock:
+            conversation_manager.sync_conversation_name(session)
+            messages = list(session.messages)
+            # journal后端继续保存到本会话上次保存或加载的对话，只写入变化的消息
+            filepath = conversation_manager.save_conversation(messages, title, name=session.conversation_name,
+                                                              role=session.role, model=session.model)
+            session.conversation_name = os.path.basename(filepath)
         return jsonify({"success": True, "filepath": filepath})
     except Exception as e:
         return jsonify({"error": f"保存对话失败: {str(e)}"}), 500
@@ -350,14 +1215,13 @@ def save_conversation():
 @app.route('/api/conversations/<path:filename>', methods=['GET'])
 def load_conversation(filename):
     """加载保存的对话"""
-    global current_messages, current_role
+    session = get_session()
 
     try:
         loaded_messages = conversation_manager.load_conversation(filename)
         if loaded_messages:
-            current_messages = loaded_messages
-            
             # 更新当前角色
+            role = session.role
             if loaded_messages and loaded_messages[0]["role"] == "system":
                 system_content = loaded_messages[0]["content"]
                 # 尝试根据系统消息内容匹配角色
@@ -369,15 +1233,21 @@ def load_conversation(filename):
                 
                 # 如果找到匹配的角色，更新当前角色
                 if matched_role:
-                    current_role = matched_role
+                    role = matched_role
                 else:
                     # 如果没有匹配的角色，设置为自定义角色
-                    current_role = "custom"
+                    role = "custom"
+
+            with session.lock:
+                session.reset(loaded_messages)
+                session.role = role
+                session.conversation_name = filename
+            session_store.enforce_limits()
             
             return jsonify({
                 "success": True, 
-                "messages": current_messages,
-                "current_role": current_role
+                "messages": loaded_messages,
+                "current_role": role
             })
         else:
             return jsonify({"error": "对话加载失败或为空"}), 404
@@ -396,17 +1266,35 @@ def delete_conversation(filename):
     except Exception as e:
         return jsonify({"error": f"删除对话失败: {str(e)}"}), 500
 
+@app.route('/api/conversations/reindex', methods=['POST'])
+def reindex_conversations():
+    """重新解析所有对话文件，重建对话列表索引和搜索索引"""
+    try:
+        stats = conversation_manager.rebuild_index()
+        if stats is None:
+            return jsonify({"error": "对话索引不可用"}), 503
+        return jsonify({"success": True, **stats, "search": conversation_manager.rebuild_search_index()})
+    except Exception as e:
+        return jsonify({"error": f"重建对话索引失败: {str(e)}"}), 500
+
 @app.route('/api/conversations/clear', methods=['POST'])
 def clear_conversation():
     """清除当前对话历史"""
-    global current_messages, current_role
-
-    # 完全清除对话历史，只保留系统消息
-    current_messages = [
-        {"role": "system", "content": predefined_roles[current_role]}
-    ]
+    session = get_session()
+
+    with session.lock:
+        # 完全清除对话历史，只保留系统消息；自定义角色沿用当前的系统消息
+        if session.role in predefined_roles:
+            system_content = predefined_roles[session.role]
+        elif session.messages and session.messages[0]["role"] == "system":
+            system_content = session.messages[0]["content"]
+        else:
+            system_content = predefined_roles["assistant"]
+        session.reset([{"role": "system", "content": system_content}])
+        session.conversation_name = None
+        messages = list(session.messages)
 
-    return jsonify({"success": True, "messages": current_messages})
+    return jsonify({"success": True, "messages": messages})
 
 @app.route('/api/role/save', methods=['POST'])
 def save_custom_role():
@@ -432,7 +1320,7 @@ def save_custom_role():
         with open(role_file, 'w', encoding='utf-8') as f:
             json.dump(predefined_roles, f, ensure_ascii=False, indent=2)
     except Exception as e:
-        print(f"保存角色文件失败: {e}")
+        logger.error("roles.save", "保存角色文件失败: %s", e)
 
     return jsonify({
         "success": True,
@@ -468,7 +1356,7 @@ def delete_custom_role():
         with open(role_file, 'w', encoding='utf-8') as f:
             json.dump(predefined_roles, f, ensure_ascii=False, indent=2)
     except Exception as e:
-        print(f"保存角色文件失败: {e}")
+        logger.error("roles.save", "保存角色文件失败: %s", e)
 
     return jsonify({
         "success": True,
@@ -488,6 +1376,29 @@ def get_models():
         "default_model": DEFAULT_MODEL
     })
 
+def shutdown():
+    """
+    释放服务器持有的后台资源：断开MCP连接、关闭上游连接池
+    由生产服务器在工作进程退出时调用
+    """
+    logger.info("server.shutdown", "正在关闭API服务器资源")
+    if config_watcher is not None:
+        config_watcher.stop()
+
+    if mcp_manager is not None:
+        try:
+            mcp_manager.stop()
+        except Exception as e:
+            logger.error("server.shutdown", "停止MCP管理器失败: %s", e)
+
+    if hasattr(agent, "stop"):
+        agent.stop()
+
+    conversation_manager.close()
+
+    # 最后写出队列中剩余的日志
+    shutdown_logging()
+
 def is_port_available(port):
     """
     检查端口是否可用
@@ -506,6 +1417,8 @@ def is_port_available(port):
     except socket.error:
         return False
 
+STARTUP.mark("routes")
+
 if __name__ == '__main__':
     import argparse
     import sys
@@ -526,6 +1439,11 @@ if __name__ == '__main__':
 
     if check_port_in_use(port):
         print(f"端口 {port} 已被占用")
+
+        # 非交互环境（如容器、进程管理器）中不能询问用户，直接退出
+        if not sys.stdin.isatty():
+            print("当前不是交互式终端，无法确认是否终止占用端口的进程，退出程序")
+            sys.exit(1)
         
         # 查找占用端口的进程
         for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
@@ -557,5 +1475,10 @@ if __name__ == '__main__':
     
     print(f"API服务器正在启动，端口: {port}")
 
-    # 启动服务器
-    app.run(debug=False, port=port)
+    STARTUP.log_summary()
+
+    # 启动服务器（开发服务器，生产环境请使用 python -m api.serve）
+    try:
+        app.run(debug=False, port=port, threaded=True)
+    finally:
+        shutdown()
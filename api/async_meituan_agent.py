@@ -0,0 +1,566 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+美团AI Agent异步客户端 - 基于asyncio和aiohttp
+上游请求在事件循环中等待，不占用线程，单个进程可以同时保持大量慢速模型请求
+"""
+
+import json
+import time
+import queue
+import asyncio
+import threading
+import aiohttp
+from typing import Dict, List, Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+from . import config
+from .meituan_agent import MeituanAIAgent, UpstreamSettings
+from .batch import arun_batch
+from .response_cache import ResponseCache
+from .single_flight import AsyncSingleFlight
+from .hedging import Hedger
+from .resilience import CircuitBreakers, RetryPolicy, parse_retry_after
+from .metrics import (UPSTREAM_REQUESTS, UPSTREAM_SECONDS, UPSTREAM_TTFT_SECONDS, UPSTREAM_IN_FLIGHT,
+                      UPSTREAM_RETRIES, FALLBACK_RESPONSES, record_usage, status_class)
+from .logger import get_logger
+
+logger = get_logger("async_meituan_agent")
+
+_CONNECT_TIMEOUT_ERRORS = getattr(aiohttp, "ConnectionTimeoutError", ())
+
+
+class AsyncMeituanAIAgent:
+    """美团AI Agent异步客户端 - 与MeituanAIAgent提供相同的chat/generate_image接口"""
+
+    def __init__(self, pool_settings: Optional[Dict[str, Any]] = None, cache: Optional[ResponseCache] = None,
+                 coalesce: bool = True, hedger: Optional[Hedger] = None,
+                 retry_policy: Optional[RetryPolicy] = None, breakers: Optional[CircuitBreakers] = None):
+        """
+        初始化异步AI Agent
+
+        Args:
+            pool_settings: 连接池配置，默认读取config.json中的http_pool字段
+            cache: 可选的响应缓存
+            coalesce: 是否合并同时进行的相同请求，只向上游发送一次
+            hedger: 可选的请求对冲策略，落败的请求会被取消
+            retry_policy: 可选的重试策略，默认不重试
+            breakers: 可选的按模型熔断器
+        """
+        self._pool_overrides = pool_settings or {}
+        self.pool_settings = config.get_http_pool_settings()
+        self.pool_settings.update(self._pool_overrides)
+
+        # 从配置文件获取API URL、凭据和超时设置，配置变化时由reload_config整体替换
+        self.upstream = self._load_upstream()
+
+        self.cache = cache
+        self.single_flight = AsyncSingleFlight() if coalesce else None
+        self.hedger = hedger
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+        self.breakers = breakers
+
+        # ClientSession绑定创建时的事件循环，首次请求时再创建
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        logger.info("agent.init", "初始化美团AI Agent异步客户端", pool=self.pool_settings)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话，连接在请求之间复用"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_settings["max_connections"],
+                limit_per_host=self.pool_settings["max_connections_per_host"],
+                keepalive_timeout=self.pool_settings["keepalive_timeout"],
+                ttl_dns_cache=300
+            )
+            # 区分连接超时和读取超时：慢模型可以长时间生成，但连接建立失败要尽快返回
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                connect=self.pool_settings["connect_timeout"],
+                sock_read=self.pool_settings["read_timeout"]
+            )
+            # 请求头随每个请求传入，凭据变化后新请求立即使用新的凭据
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    # 上游设置的读取和替换与MeituanAIAgent相同
+    tenant_id = MeituanAIAgent.tenant_id
+    app_id = MeituanAIAgent.app_id
+    base_url = MeituanAIAgent.base_url
+    openai_api_base = MeituanAIAgent.openai_api_base
+    timeout = MeituanAIAgent.timeout
+    headers = MeituanAIAgent.headers
+    reload_config = MeituanAIAgent.reload_config
+
+    def _load_upstream(self) -> UpstreamSettings:
+        """从配置文件读取上游设置，超时使用连接池配置中的读取和连接超时"""
+        api_urls = config.get_api_urls()
+        pool_settings = config.get_http_pool_settings()
+        pool_settings.update(self._pool_overrides)
+        return UpstreamSettings(config.get_tenant_id(), config.get_app_id(), api_urls.get("base_url"),
+                                api_urls.get("openai_api_base"), pool_settings["read_timeout"],
+                                pool_settings["connect_timeout"])
+
+    @staticmethod
+    def _client_timeout(upstream: UpstreamSettings) -> aiohttp.ClientTimeout:
+        """单个请求的超时设置"""
+        return aiohttp.ClientTimeout(total=None, connect=upstream.connect_timeout, sock_read=upstream.timeout)
+
+    async def close(self):
+        """关闭连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def health_check(self) -> bool:
+        """测试API连接"""
+        try:
+            upstream = self.upstream
+            async with self._get_session().get(f"{upstream.base_url}/health", headers=upstream.headers,
+                                               timeout=aiohttp.ClientTimeout(total=5)) as response:
+                return response.status == 200
+        except Exception as e:
+            logger.warning("agent.health_check", "API连接测试异常: %s", e)
+            return False
+
+    # 缓存键、合并键的计算、缓存查找和熔断器的检查与MeituanAIAgent相同
+    _lookup_cache_key = MeituanAIAgent._lookup_cache_key
+    cached_chat = MeituanAIAgent.cached_chat
+    _flight_key = MeituanAIAgent._flight_key
+    _check_circuit = MeituanAIAgent._check_circuit
+    _record_circuit = MeituanAIAgent._record_circuit
+
+    async def _post(self, upstream: UpstreamSettings, url: str, payload: Dict[str, Any], model: str,
+                    mode: str) -> aiohttp.ClientResponse:
+        """
+        发送POST请求，连接失败和可重试的状态码按重试策略退避后重试，重试时仍使用请求发起时的上游设置
+
+        Returns:
+            最后一次尝试的响应，调用方负责释放
+
+        Raises:
+            aiohttp.ClientError: 最后一次尝试连接失败
+            asyncio.TimeoutError: 请求超时
+        """
+        attempt = 0
+        timeout = self._client_timeout(upstream)
+        while True:
+            try:
+                response = await self._get_session().post(url, json=payload, headers=upstream.headers, timeout=timeout)
+            except aiohttp.ClientConnectionError as e:
+                # 读取超时不重试，连接超时与其他连接失败一样重试（aiohttp 3.10之前不区分两者，均不重试）
+                if isinstance(e, asyncio.TimeoutError) and not isinstance(e, _CONNECT_TIMEOUT_ERRORS):
+                    raise
+                delay = self.retry_policy.backoff(attempt)
+                if delay is None:
+                    raise
+                reason = "connect"
+            else:
+                if response.status not in self.retry_policy.retry_statuses:
+                    return response
+                delay = self.retry_policy.backoff(attempt, parse_retry_after(response.headers.get("Retry-After")))
+                if delay is None:
+                    return response
+                response.release()
+                reason = str(response.status)
+
+            UPSTREAM_RETRIES.inc(model=model, mode=mode, reason=reason)
+            logger.warning("upstream.retry", "请求失败，%.2f秒后重试", delay, model=model, attempt=attempt + 1,
+                           reason=reason)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, model: str = "gpt-3.5-turbo", use_cache: bool = True) -> Dict[str, Any]:
+        """
+        与AI进行对话 - 使用FRIDAY大模型平台的chat/completions接口
+
+        Args:
+            messages: 对话历史
+            temperature: 温度参数，控制随机性
+            model: 使用的模型，默认为gpt-3.5-turbo
+            use_cache: 是否使用响应缓存
+
+        Returns:
+            AI响应，请求失败时返回与MeituanAIAgent相同格式的提示回复
+        """
+        cache_key = self._lookup_cache_key(messages, temperature, model, use_cache)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return dict(cached, cache="hit")
+
+        async def request():
+            if self.hedger is None:
+                response = await self._request_chat(messages, temperature, model)
+            else:
+                response = await self.hedger.acall(model, lambda target: self._request_chat(messages, temperature, target))
+            if cache_key is not None and not response.get("fallback"):
+                self.cache.set(cache_key, response)
+            return response
+
+        flight_key = self._flight_key(messages, temperature, model, use_cache, cache_key)
+        if flight_key is None:
+            return await request()
+
+        response, coalesced = await self.single_flight.do(flight_key, request)
+        return dict(response, coalesced=True) if coalesced else response
+
+    async def _request_chat(self, messages: List[Dict[str, str]], temperature: float, model: str) -> Dict[str, Any]:
+        """向chat/completions接口发送请求"""
+        upstream = self.upstream
+        url = f"{upstream.openai_api_base}/chat/completions"
+
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature
+        }
+
+        circuit_open_message = self._check_circuit(model)
+        if circuit_open_message is not None:
+            return MeituanAIAgent._build_reply(circuit_open_message, "circuit_open")
+
+        start_time = time.time()
+        status = "error"
+        UPSTREAM_IN_FLIGHT.inc(model=model)
+
+        try:
+            async with await self._post(upstream, url, payload, model, "chat") as response:
+                status = status_class(response.status)
+                response.raise_for_status()
+                result = await response.json(content_type=None)
+            elapsed_time = time.time() - start_time
+            logger.info("upstream.response", "模型异步请求完成", model=model, status_code=response.status,
+                        elapsed=f"{elapsed_time:.2f}s")
+            record_usage(model, result.get("usage"))
+            return result
+        except asyncio.TimeoutError:
+            status = "timeout"
+            FALLBACK_RESPONSES.inc(model=model, reason=status)
+            logger.warning("upstream.timeout", "请求超时", model=model, timeout=upstream.timeout)
+            return MeituanAIAgent._build_reply(MeituanAIAgent._get_model_timeout_message(model), status)
+        except aiohttp.ClientError as e:
+            FALLBACK_RESPONSES.inc(model=model, reason=status)
+            elapsed_time = time.time() - start_time
+            logger.error("upstream.error", "请求失败，返回提示回复: %s", e, model=model, elapsed=f"{elapsed_time:.2f}s")
+            return MeituanAIAgent._build_reply(MeituanAIAgent._get_fallback_message(messages, model, e), status)
+        finally:
+            UPSTREAM_IN_FLIGHT.dec(model=model)
+            UPSTREAM_REQUESTS.inc(model=model, mode="chat", status=status)
+            UPSTREAM_SECONDS.observe(time.time() - start_time, model=model, mode="chat")
+            self._record_circuit(model, status)
+
+    async def chat_stream(self, messages: List[Dict[str, str]], temperature: float = 0.7, model: str = "gpt-3.5-turbo", use_cache: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式对话，事件格式与MeituanAIAgent.chat_stream相同
+
+        Args:
+            messages: 对话历史
+            temperature: 温度参数，控制随机性
+            model: 使用的模型，默认为gpt-3.5-turbo
+            use_cache: 是否使用响应缓存
+
+        Yields:
+            增量事件，最后一个事件的type为"done"
+        """
+        cache_key = self._lookup_cache_key(messages, temperature, model, use_cache)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                for event in MeituanAIAgent._replay_cached_stream(cached):
+                    yield event
+                return
+
+        async def request():
+            if self.hedger is None:
+                events = self._request_chat_stream(messages, temperature, model)
+            else:
+                events = self.hedger.astream(model, lambda target: self._request_chat_stream(messages, temperature, target))
+            async for event in events:
+                if event["type"] == "done" and cache_key is not None and not event.get("fallback"):
+                    self.cache.set(cache_key, MeituanAIAgent._build_completion(event["message"], event.get("finish_reason")))
+                yield event
+
+        flight_key = self._flight_key(messages, temperature, model, use_cache, cache_key)
+        if flight_key is None:
+            async for event in request():
+                yield event
+            return
+
+        async for event, coalesced in self.single_flight.stream(flight_key, request):
+            if coalesced and event["type"] == "done":
+                event = dict(event, coalesced=True)
+            yield event
+
+    async def _request_chat_stream(self, messages: List[Dict[str, str]], temperature: float, model: str) -> AsyncIterator[Dict[str, Any]]:
+        """以stream模式向chat/completions接口发送请求"""
+        upstream = self.upstream
+        url = f"{upstream.openai_api_base}/chat/completions"
+
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True
+        }
+
+        circuit_open_message = self._check_circuit(model)
+        if circuit_open_message is not None:
+            yield {"type": "done", "message": circuit_open_message, "finish_reason": "error", "fallback": True,
+                   "fallback_reason": "circuit_open"}
+            return
+
+        start_time = time.time()
+        first_chunk = True
+        content_parts = []
+        finish_reason = None
+        usage = None
+        status = "error"
+        UPSTREAM_IN_FLIGHT.inc(model=model)
+
+        try:
+            async with await self._post(upstream, url, payload, model, "stream") as response:
+                status = status_class(response.status)
+                response.raise_for_status()
+
+                async for line in response.content:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        break
+
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        continue
+
+                    if first_chunk:
+                        first_chunk = False
+                        UPSTREAM_TTFT_SECONDS.observe(time.time() - start_time, model=model)
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    for choice in chunk.get("choices") or []:
+                        delta = choice.get("delta") or {}
+                        if delta.get("reasoning_content"):
+                            yield {"type": "reasoning", "content": delta["reasoning_content"]}
+                        if delta.get("content"):
+                            content_parts.append(delta["content"])
+                            yield {"type": "delta", "content": delta["content"]}
+                        if choice.get("finish_reason"):
+                            finish_reason = choice["finish_reason"]
+
+            elapsed_time = time.time() - start_time
+            logger.info("upstream.response", "异步流式请求完成", model=model, elapsed=f"{elapsed_time:.2f}s")
+            record_usage(model, usage)
+            yield {"type": "done", "message": "".join(content_parts), "finish_reason": finish_reason, "usage": usage}
+        except asyncio.TimeoutError:
+            status = "timeout"
+            FALLBACK_RESPONSES.inc(model=model, reason=status)
+            logger.warning("upstream.timeout", "流式请求超时", model=model, timeout=upstream.timeout)
+            message = "".join(content_parts) or MeituanAIAgent._get_model_timeout_message(model)
+            yield {"type": "done", "message": message, "finish_reason": "timeout", "fallback": True,
+                   "fallback_reason": status}
+        except aiohttp.ClientError as e:
+            if status == "2xx":
+                # 返回响应头之后连接中断，熔断器应计为失败
+                status = "error"
+            FALLBACK_RESPONSES.inc(model=model, reason=status)
+            logger.error("upstream.error", "流式请求失败: %s", e, model=model)
+            message = "".join(content_parts) or MeituanAIAgent._get_fallback_message(messages, model, e)
+            yield {"type": "done", "message": message, "finish_reason": "error", "fallback": True,
+                   "fallback_reason": status}
+        finally:
+            UPSTREAM_IN_FLIGHT.dec(model=model)
+            UPSTREAM_REQUESTS.inc(model=model, mode="stream", status=status)
+            UPSTREAM_SECONDS.observe(time.time() - start_time, model=model, mode="stream")
+            self._record_circuit(model, status)
+
+    async def generate_image(self, prompt: str, size: str = "1024x1024", model: str = "dall-e-3", quality: str = "standard", style: str = "vivid", n: int = 1) -> Dict[str, Any]:
+        """
+        生成图像 - 使用FRIDAY大模型平台的images/generations接口
+
+        Args:
+            prompt: 图像描述
+            size: 图像尺寸，支持"1024x1024"、"1792x1024"或"1024x1792"
+            model: 使用的模型，目前只支持"dall-e-3"
+            quality: 图像质量，支持"standard"或"hd"
+            style: 图像风格，支持"vivid"(生动)或"natural"(自然)
+            n: 生成图像的数量，目前只支持1
+
+        Returns:
+            生成的图像信息，包含url和revised_prompt
+        """
+        upstream = self.upstream
+        url = f"{upstream.openai_api_base}/images/generations"
+
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "size": size,
+            "quality": quality,
+            "style": style,
+            "n": n
+        }
+
+        try:
+            async with self._get_session().post(url, json=payload, headers=upstream.headers,
+                                                timeout=self._client_timeout(upstream)) as response:
+                if response.status >= 400:
+                    error_details = {
+                        "error": f"图像生成失败: HTTP {response.status}",
+                        "error_type": "ClientResponseError",
+                        "url": url,
+                        "status_code": response.status
+                    }
+                    try:
+                        error_details["response"] = await response.json(content_type=None)
+                    except Exception:
+                        error_details["response_text"] = await response.text()
+                    error_details["message"] = "图像生成功能可能不可用或需要特殊权限，请联系管理员"
+                    return error_details
+                return await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error("image.error", "图像生成请求失败: %s", e)
+            return {
+                "error": f"图像生成失败: {str(e)}",
+                "error_type": type(e).__name__,
+                "url": url,
+                "message": "图像生成功能可能不可用或需要特殊权限，请联系管理员"
+            }
+
+
+class AsyncAgentRunner:
+    """
+    在后台线程的事件循环中运行AsyncMeituanAIAgent，供同步代码（如Flask视图）调用
+
+    所有线程共享同一个事件循环和连接池，接口与MeituanAIAgent保持一致。
+    调用方线程会阻塞等待协程完成，单个对话请求（包括流式响应的整个过程）仍占用一个请求线程，
+    因此同时进行的单个对话请求数仍受gunicorn线程数限制。批量请求通过run_batch在事件循环中并发执行，
+    整批只占用一个请求线程。
+    """
+
+    def __init__(self, agent: Optional[AsyncMeituanAIAgent] = None, cache: Optional[ResponseCache] = None,
+                 coalesce: bool = True, hedger: Optional[Hedger] = None,
+                 retry_policy: Optional[RetryPolicy] = None, breakers: Optional[CircuitBreakers] = None):
+        """
+        初始化并启动事件循环线程
+
+        Args:
+            agent: 异步客户端，默认新建一个
+            cache: 新建异步客户端时使用的响应缓存
+            coalesce: 新建异步客户端时是否合并同时进行的相同请求
+            hedger: 新建异步客户端时使用的请求对冲策略
+            retry_policy: 新建异步客户端时使用的重试策略
+            breakers: 新建异步客户端时使用的熔断器
+        """
+        self.agent = agent or AsyncMeituanAIAgent(cache=cache, coalesce=coalesce, hedger=hedger,
+                                                  retry_policy=retry_policy, breakers=breakers)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_event_loop, name="async-agent", daemon=True)
+        self.thread.start()
+
+    def _run_event_loop(self):
+        """在后台线程中运行事件循环"""
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """在事件循环中执行协程并等待结果，调用线程在协程完成前一直阻塞"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    @property
+    def cache(self) -> Optional[ResponseCache]:
+        return self.agent.cache
+
+    @property
+    def single_flight(self) -> Optional[AsyncSingleFlight]:
+        return self.agent.single_flight
+
+    @property
+    def hedger(self) -> Optional[Hedger]:
+        return self.agent.hedger
+
+    @property
+    def breakers(self) -> Optional[CircuitBreakers]:
+        return self.agent.breakers
+
+    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, model: str = "gpt-3.5-turbo", use_cache: bool = True) -> Dict[str, Any]:
+        """同步调用AsyncMeituanAIAgent.chat"""
+        return self.run(self.agent.chat(messages, temperature=temperature, model=model, use_cache=use_cache))
+
+    def cached_chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, model: str = "gpt-3.5-turbo",
+                    use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        """只查找响应缓存，在调用方线程中执行，不需要事件循环"""
+        return self.agent.cached_chat(messages, temperature=temperature, model=model, use_cache=use_cache)
+
+    def chat_stream(self, messages: List[Dict[str, str]], temperature: float = 0.7, model: str = "gpt-3.5-turbo", use_cache: bool = True) -> Iterator[Dict[str, Any]]:
+        """同步迭代AsyncMeituanAIAgent.chat_stream的事件"""
+        return self.iterate(self.agent.chat_stream(messages, temperature=temperature, model=model, use_cache=use_cache))
+
+    def run_batch(self, items: List[Dict[str, Any]], handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                  concurrency: int) -> Iterator[Dict[str, Any]]:
+        """
+        在事件循环中并发处理批量请求（见batch.arun_batch），进行中的请求不占用线程，只有调用方线程等待结果
+
+        Args:
+            items: 请求列表
+            handler: 处理单个请求的协程函数，在事件循环中执行
+            concurrency: 同时处理的最大请求数
+
+        Yields:
+            每个请求的结果，按完成顺序返回
+        """
+        return self.iterate(arun_batch(items, handler, concurrency))
+
+    def iterate(self, events: AsyncIterator[Any]) -> Iterator[Any]:
+        """在事件循环中读取异步迭代器，同步返回其中的元素；调用方提前停止迭代时取消读取"""
+        queued: "queue.Queue" = queue.Queue()
+        finished = object()
+
+        async def pump():
+            try:
+                async for event in events:
+                    queued.put(event)
+            finally:
+                queued.put(finished)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                event = queued.get()
+                if event is finished:
+                    break
+                yield event
+            future.result()
+        finally:
+            # 调用方提前停止迭代时取消上游请求
+            future.cancel()
+
+    def reload_config(self) -> bool:
+        """重新读取上游设置，只替换引用，不需要在事件循环中执行"""
+        return self.agent.reload_config()
+
+    def health_check(self) -> bool:
+        """同步调用AsyncMeituanAIAgent.health_check"""
+        return self.run(self.agent.health_check(), timeout=10)
+
+    def generate_image(self, prompt: str, size: str = "1024x1024", model: str = "dall-e-3", quality: str = "standard", style: str = "vivid", n: int = 1) -> Dict[str, Any]:
+        """同步调用AsyncMeituanAIAgent.generate_image"""
+        return self.run(self.agent.generate_image(prompt, size=size, model=model, quality=quality, style=style, n=n))
+
+    def stop(self):
+        """关闭连接池并停止事件循环"""
+        try:
+            self.run(self.agent.close(), timeout=5)
+        except Exception as e:
+            logger.error("agent.close", "关闭异步客户端失败: %s", e)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
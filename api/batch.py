@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+批量对话 - 以有界并发同时请求多组独立的对话，按完成顺序返回结果
+
+run_batch在线程池中处理，每个进行中的请求占用一个线程；arun_batch在事件循环中处理，
+进行中的请求只是协程，不占用线程，用于agent_mode为async时。
+"""
+
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List
+
+# 不是字典的请求项的结果
+INVALID_ITEM = {"error": "请求项必须是对象"}
+
+
+def _finish(index: int, item: Any, result: Dict[str, Any], submitted_at: float, started_at: float) -> Dict[str, Any]:
+    """补充结果的index、id和耗时"""
+    if isinstance(item, dict) and "id" in item:
+        result["id"] = item["id"]
+    result["index"] = index
+    result["queue_ms"] = round((started_at - submitted_at) * 1000, 1)
+    result["elapsed_ms"] = round((time.perf_counter() - started_at) * 1000, 1)
+    return result
+
+
+def run_batch(items: List[Dict[str, Any]], handler: Callable[[Dict[str, Any]], Dict[str, Any]],
+              concurrency: int) -> Iterator[Dict[str, Any]]:
+    """
+    并发处理批量请求
+
+    Args:
+        items: 请求列表，不是字典的项返回错误结果，不调用handler
+        handler: 处理单个请求的函数，返回结果字典；抛出的异常会被记录为该请求的错误
+        concurrency: 同时处理的最大请求数
+
+    Yields:
+        每个请求的结果，按完成顺序返回，包含index、queue_ms（排队时间）和elapsed_ms（处理时间）
+    """
+    submitted_at = time.perf_counter()
+
+    def run(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        started_at = time.perf_counter()
+        if not isinstance(item, dict):
+            result = dict(INVALID_ITEM)
+        else:
+            try:
+                result = handler(item)
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+        return _finish(index, item, result, submitted_at, started_at)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="chat-batch")
+    try:
+        futures = [executor.submit(run, index, item) for index, item in enumerate(items)]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # 调用方提前停止迭代（如客户端断开）时取消尚未开始的请求
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def arun_batch(items: List[Dict[str, Any]], handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                     concurrency: int) -> AsyncIterator[Dict[str, Any]]:
+    """
+    协程版run_batch：在当前事件循环中并发处理批量请求，并发数由信号量限制
+
+    Args:
+        items: 请求列表，不是字典的项返回错误结果，不调用handler
+        handler: 处理单个请求的协程函数；抛出的异常会被记录为该请求的错误
+        concurrency: 同时处理的最大请求数
+
+    Yields:
+        每个请求的结果，格式与run_batch相同
+    """
+    submitted_at = time.perf_counter()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            started_at = time.perf_counter()
+            if not isinstance(item, dict):
+                result = dict(INVALID_ITEM)
+            else:
+                try:
+                    result = await handler(item)
+                except Exception as e:
+                    result = {"error": f"{type(e).__name__}: {e}"}
+            return _finish(index, item, result, submitted_at, started_at)
+
+    tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        # 调用方提前停止迭代时取消尚未完成的请求
+        for task in tasks:
+            task.cancel()
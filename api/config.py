@@ -1,13 +1,32 @@
 """
 配置文件，用于存储FRIDAY大模型平台的租户ID、应用ID和API URL等隐私信息
+
+配置文件由ConfigStore解析一次后缓存在内存中，文件的修改时间或大小变化时才重新解析，
+各get_*函数读取缓存的配置，可以在请求路径上调用。
 """
 
 import os
+import copy
 import json
+import stat
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .logger import get_logger
+
+try:
+    import fcntl
+except ImportError:
+    # Windows上没有fcntl，只能保证同一进程内的写入互斥
+    fcntl = None
+
+logger = get_logger("config")
 
-# 配置文件路径
-CONFIG_FILE = Path(__file__).parent.parent / 'config.json'
+# 配置文件路径，可通过环境变量AI_AGENT_CONFIG指定其他位置
+CONFIG_FILE = Path(os.environ.get("AI_AGENT_CONFIG") or Path(__file__).parent.parent / 'config.json')
 
 # 默认配置
 DEFAULT_CONFIG = {
@@ -19,33 +38,540 @@ DEFAULT_CONFIG = {
     },
     "timeout": 120,
     "is_configured": False,
-    "mcpServers": {}
+    "mcpServers": {},
+    "sessions": {
+        "max_sessions": 10000,
+        "idle_ttl": 3600,
+        "max_memory_mb": 512
+    },
+    "context_window": {
+        "fraction": 0.8,
+        "reserve_tokens": 1024
+    },
+    "response_cache": {
+        "enabled": False,
+        "max_entries": 10000,
+        "ttl": 3600,
+        "disk_path": None
+    },
+    "semantic_cache": {
+        "enabled": False,
+        "max_entries": 10000,
+        "threshold": 0.9,
+        "ttl": 3600
+    },
+    "batch": {
+        "max_items": 1000,
+        "max_concurrency": 32
+    },
+    "admission": {
+        "max_concurrency": 64,
+        "max_queue": 256,
+        "queue_timeout": 30,
+        "model_concurrency": 16,
+        "model_queue": 64,
+        "models": {}
+    },
+    "router": {
+        "groups": {},
+        "max_attempts": 3,
+        "ewma_alpha": 0.3,
+        "default_latency": 5.0,
+        "error_penalty": 4.0,
+        "error_half_life": 300
+    },
+    "hedging": {
+        "enabled": False,
+        "percentile": 95,
+        "min_samples": 20,
+        "window": 200,
+        "budget_ratio": 0.05,
+        "burst": 10,
+        "backup_models": {}
+    },
+    "retry": {
+        "max_attempts": 3,
+        "base_delay": 0.5,
+        "max_delay": 8,
+        "max_retry_after": 30,
+        "retry_statuses": [429, 502, 503]
+    },
+    "circuit_breaker": {
+        "enabled": True,
+        "failure_threshold": 5,
+        "recovery_timeout": 30,
+        "half_open_max_calls": 1
+    },
+    "startup": {
+        "background": True,
+        "require_upstream": False,
+        "health_check_interval": 10
+    },
+    "config_reload": {
+        "enabled": True,
+        "interval": 2
+    },
+    "conversations": {
+        "backend": "json",
+        "dir": None,
+        "sqlite_path": None,
+        "fsync_interval": 1.0,
+        "compact_ratio": 1.0,
+        "autosave": False,
+        "autosave_interval": 5,
+        "autosave_batch": 64,
+        "search": True
+    },
+    "agent_mode": "sync",
+    "coalesce_requests": True,
+    "logging": {
+        "level": "INFO",
+        "format": "text",
+        "queue_size": 10000,
+        "sample_rates": {}
+    },
+    "http_pool": {
+        "max_connections": 512,
+        "max_connections_per_host": 256,
+        "keepalive_timeout": 30,
+        "connect_timeout": 10,
+        "read_timeout": 120
+    }
 }
 
+# 与默认值按字段合并的分段配置
+SECTIONS = ("sessions", "context_window", "response_cache", "semantic_cache", "batch", "admission", "router",
+            "hedging", "retry", "circuit_breaker", "startup", "config_reload", "conversations",
+            "logging", "http_pool")
+
+class ConfigSettings:
+    """
+    解析后的配置，按字段访问
+
+    每次配置文件变化时整体重建，之后只读。分段配置（sessions、router等）在构建时与默认值合并，
+    读取时只需一次字典查找和浅拷贝。
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Args:
+            config: 已补全顶层默认字段的配置
+        """
+        self.raw = config
+        self.tenant_id: str = config.get("tenant_id", "")
+        self.app_id: str = config.get("app_id", "")
+        self.api_urls: Dict[str, str] = config.get("api_urls", DEFAULT_CONFIG["api_urls"])
+        self.timeout: float = config.get("timeout", DEFAULT_CONFIG["timeout"])
+        self.is_configured: bool = config.get("is_configured", False)
+        self.mcp_servers: Dict[str, Dict[str, Any]] = config.get("mcpServers", {})
+        self.agent_mode: str = config.get("agent_mode", DEFAULT_CONFIG["agent_mode"])
+        self.coalesce_requests = bool(config.get("coalesce_requests", DEFAULT_CONFIG["coalesce_requests"]))
+
+        self._sections: Dict[str, Dict[str, Any]] = {}
+        for name in SECTIONS:
+            section = dict(DEFAULT_CONFIG[name])
+            section.update(config.get(name) or {})
+            self._sections[name] = section
+
+    def section(self, name: str) -> Dict[str, Any]:
+        """
+        获取与默认值合并后的分段配置
+
+        Args:
+            name: 分段名称，如router、hedging
+
+        Returns:
+            分段配置的副本，调用方可以修改
+        """
+        return dict(self._sections[name])
+
+class _WriteBatch:
+    """一组合并写入的配置修改"""
+
+    def __init__(self):
+        self.mutations: List[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = []
+        self.done = threading.Event()
+        # 写入失败时整批的错误，以及单个修改函数抛出的异常（按修改的序号）
+        self.error: Optional[BaseException] = None
+        self.mutation_errors: Dict[int, Exception] = {}
+
+class ConfigStore:
+    """
+    配置存储 - 配置文件只解析一次并缓存在内存中，文件的修改时间、大小或inode变化时才重新解析
+
+    读取时最多每check_interval秒检查一次文件状态，其余时候直接返回缓存的配置。
+    通过save和update写入的配置立即生效；其他进程或手动修改的配置在下一次检查时生效，
+    并通知subscribe注册的回调。
+
+    写入时持有配置文件旁的.lock文件的排他锁（fcntl.flock，多个工作进程之间互斥），
+    在锁内以文件的最新内容为基础应用修改，写入临时文件后用os.replace替换，读取方不会读到写了一半的文件。
+    同时到达的多个修改合并为一次写入。
+    """
+
+    def __init__(self, path: Path, check_interval: float = 1.0, batch_window: float = 0.01):
+        """
+        初始化配置存储
+
+        Args:
+            path: 配置文件路径
+            check_interval: 检查文件是否变化的最短间隔（秒），为0时每次读取都检查
+            batch_window: 写入前等待更多修改加入同一批的时间（秒），为0时只合并等待锁期间到达的修改
+        """
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.check_interval = check_interval
+        self.batch_window = batch_window
+        # 文件中的原始内容，写入时以此为基础，不把补全的默认字段写回文件
+        self._file_config: Dict[str, Any] = {}
+        self._settings: Optional[ConfigSettings] = None
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._checked_at = 0.0
+        self._subscribers: List[Callable[[Optional[ConfigSettings], ConfigSettings], None]] = []
+        self._lock = threading.RLock()
+        self._batch: Optional[_WriteBatch] = None
+        self._batch_lock = threading.Lock()
+        # 当前线程已持有文件锁，在self._lock内读写
+        self._file_locked = False
+        self.writes = 0
+        self.batched_mutations = 0
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        """文件的(修改时间, 大小, inode)，文件不存在时返回None"""
+        try:
+            file_stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        跨进程的排他锁，不支持fcntl的平台上只有进程内的self._lock，调用方需持有self._lock
+
+        已持有文件锁时直接返回：同一进程内对锁文件的两次open是不同的打开文件描述，第二次flock会一直阻塞
+        """
+        if fcntl is None or self._file_locked:
+            yield
+            return
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            self._file_locked = True
+            try:
+                yield
+            finally:
+                self._file_locked = False
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read(self, signature: Optional[Tuple[int, int, int]]) -> Optional[Dict[str, Any]]:
+        """读取并解析配置文件，调用方需持有self._lock。文件不存在时写入默认配置"""
+        if signature is None:
+            with self._file_lock():
+                # 其他进程可能已经创建了配置文件
+                if self._stat() is None:
+                    self._replace(copy.deepcopy(DEFAULT_CONFIG))
+                    return copy.deepcopy(DEFAULT_CONFIG)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error("config.load", "加载配置文件失败: %s", e, path=str(self.path))
+            return None
+
+    def _replace(self, config: Dict[str, Any]):
+        """
+        写入临时文件后原子替换配置文件，调用方需持有self._lock和文件锁
+
+        Raises:
+            OSError: 写入失败，原配置文件保持不变
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.path.parent), prefix=f".{self.path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(config, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            # 保留原文件的权限，mkstemp创建的文件默认只有所有者可读写
+            try:
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(self.path).st_mode))
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._fsync_dir()
+        self._signature = self._stat()
+        self.writes += 1
+
+    def _fsync_dir(self):
+        """同步目录项，确保替换后的文件名在断电后仍然有效"""
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        try:
+            dir_fd = os.open(str(self.path.parent), os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+    def _apply(self, file_config: Dict[str, Any]) -> Tuple[Optional[ConfigSettings], ConfigSettings]:
+        """替换缓存的配置，调用方需持有self._lock"""
+        config = dict(file_config)
+        # 确保配置包含所有必要的字段
+        for key, value in DEFAULT_CONFIG.items():
+            if key not in config:
+                config[key] = copy.deepcopy(value)
+        previous = self._settings
+        self._file_config = file_config
+        self._settings = ConfigSettings(config)
+        return previous, self._settings
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        文件的修改时间或大小变化时重新解析配置文件
+
+        Args:
+            force: 为True时不论文件是否变化都重新解析
+
+        Returns:
+            配置是否已重新加载
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._stat()
+            if not force and self._settings is not None and signature == self._signature:
+                return False
+            self._signature = signature
+            file_config = self._read(signature)
+            if file_config is None:
+                # 解析失败（如文件正在被写入）时保留之前的配置
+                if self._settings is not None:
+                    return False
+                file_config = copy.deepcopy(DEFAULT_CONFIG)
+            previous, current = self._apply(file_config)
+        logger.info("config.reload", "已加载配置文件", path=str(self.path))
+        self._notify(previous, current)
+        return True
+
+    @property
+    def settings(self) -> ConfigSettings:
+        """当前配置，距离上次检查超过check_interval秒时先检查文件是否变化"""
+        settings = self._settings
+        if settings is None or time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+            settings = self._settings
+        return settings
+
+    def get(self) -> Dict[str, Any]:
+        """当前配置（已补全默认字段）的副本"""
+        return copy.deepcopy(self.settings.raw)
+
+    def save(self, config: Dict[str, Any]):
+        """
+        保存配置文件并立即生效
+
+        Args:
+            config: 完整的配置
+        """
+        self.update(lambda current: config)
+
+    def update(self, mutate: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]):
+        """
+        读取-修改-写入配置文件，并发的修改不会互相覆盖。配置没有变化时不写入文件
+
+        同时到达的修改加入同一批，由第一个到达的线程按到达顺序依次应用后只写入一次，
+        其余线程等待这次写入完成后返回。
+
+        Args:
+            mutate: 接收文件中配置的副本，原地修改或返回新的配置
+
+        Raises:
+            OSError: 写入配置文件失败
+        """
+        with self._batch_lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _WriteBatch()
+            index = len(batch.mutations)
+            batch.mutations.append(mutate)
+
+        if not leader:
+            batch.done.wait()
+            error = batch.mutation_errors.get(index) or batch.error
+            if error is not None:
+                raise error
+            return
+
+        if self.batch_window > 0:
+            time.sleep(self.batch_window)
+        try:
+            with self._lock:
+                # 等待锁期间到达的修改也在这一批中，之后到达的修改开始新的一批
+                with self._batch_lock:
+                    self._batch = None
+                changed = self._commit(batch)
+        except BaseException as e:
+            batch.error = e
+            raise
+        finally:
+            batch.done.set()
+        if changed is not None:
+            self._notify(*changed)
+        if index in batch.mutation_errors:
+            raise batch.mutation_errors[index]
+
+    def _commit(self, batch: _WriteBatch) -> Optional[Tuple[Optional[ConfigSettings], ConfigSettings]]:
+        """
+        在文件锁内以文件的最新内容为基础应用一批修改并写入，调用方需持有self._lock
+
+        某个修改函数抛出异常时只跳过这一个修改，异常记录在batch.mutation_errors中
+        """
+        with self._file_lock():
+            # 其他进程可能在上次读取之后修改了文件
+            if self._settings is None or self._stat() != self._signature:
+                self.reload()
+            file_config = self._file_config
+            for index, mutate in enumerate(batch.mutations):
+                candidate = copy.deepcopy(file_config)
+                try:
+                    result = mutate(candidate)
+                except Exception as e:
+                    batch.mutation_errors[index] = e
+                    continue
+                file_config = candidate if result is None else result
+            if file_config == self._file_config:
+                return None
+            try:
+                self._replace(file_config)
+            except OSError as e:
+                logger.error("config.save", "保存配置文件失败: %s", e, path=str(self.path))
+                raise
+        self.batched_mutations += len(batch.mutations)
+        self._checked_at = time.monotonic()
+        return self._apply(copy.deepcopy(file_config))
+
+    def subscribe(self, callback: Callable[[Optional[ConfigSettings], ConfigSettings], None]) -> Callable[[], None]:
+        """
+        注册配置变化的回调
+
+        回调在检测到变化的线程中调用，参数为(变化前的配置, 变化后的配置)，首次加载时变化前的配置为None。
+
+        Args:
+            callback: 回调函数
+
+        Returns:
+            取消注册的函数
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _notify(self, previous: Optional[ConfigSettings], current: ConfigSettings):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(previous, current)
+            except Exception as e:
+                logger.error("config.notify", "配置变化回调失败: %s", e)
+
+class ConfigWatcher:
+    """
+    配置文件监视器 - 后台线程定期检查配置文件的修改时间和大小，变化时重新加载并通知订阅者
+
+    只使用os.stat轮询，不依赖inotify等平台相关的机制；每次检查只有一次系统调用。
+    """
+
+    def __init__(self, store: ConfigStore, interval: float = 2.0):
+        """
+        Args:
+            store: 配置存储
+            interval: 检查间隔（秒）
+        """
+        self.store = store
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动后台检查线程"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+        logger.info("config.watch", "开始监视配置文件", path=str(self.store.path), interval=self.interval)
+
+    def stop(self):
+        """停止后台检查线程"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.store.reload()
+            except Exception as e:
+                logger.error("config.watch", "检查配置文件失败: %s", e)
+
+_stores: Dict[Path, ConfigStore] = {}
+_stores_lock = threading.Lock()
+# CONFIG_FILE对应的存储，省去每次读取配置时解析路径
+_default_store: Optional[ConfigStore] = None
+
+def get_config_store(path=None):
+    """
+    获取配置文件对应的配置存储，同一个文件在进程内共用一个存储
+
+    Args:
+        path: 配置文件路径，默认为CONFIG_FILE
+
+    Returns:
+        ConfigStore: 配置存储
+    """
+    global _default_store
+    if path is None and _default_store is not None:
+        return _default_store
+    key = Path(path or CONFIG_FILE).resolve()
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ConfigStore(key)
+        if path is None:
+            _default_store = store
+    return store
+
+def get_settings():
+    """
+    获取当前配置
+
+    Returns:
+        ConfigSettings: 按字段访问的配置，只读
+    """
+    return get_config_store().settings
+
 def load_config():
     """
     加载配置文件
     
     Returns:
-        dict: 配置信息
+        dict: 配置信息的副本，修改后可以通过save_config保存
     """
-    if not CONFIG_FILE.exists():
-        save_config(DEFAULT_CONFIG)
-        return DEFAULT_CONFIG
-    
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        
-        # 确保配置文件包含所有必要的字段
-        for key, value in DEFAULT_CONFIG.items():
-            if key not in config:
-                config[key] = value
-                
-        return config
-    except Exception as e:
-        print(f"加载配置文件失败: {e}")
-        return DEFAULT_CONFIG
+    return get_config_store().get()
 
 def save_config(config):
     """
@@ -54,11 +580,14 @@ def save_config(config):
     Args:
         config (dict): 配置信息
     """
+    _update_config(lambda current: config)
+
+def _update_config(mutate):
+    """修改并保存配置文件，写入失败时原配置文件保持不变，错误已在ConfigStore中记录"""
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"保存配置文件失败: {e}")
+        get_config_store().update(mutate)
+    except OSError:
+        pass
 
 def is_configured():
     """
@@ -67,8 +596,7 @@ def is_configured():
     Returns:
         bool: 是否已配置
     """
-    config = load_config()
-    return config.get("is_configured", False)
+    return get_settings().is_configured
 
 def get_tenant_id():
     """
@@ -77,8 +605,7 @@ def get_tenant_id():
     Returns:
         str: 租户ID
     """
-    config = load_config()
-    return config.get("tenant_id", "")
+    return get_settings().tenant_id
 
 def get_app_id():
     """
@@ -87,8 +614,7 @@ def get_app_id():
     Returns:
         str: 应用ID
     """
-    config = load_config()
-    return config.get("app_id", "")
+    return get_settings().app_id
 
 def get_api_urls():
     """
@@ -97,8 +623,7 @@ def get_api_urls():
     Returns:
         dict: API URL配置
     """
-    config = load_config()
-    return config.get("api_urls", DEFAULT_CONFIG["api_urls"])
+    return dict(get_settings().api_urls)
 
 def get_timeout():
     """
@@ -107,8 +632,7 @@ def get_timeout():
     Returns:
         int: 超时时间（秒）
     """
-    config = load_config()
-    return config.get("timeout", DEFAULT_CONFIG["timeout"])
+    return get_settings().timeout
 
 def get_mcp_servers():
     """
@@ -117,8 +641,172 @@ def get_mcp_servers():
     Returns:
         dict: MCP服务器配置
     """
-    config = load_config()
-    return config.get("mcpServers", {})
+    return copy.deepcopy(get_settings().mcp_servers)
+
+def get_session_settings():
+    """
+    获取会话存储配置
+    
+    Returns:
+        dict: 会话存储配置，包含max_sessions、idle_ttl和max_memory_mb
+    """
+    return get_settings().section("sessions")
+
+def get_context_settings():
+    """
+    获取上下文窗口配置
+    
+    Returns:
+        dict: 上下文窗口配置，fraction为对话历史最多占用模型上下文窗口的比例，reserve_tokens为回复预留的token数
+    """
+    return get_settings().section("context_window")
+
+def get_response_cache_settings():
+    """
+    获取响应缓存配置
+    
+    Returns:
+        dict: 响应缓存配置，包含enabled、max_entries、ttl和disk_path（为空时不启用磁盘缓存）
+    """
+    return get_settings().section("response_cache")
+
+def get_semantic_cache_settings():
+    """
+    获取语义缓存配置
+    
+    Returns:
+        dict: 语义缓存配置，包含enabled、max_entries、threshold（最低余弦相似度）和ttl
+    """
+    return get_settings().section("semantic_cache")
+
+def get_batch_settings():
+    """
+    获取批量对话配置
+    
+    Returns:
+        dict: 批量对话配置，包含max_items（单次最多请求数）和max_concurrency（最大并发数）
+    """
+    return get_settings().section("batch")
+
+def get_admission_settings():
+    """
+    获取准入控制配置
+    
+    Returns:
+        dict: 准入控制配置，包含全局的max_concurrency、max_queue，排队超时queue_timeout，
+              每个模型默认的model_concurrency、model_queue，以及按模型覆盖的models
+    """
+    return get_settings().section("admission")
+
+def get_router_settings():
+    """
+    获取模型路由配置
+    
+    Returns:
+        dict: 模型路由配置，包含自定义路由组groups、单次请求最多尝试的模型数max_attempts、
+              延迟和错误率的平滑系数ewma_alpha、未观测模型的预估延迟default_latency（秒）、
+              错误率惩罚系数error_penalty和错误率衰减半衰期error_half_life（秒）
+    """
+    return get_settings().section("router")
+
+def get_hedging_settings():
+    """
+    获取请求对冲配置
+    
+    Returns:
+        dict: 请求对冲配置，包含是否启用enabled、触发对冲的延迟分位数percentile、开始对冲前需要的样本数min_samples、
+              保留的样本数window、对冲请求的比例上限budget_ratio、最多积累的对冲令牌数burst和备用模型backup_models
+    """
+    return get_settings().section("hedging")
+
+def get_retry_settings():
+    """
+    获取上游请求的重试配置
+    
+    Returns:
+        dict: 重试配置，包含最多尝试次数max_attempts（含第一次）、退避的初始上限base_delay和最大值max_delay（秒）、
+              可接受的最长Retry-After等待max_retry_after（秒）和可重试的状态码retry_statuses
+    """
+    return get_settings().section("retry")
+
+def get_circuit_breaker_settings():
+    """
+    获取按模型熔断器的配置
+    
+    Returns:
+        dict: 熔断器配置，包含是否启用enabled、连续失败多少次后打开failure_threshold、
+              打开后多少秒进入半开状态recovery_timeout和半开状态下放行的探测请求数half_open_max_calls
+    """
+    return get_settings().section("circuit_breaker")
+
+def get_startup_settings():
+    """
+    获取启动配置
+    
+    Returns:
+        dict: 启动配置，包含是否在后台执行上游健康检查和MCP管理器启动background、
+              上游健康检查是否为就绪的必要条件require_upstream和检查失败后的重试间隔health_check_interval（秒）
+    """
+    return get_settings().section("startup")
+
+def get_config_reload_settings():
+    """
+    获取配置热加载配置
+    
+    Returns:
+        dict: 配置热加载配置，包含是否监视配置文件enabled和检查间隔interval（秒）
+    """
+    return get_settings().section("config_reload")
+
+def get_conversation_settings():
+    """
+    获取对话存储配置
+    
+    Returns:
+        dict: 对话存储配置，包含存储后端backend（json、sqlite或journal）、对话目录dir（为空时使用项目根目录下的conversations）、
+              SQLite数据库路径sqlite_path（为空时使用对话目录下的conversations.sqlite3），
+              journal后端统一fsync的间隔fsync_interval（秒）和触发压缩的无效记录比例compact_ratio，
+              以及是否在后台自动保存会话autosave（需要journal后端）、自动保存间隔autosave_interval（秒）
+              和立即保存的待保存会话数autosave_batch，是否维护对话全文搜索索引search
+    """
+    return get_settings().section("conversations")
+
+def get_agent_mode():
+    """
+    获取上游请求模式
+    
+    Returns:
+        str: "sync"使用MeituanAIAgent，"async"使用AsyncMeituanAIAgent
+    """
+    return get_settings().agent_mode
+
+def get_coalesce_requests():
+    """
+    获取是否合并同时进行的相同请求
+    
+    Returns:
+        bool: 为True时(模型, 消息, 温度)完全相同的并发请求只向上游发送一次
+    """
+    return get_settings().coalesce_requests
+
+def get_logging_settings():
+    """
+    获取日志配置
+    
+    Returns:
+        dict: 日志配置，包含level（日志级别）、format（text或json）、queue_size（后台写出队列长度）
+              和sample_rates（按事件名设置的采样率）
+    """
+    return get_settings().section("logging")
+
+def get_http_pool_settings():
+    """
+    获取异步客户端的连接池配置
+    
+    Returns:
+        dict: 连接池配置，包含最大连接数、单主机最大连接数、keep-alive时间以及连接/读取超时
+    """
+    return get_settings().section("http_pool")
 
 def configure(tenant_id, app_id, api_urls=None, timeout=None):
     """
@@ -130,18 +818,19 @@ def configure(tenant_id, app_id, api_urls=None, timeout=None):
         api_urls (dict, optional): API URL配置
         timeout (int, optional): 请求超时时间
     """
-    config = load_config()
-    config["tenant_id"] = tenant_id
-    config["app_id"] = app_id
-    
-    if api_urls:
-        config["api_urls"] = api_urls
-    
-    if timeout:
-        config["timeout"] = timeout
-    
-    config["is_configured"] = True
-    save_config(config)
+    def apply(config):
+        config["tenant_id"] = tenant_id
+        config["app_id"] = app_id
+
+        if api_urls:
+            config["api_urls"] = api_urls
+
+        if timeout:
+            config["timeout"] = timeout
+
+        config["is_configured"] = True
+
+    _update_config(apply)
 def update_mcp_servers(mcp_servers):
     """
     更新MCP服务器配置
@@ -149,6 +838,4 @@ def update_mcp_servers(mcp_servers):
     Args:
         mcp_servers (dict): MCP服务器配置
     """
-    config = load_config()
-    config["mcpServers"] = mcp_servers
-    save_config(config)
+    _update_config(lambda config: config.update({"mcpServers": mcp_servers}))
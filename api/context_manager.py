@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+上下文管理器 - 按模型的context_length裁剪发送给模型的对话历史
+保留系统消息和最近的对话轮次，较早的轮次在超出预算时被移出上下文窗口
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from .models_config import get_model_info
+from .logger import get_logger
+
+logger = get_logger("context_manager")
+
+# 每条消息的格式开销（role、分隔符等）和回复引导开销，参考OpenAI的计数方式
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 2
+
+
+class TokenCounter:
+    """
+    消息token计数器
+
+    计数结果按消息内容缓存。会话中的消息内容是同一个字符串对象，
+    Python会缓存字符串的哈希值，因此同一条消息在后续轮次中只需一次字典查找。
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base", max_cache_entries: int = 100000):
+        """
+        初始化token计数器
+
+        Args:
+            encoding_name: tiktoken编码名称
+            max_cache_entries: 缓存的最大条目数
+        """
+        self.encoding_name = encoding_name
+        self.max_cache_entries = max_cache_entries
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._encoding = None
+        self._encoding_loaded = False
+
+    def load(self) -> bool:
+        """
+        加载tiktoken编码，首次加载可能需要下载词表，应在启动任务中调用
+
+        Returns:
+            是否加载成功，失败（如无法下载词表）时使用估算的token数
+        """
+        with self._load_lock:
+            self._load_locked()
+        return self._encoding is not None
+
+    def _load_locked(self):
+        """加载编码，调用方需持有self._load_lock"""
+        if self._encoding_loaded:
+            return
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            logger.warning("context.tokenizer", "加载tiktoken编码失败，使用估算的token数: %s", e)
+            self._encoding = None
+        self._encoding_loaded = True
+
+    def _get_encoding(self):
+        """
+        获取编码，未调用load时在首次使用时加载
+
+        Returns:
+            编码，加载失败或正在其他线程中加载时返回None
+        """
+        if not self._encoding_loaded and self._load_lock.acquire(blocking=False):
+            # 编码正在启动任务中加载时不等待，请求先使用估算的token数
+            try:
+                self._load_locked()
+            finally:
+                self._load_lock.release()
+        return self._encoding
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """估算token数：中日韩字符约1个token，其他字符约4个字符1个token"""
+        cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def count_text(self, text: str) -> int:
+        """计算文本的token数"""
+        if not text:
+            return 0
+
+        with self._lock:
+            count = self._cache.get(text)
+            if count is not None:
+                self._cache.move_to_end(text)
+                return count
+
+        encoding = self._get_encoding()
+        if encoding is None and not self._encoding_loaded:
+            # 编码加载完成前的估算值不缓存
+            return self.estimate_tokens(text)
+        if encoding is not None:
+            count = len(encoding.encode(text, disallowed_special=()))
+        else:
+            count = self.estimate_tokens(text)
+
+        with self._lock:
+            self._cache[text] = count
+            if len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+        return count
+
+    def count_message(self, message: Dict[str, str]) -> int:
+        """计算单条消息的token数，包含格式开销"""
+        return TOKENS_PER_MESSAGE + self.count_text(message.get("content") or "")
+
+
+class ContextManager:
+    """上下文管理器 - 让请求的对话历史不超过模型上下文窗口的指定比例"""
+
+    def __init__(self, fraction: float = 0.8, reserve_tokens: int = 1024,
+                 counter: Optional[TokenCounter] = None):
+        """
+        初始化上下文管理器
+
+        Args:
+            fraction: 对话历史最多占用模型上下文窗口的比例
+            reserve_tokens: 为模型回复预留的token数
+            counter: token计数器，默认新建一个
+        """
+        self.fraction = fraction
+        self.reserve_tokens = reserve_tokens
+        self.counter = counter or TokenCounter()
+
+    def get_budget(self, model: str) -> Optional[int]:
+        """
+        获取模型可用于对话历史的token预算
+
+        Args:
+            model: 模型ID
+
+        Returns:
+            token预算，模型未声明context_length时返回None
+        """
+        context_length = get_model_info(model).get("context_length")
+        if not context_length:
+            return None
+        return max(int(context_length * self.fraction) - self.reserve_tokens, 0)
+
+    def count_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """
+        计算完整对话历史（不裁剪）的token数
+
+        Args:
+            messages: 对话历史
+
+        Returns:
+            token数，包含回复前缀
+        """
+        return TOKENS_PER_REPLY + sum(self.counter.count_message(m) for m in messages)
+
+    def fit(self, messages: List[Dict[str, str]], model: str) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+        """
+        裁剪对话历史以适应模型的上下文窗口
+
+        系统消息始终保留；其余消息按轮次（一条用户消息及其后的回复）从新到旧加入，
+        直到超出预算为止，更早的轮次被移出窗口。最新一轮始终保留。
+
+        Args:
+            messages: 完整的对话历史
+            model: 模型ID
+
+        Returns:
+            (发送给模型的消息列表, 统计信息)，统计信息包含trimmed_turns、
+            trimmed_messages、prompt_tokens和budget
+        """
+        budget = self.get_budget(model)
+
+        system_messages = [m for m in messages if m.get("role") == "system"]
+        # 将其余消息按用户消息切分为轮次
+        turns: List[List[Dict[str, str]]] = []
+        for message in messages:
+            if message.get("role") == "system":
+                continue
+            if message.get("role") == "user" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+
+        count = self.counter.count_message
+        used = TOKENS_PER_REPLY + sum(count(m) for m in system_messages)
+
+        kept_turns = []
+        for index, turn in enumerate(reversed(turns)):
+            turn_tokens = sum(count(m) for m in turn)
+            if budget is not None and index > 0 and used + turn_tokens > budget:
+                break
+            used += turn_tokens
+            kept_turns.append(turn)
+
+        trimmed_turns = turns[:len(turns) - len(kept_turns)]
+        fitted = system_messages + [m for turn in reversed(kept_turns) for m in turn]
+
+        return fitted, {
+            "trimmed_turns": len(trimmed_turns),
+            "trimmed_messages": sum(len(turn) for turn in trimmed_turns),
+            "prompt_tokens": used,
+            "budget": budget
+        }
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+对话元数据索引 - 在SQLite中保存每个已保存对话的时间戳、标题、消息数和文件大小
+
+列出对话时只查询索引，不再逐个解析对话文件。索引在保存和删除对话时增量更新；
+启动时按文件的修改时间和大小与目录比对，只解析新增或变化的文件，手动复制或删除的文件也能反映到索引中。
+分页查询按 (时间戳, 文件名) 做键集分页，游标记录上一页最后一条的位置，翻到任意一页的开销都与页大小成正比。
+"""
+
+import os
+import json
+import base64
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .logger import get_logger
+
+logger = get_logger("conversation_index")
+
+# 列表接口返回的字段，顺序与查询的列一致
+COLUMNS = ("filename", "timestamp", "datetime", "title", "message_count", "size_bytes", "role", "model")
+
+# 索引表结构的版本，与数据库中的不一致时删除旧表重新建立索引
+SCHEMA_VERSION = 2
+
+# 分页查询支持的筛选条件：since和until为时间戳范围（含两端），title_prefix为标题前缀，model和role为精确匹配
+FILTERS = ("since", "until", "title_prefix", "model", "role")
+
+
+def encode_cursor(timestamp: int, filename: str) -> str:
+    """将一页最后一条的位置编码为游标"""
+    raw = json.dumps([timestamp, filename], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, str]:
+    """
+    解析游标
+
+    Raises:
+        ValueError: 游标无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, filename = json.loads(raw)
+    except Exception:
+        raise ValueError(f"无效的游标: {cursor}")
+    if not isinstance(timestamp, int) or not isinstance(filename, str):
+        raise ValueError(f"无效的游标: {cursor}")
+    return timestamp, filename
+
+
+def page_query(conn: sqlite3.Connection, table: str, key_column: str, limit: int, cursor: Optional[str] = None,
+               **filters: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    按保存时间从新到旧分页查询对话
+
+    Args:
+        conn: 数据库连接
+        table: 对话元数据表
+        key_column: 对话标识列
+        limit: 页大小
+        cursor: 上一页返回的游标，为空时从第一页开始
+        filters: 筛选条件，见FILTERS
+
+    Returns:
+        (本页的对话, 下一页的游标)，没有下一页时游标为None
+
+    Raises:
+        ValueError: 游标无效
+    """
+    conditions = []
+    params: List[Any] = []
+    if cursor:
+        conditions.append(f"(timestamp, {key_column}) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    if filters.get("since") is not None:
+        conditions.append("timestamp >= ?")
+        params.append(filters["since"])
+    if filters.get("until") is not None:
+        conditions.append("timestamp <= ?")
+        params.append(filters["until"])
+    if filters.get("title_prefix"):
+        # 以范围代替LIKE，可以使用标题索引且不受通配符影响
+        conditions.append("title >= ? AND title < ?")
+        params.extend((filters["title_prefix"], filters["title_prefix"] + "\U0010ffff"))
+    for column in ("model", "role"):
+        if filters.get(column):
+            conditions.append(f"{column} = ?")
+            params.append(filters[column])
+
+    query = (f"SELECT {key_column}, timestamp, datetime, title, message_count, size_bytes, role, model FROM {table}"
+             + (" WHERE " + " AND ".join(conditions) if conditions else "")
+             + f" ORDER BY timestamp DESC, {key_column} DESC LIMIT ?")
+    params.append(limit + 1)
+    rows = conn.execute(query, params).fetchall()
+    items = [dict(zip(COLUMNS, row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(items[-1]["timestamp"], items[-1]["filename"])
+    return items, next_cursor
+
+
+def matches(item: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """检查对话元数据是否满足筛选条件，用于索引不可用时逐个读取文件"""
+    if filters.get("since") is not None and item["timestamp"] < filters["since"]:
+        return False
+    if filters.get("until") is not None and item["timestamp"] > filters["until"]:
+        return False
+    if filters.get("title_prefix") and not item["title"].startswith(filters["title_prefix"]):
+        return False
+    return all(not filters.get(column) or item.get(column) == filters[column] for column in ("model", "role"))
+
+
+def read_metadata(filepath: Path) -> Dict[str, Any]:
+    """
+    解析对话文件，提取索引需要的元数据
+
+    Args:
+        filepath: 对话文件路径
+
+    Returns:
+        元数据，包含timestamp、datetime、title、message_count、size_bytes、mtime_ns、role和model
+    """
+    stat = filepath.stat()
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {
+        "timestamp": data.get("timestamp", 0),
+        "datetime": data.get("datetime", ""),
+        "title": data.get("title", ""),
+        "message_count": len(data.get("messages") or []),
+        "size_bytes": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "role": data.get("role"),
+        "model": data.get("model")
+    }
+
+
+class ConversationIndex:
+    """对话元数据索引"""
+
+    def __init__(self, db_path: str, save_dir: str, suffix: str = ".json",
+                 reader: Callable[[Path], Dict[str, Any]] = read_metadata):
+        """
+        初始化对话索引
+
+        Args:
+            db_path: SQLite索引文件路径
+            save_dir: 对话文件所在的目录
+            suffix: 对话文件的扩展名
+            reader: 解析对话文件元数据的函数，返回值格式同read_metadata()
+        """
+        self.db_path = str(db_path)
+        self.save_dir = Path(save_dir)
+        self.suffix = suffix
+        self.reader = reader
+        # sqlite3连接不能跨线程使用，每个线程单独打开
+        self._local = threading.local()
+
+        conn = self._get_connection()
+        # 索引可以随时从对话文件重建，表结构变化时直接删除旧表
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.execute("DROP TABLE IF EXISTS conversations")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "filename TEXT PRIMARY KEY, timestamp INTEGER NOT NULL, datetime TEXT NOT NULL, title TEXT NOT NULL, "
+            "message_count INTEGER NOT NULL, size_bytes INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "role TEXT, model TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_time ON conversations (timestamp DESC, filename DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_title ON conversations (title)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_model "
+                     "ON conversations (model, timestamp DESC, filename DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_role "
+                     "ON conversations (role, timestamp DESC, filename DESC)")
+        conn.commit()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            # WAL模式下多个工作进程可以同时读，写入不阻塞读取
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def upsert(self, filename: str, metadata: Dict[str, Any]):
+        """
+        添加或更新一个对话的元数据
+
+        Args:
+            filename: 对话文件名
+            metadata: read_metadata()返回的元数据
+        """
+        conn = self._get_connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO conversations "
+            "(filename, timestamp, datetime, title, message_count, size_bytes, mtime_ns, role, model) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (filename, metadata["timestamp"], metadata["datetime"], metadata["title"], metadata["message_count"],
+             metadata["size_bytes"], metadata["mtime_ns"], metadata.get("role"), metadata.get("model"))
+        )
+        conn.commit()
+
+    def remove(self, filename: str):
+        """
+        移除一个对话的元数据
+
+        Args:
+            filename: 对话文件名
+        """
+        conn = self._get_connection()
+        conn.execute("DELETE FROM conversations WHERE filename = ?", (filename,))
+        conn.commit()
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        获取一个对话的元数据
+
+        Args:
+            filename: 对话文件名
+
+        Returns:
+            对话元数据，不在索引中时返回None
+        """
+        row = self._get_connection().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM conversations WHERE filename = ?", (filename,)).fetchone()
+        return dict(zip(COLUMNS, row)) if row is not None else None
+
+    def list(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        按保存时间从新到旧列出对话
+
+        Args:
+            limit: 最多返回的条数，为None时返回全部
+
+        Returns:
+            对话元数据列表
+        """
+        query = f"SELECT {', '.join(COLUMNS)} FROM conversations ORDER BY timestamp DESC, filename DESC"
+        params: tuple = ()
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (limit,)
+        rows = self._get_connection().execute(query, params).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def query(self, limit: int, cursor: Optional[str] = None,
+              **filters: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        分页查询对话，参数和返回值见page_query()
+        """
+        return page_query(self._get_connection(), "conversations", "filename", limit, cursor, **filters)
+
+    def count(self) -> int:
+        """索引中的对话数"""
+        return self._get_connection().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def sync(self) -> Dict[str, int]:
+        """
+        与对话目录比对，解析新增或修改时间、大小变化的文件，移除已不存在的文件
+
+        只读取目录项和文件状态，未变化的文件不会被打开。
+
+        Returns:
+            统计信息，包含added、updated、removed、failed和total
+        """
+        conn = self._get_connection()
+        indexed = {filename: (mtime_ns, size_bytes) for filename, mtime_ns, size_bytes in
+                   conn.execute("SELECT filename, mtime_ns, size_bytes FROM conversations")}
+
+        stats = {"added": 0, "updated": 0, "removed": 0, "failed": 0}
+        present = set()
+        with os.scandir(self.save_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(self.suffix) or not entry.is_file():
+                    continue
+                present.add(entry.name)
+                stat = entry.stat()
+                known = indexed.get(entry.name)
+                if known == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                try:
+                    metadata = self.reader(Path(entry.path))
+                except Exception as e:
+                    stats["failed"] += 1
+                    logger.error("conversation.index", "读取对话文件失败: %s, 错误: %s", entry.path, e)
+                    continue
+                self.upsert(entry.name, metadata)
+                stats["added" if known is None else "updated"] += 1
+
+        for filename in indexed.keys() - present:
+            self.remove(filename)
+            stats["removed"] += 1
+
+        stats["total"] = len(present) - stats["failed"]
+        if stats["added"] or stats["updated"] or stats["removed"]:
+            logger.info("conversation.index", "对话索引已更新", **stats)
+        return stats
+
+    def rebuild(self) -> Dict[str, int]:
+        """
+        清空索引后重新解析所有对话文件
+
+        Returns:
+            统计信息，同sync()
+        """
+        conn = self._get_connection()
+        conn.execute("DELETE FROM conversations")
+        conn.commit()
+        return self.sync()
@@ -0,0 +1,472 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+对话日志存储 - 每个对话一个只追加的JSONL日志文件
+
+继续保存同一个对话时只追加与上次保存相比新增的消息，写入量与新增内容成正比，不再每次重写完整的对话历史。
+日志第一行是对话的时间戳、日期时间、标题、角色和模型，之后每行一条记录：
+    {"message": {...}}  追加一条消息
+    {"truncate": n}     只保留前n条消息（对话历史的中间被修改时，如撤回最后一条消息、切换角色）
+    {"meta": {...}}     更新头部中的角色或模型
+加载时按顺序重放记录。被截断的记录占用的字节超过有效记录的compact_ratio倍时，
+只保留有效消息重写日志文件并原子替换（压缩）。
+
+追加的数据立即写入操作系统，进程崩溃不会丢失；fsync由后台线程每隔fsync_interval秒对有写入的文件统一执行，
+断电最多丢失这段时间内的写入。fsync_interval为0时每次追加后立即fsync。
+多个工作进程写同一个日志文件时以flock互斥，发现文件被其他进程追加或压缩过时重新读取。
+"""
+
+import os
+import json
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from .conversation_index import ConversationIndex
+from .conversation_store import (INDEX_FILENAME, ConversationStore, conversation_name, list_indexed, metadata_indexed,
+                                 new_conversation, query_indexed)
+from .logger import get_logger
+
+try:
+    import fcntl
+except ImportError:
+    # Windows上没有fcntl，只能保证同一进程内的写入互斥
+    fcntl = None
+
+logger = get_logger("conversation_journal")
+
+SUFFIX = ".jsonl"
+
+# 无效记录少于该字节数时不压缩，避免短对话频繁重写
+MIN_COMPACT_BYTES = 64 * 1024
+
+
+def _encode(record: Dict[str, Any]) -> bytes:
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class _Journal:
+    """单个日志文件的内存状态，与文件内容一致时追加不需要读取文件"""
+
+    __slots__ = ("lock", "header", "messages", "line_sizes", "size", "dead_bytes", "ino")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.header: Dict[str, Any] = {}
+        # 有效消息及其在日志中的字节数，用于与新的对话历史比较和计算压缩时机
+        self.messages: List[Dict[str, Any]] = []
+        self.line_sizes: List[int] = []
+        self.size = 0
+        self.dead_bytes = 0
+        self.ino = 0
+
+    def live_bytes(self) -> int:
+        return self.size - self.dead_bytes
+
+
+def replay(data: bytes) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[int], int, int]:
+    """
+    重放日志内容
+
+    最后一行不完整（写入时进程崩溃）或无法解析时，从该行起的内容视为无效。
+
+    Args:
+        data: 日志文件的内容
+
+    Returns:
+        (头部, 有效消息, 各消息的字节数, 有效内容的长度, 无效记录的字节数)
+
+    Raises:
+        ValueError: 第一行不是日志头部
+    """
+    header: Optional[Dict[str, Any]] = None
+    messages: List[Dict[str, Any]] = []
+    line_sizes: List[int] = []
+    dead_bytes = 0
+    offset = 0
+    while offset < len(data):
+        end = data.find(b"\n", offset)
+        if end < 0:
+            break
+        line_size = end + 1 - offset
+        try:
+            record = json.loads(data[offset:end])
+        except ValueError:
+            break
+        if header is None:
+            if not isinstance(record, dict) or "title" not in record:
+                raise ValueError("不是对话日志文件")
+            header = record
+        elif "message" in record:
+            messages.append(record["message"])
+            line_sizes.append(line_size)
+        elif "truncate" in record:
+            keep = record["truncate"]
+            dead_bytes += sum(line_sizes[keep:]) + line_size
+            del messages[keep:]
+            del line_sizes[keep:]
+        elif "meta" in record:
+            # 压缩时合并到头部，计为无效记录
+            header.update(record["meta"])
+            dead_bytes += line_size
+        offset += line_size
+    if header is None:
+        raise ValueError("不是对话日志文件")
+    return header, messages, line_sizes, offset, dead_bytes
+
+
+def read_journal_metadata(filepath: Path) -> Dict[str, Any]:
+    """
+    重放日志文件，提取索引需要的元数据，格式同conversation_index.read_metadata()
+    """
+    with open(filepath, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        header, messages, _, _, _ = replay(f.read())
+    return {
+        "timestamp": header.get("timestamp", 0),
+        "datetime": header.get("datetime", ""),
+        "title": header.get("title", ""),
+        "message_count": len(messages),
+        "size_bytes": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "role": header.get("role"),
+        "model": header.get("model")
+    }
+
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _fsync_dir(path: Path):
+    """同步目录项，确保新建或替换的文件名在断电后仍然有效"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    try:
+        dir_fd = os.open(str(path), os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class JournalConversationStore(ConversationStore):
+    """每个对话一个只追加的JSONL日志文件"""
+
+    backend = "journal"
+    continues = True
+
+    def __init__(self, save_dir: Path, fsync_interval: float = 1.0, compact_ratio: float = 1.0,
+                 max_cached: int = 256):
+        """
+        Args:
+            save_dir: 对话目录，日志文件保存在其中的journal子目录
+            fsync_interval: 统一fsync的间隔（秒），为0时每次追加后立即fsync
+            compact_ratio: 无效记录的字节数超过有效记录的多少倍时压缩
+            max_cached: 在内存中保留状态的日志数，超出的日志下次追加前重新读取
+        """
+        self.journal_dir = Path(save_dir) / "journal"
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self.fsync_interval = fsync_interval
+        self.compact_ratio = compact_ratio
+        self.max_cached = max_cached
+
+        self._journals: "OrderedDict[str, _Journal]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self.appended_bytes = 0
+        self.compactions = 0
+
+        self.index = None
+        try:
+            self.index = ConversationIndex(self.journal_dir / INDEX_FILENAME, self.journal_dir,
+                                           suffix=SUFFIX, reader=read_journal_metadata)
+            self.index.sync()
+        except Exception as e:
+            logger.error("conversation.index", "打开对话索引失败，列出对话时将逐个读取文件: %s", e)
+            self.index = None
+
+        self._stop = threading.Event()
+        self._syncer = None
+        if fsync_interval > 0:
+            self._syncer = threading.Thread(target=self._run_syncer, name="journal-fsync", daemon=True)
+            self._syncer.start()
+
+    def _journal(self, filename: str) -> _Journal:
+        """获取日志的内存状态，不存在时创建空状态（size为0，首次追加时读取文件）"""
+        with self._lock:
+            journal = self._journals.get(filename)
+            if journal is None:
+                journal = self._journals[filename] = _Journal()
+                while len(self._journals) > self.max_cached:
+                    self._journals.popitem(last=False)
+            else:
+                self._journals.move_to_end(filename)
+            return journal
+
+    @contextmanager
+    def _open_locked(self, path: Path):
+        """
+        以追加方式打开日志文件并取得排他锁
+
+        其他进程压缩时会替换文件，取得锁后文件名已指向新文件的，重新打开新文件。
+
+        Raises:
+            FileNotFoundError: 日志文件不存在
+        """
+        while True:
+            fd = os.open(str(path), os.O_WRONLY | os.O_APPEND)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.fstat(fd).st_ino == os.stat(str(path)).st_ino:
+                    break
+            except BaseException:
+                os.close(fd)
+                raise
+            os.close(fd)
+        try:
+            yield fd
+        finally:
+            os.close(fd)
+
+    def _reload(self, journal: _Journal, path: Path, fd: int):
+        """从文件重新读取日志状态，截掉末尾不完整的记录。调用方需持有文件锁"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        journal.header, journal.messages, journal.line_sizes, valid, journal.dead_bytes = replay(data)
+        if valid < len(data):
+            logger.warning("conversation.journal", "日志末尾有不完整的记录，已截断: %s", path,
+                           dropped_bytes=len(data) - valid)
+            os.ftruncate(fd, valid)
+        journal.size = valid
+        journal.ino = os.fstat(fd).st_ino
+
+    def _rewrite(self, journal: _Journal, path: Path, header: Dict[str, Any], messages: List[Dict[str, Any]]):
+        """将头部和有效消息写入新文件并原子替换，用于新建和压缩日志"""
+        lines = [_encode({"message": message}) for message in messages]
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.journal_dir), prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_encode(header))
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+                os.chmod(tmp_path, 0o644)
+                ino = os.fstat(f.fileno()).st_ino
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        _fsync_dir(self.journal_dir)
+        journal.header = header
+        journal.messages = list(messages)
+        journal.line_sizes = [len(line) for line in lines]
+        journal.size = size
+        journal.dead_bytes = 0
+        journal.ino = ino
+
+    def _update_index(self, filename: str, journal: _Journal, path: Path):
+        if self.index is None:
+            return
+        try:
+            self.index.upsert(filename, {
+                "timestamp": journal.header.get("timestamp", 0),
+                "datetime": journal.header.get("datetime", ""),
+                "title": journal.header.get("title", ""),
+                "message_count": len(journal.messages),
+                "size_bytes": journal.size,
+                "mtime_ns": os.stat(path).st_mtime_ns,
+                "role": journal.header.get("role"),
+                "model": journal.header.get("model")
+            })
+        except Exception as e:
+            logger.error("conversation.index", "更新对话索引失败: %s", e)
+
+    def save(self, messages: List[Dict[str, Any]], title: Optional[str] = None, name: Optional[str] = None,
+             role: Optional[str] = None, model: Optional[str] = None) -> str:
+        if name:
+            filename = os.path.basename(name)
+            path = self.journal_dir / filename
+            try:
+                self._append(filename, path, messages, {"role": role, "model": model})
+                return str(path)
+            except FileNotFoundError:
+                # 之前保存的对话已被删除，保存为新的对话
+                pass
+
+        timestamp, datetime_str, title = new_conversation(title)
+        filename = self._reserve(timestamp, title)
+        path = self.journal_dir / filename
+        journal = self._journal(filename)
+        with journal.lock:
+            header = {"timestamp": timestamp, "datetime": datetime_str, "title": title, "role": role, "model": model}
+            self._rewrite(journal, path, header, messages)
+        self._update_index(filename, journal, path)
+        logger.info("conversation.save", "对话已保存到: %s", path, messages=len(messages))
+        return str(path)
+
+    def _reserve(self, timestamp: int, title: str) -> str:
+        """
+        创建空文件占用新对话的文件名
+
+        同一秒内保存的同名对话（如多个会话同时自动保存）依次加上序号，不会互相覆盖。
+        """
+        for seq in range(1, 1000):
+            filename = conversation_name(timestamp, title if seq == 1 else f"{title}_{seq}", SUFFIX)
+            try:
+                os.close(os.open(str(self.journal_dir / filename), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+                return filename
+            except FileExistsError:
+                continue
+        raise FileExistsError(f"无法为对话分配文件名: {title}")
+
+    def _append(self, filename: str, path: Path, messages: List[Dict[str, Any]], meta: Dict[str, Optional[str]]):
+        """
+        追加与日志中的对话历史相比变化的消息，以及变化的角色和模型
+
+        Raises:
+            FileNotFoundError: 日志文件不存在
+        """
+        journal = self._journal(filename)
+        with journal.lock, self._open_locked(path) as fd:
+            stat = os.fstat(fd)
+            if stat.st_ino != journal.ino or stat.st_size != journal.size:
+                self._reload(journal, path, fd)
+
+            # 会话中未变化的消息与上次保存的是同一个对象，大多数情况下只需比较引用
+            stored = journal.messages
+            keep = 0
+            common = min(len(stored), len(messages))
+            while keep < common and (stored[keep] is messages[keep] or stored[keep] == messages[keep]):
+                keep += 1
+            changed_meta = {key: value for key, value in meta.items()
+                            if value is not None and journal.header.get(key) != value}
+            if keep == len(stored) == len(messages) and not changed_meta:
+                return
+
+            lines = []
+            if changed_meta:
+                line = _encode({"meta": changed_meta})
+                lines.append(line)
+                journal.header.update(changed_meta)
+                journal.dead_bytes += len(line)
+            if keep < len(stored):
+                truncate = _encode({"truncate": keep})
+                lines.append(truncate)
+                journal.dead_bytes += sum(journal.line_sizes[keep:]) + len(truncate)
+                del stored[keep:]
+                del journal.line_sizes[keep:]
+            for message in messages[keep:]:
+                line = _encode({"message": message})
+                lines.append(line)
+                stored.append(message)
+                journal.line_sizes.append(len(line))
+            data = b"".join(lines)
+            _write_all(fd, data)
+            journal.size += len(data)
+            self.appended_bytes += len(data)
+
+            if journal.dead_bytes >= MIN_COMPACT_BYTES and \
+                    journal.dead_bytes > self.compact_ratio * journal.live_bytes():
+                dead_bytes = journal.dead_bytes
+                self._rewrite(journal, path, journal.header, journal.messages)
+                self.compactions += 1
+                logger.info("conversation.compact", "对话日志已压缩: %s", path, dropped_bytes=dead_bytes,
+                            size=journal.size)
+            elif self.fsync_interval > 0:
+                with self._dirty_lock:
+                    self._dirty.add(path)
+            else:
+                os.fsync(fd)
+        self._update_index(filename, journal, path)
+        logger.debug("conversation.append", "对话已追加: %s", path, appended_bytes=len(data))
+
+    def load(self, name: str) -> Optional[List[Dict[str, Any]]]:
+        path = self.journal_dir / os.path.basename(name)
+        try:
+            with open(path, 'rb') as f:
+                _, messages, _, _, _ = replay(f.read())
+            return messages
+        except FileNotFoundError:
+            logger.warning("conversation.not_found", "文件不存在: %s", path)
+            return None
+        except Exception as e:
+            logger.error("conversation.load", "加载对话失败: %s", e)
+            return None
+
+    def list(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return list_indexed(self.index, self.journal_dir, SUFFIX, read_journal_metadata, limit)
+
+    def query(self, limit: int, cursor: Optional[str] = None,
+              **filters: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        return query_indexed(self.index, self.journal_dir, SUFFIX, read_journal_metadata, limit, cursor, filters)
+
+    def metadata(self, name: str) -> Optional[Dict[str, Any]]:
+        return metadata_indexed(self.index, self.journal_dir, read_journal_metadata, name)
+
+    def delete(self, name: str) -> bool:
+        filename = os.path.basename(name)
+        path = self.journal_dir / filename
+        journal = self._journal(filename)
+        with journal.lock:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                logger.warning("conversation.not_found", "文件不存在: %s", path)
+                return False
+            except Exception as e:
+                logger.error("conversation.delete", "删除对话失败: %s", e)
+                return False
+            journal.size = journal.ino = 0
+        with self._dirty_lock:
+            self._dirty.discard(path)
+        if self.index is not None:
+            self.index.remove(filename)
+        logger.info("conversation.delete", "对话已删除: %s", path)
+        return True
+
+    def rebuild_index(self) -> Optional[Dict[str, int]]:
+        if self.index is None:
+            return None
+        return self.index.rebuild()
+
+    def flush(self):
+        """立即fsync所有有未同步写入的日志文件"""
+        with self._dirty_lock:
+            paths, self._dirty = self._dirty, set()
+        for path in paths:
+            try:
+                fd = os.open(str(path), os.O_RDONLY)
+            except FileNotFoundError:
+                # 已被删除，或被压缩替换（压缩时已fsync）
+                continue
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                logger.error("conversation.fsync", "同步对话日志失败: %s", e, path=str(path))
+            finally:
+                os.close(fd)
+
+    def _run_syncer(self):
+        while not self._stop.wait(self.fsync_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._syncer is not None:
+            self._syncer.join(timeout=5)
+        self.flush()
@@ -3,23 +3,48 @@
 
 """
 对话历史管理器 - 用于保存和加载对话历史
+对话的存储方式由存储后端决定（见conversation_store.py），默认每个对话保存为一个JSON文件
+
+启用自动保存时，请求线程只把有新消息的会话登记为待保存，由后台线程每隔autosave_interval秒
+（或待保存的会话达到autosave_batch个时）统一写入，同一会话在一个间隔内的多次修改合并为一次保存。
+请求线程不等待磁盘，进程崩溃最多丢失一个间隔内的对话；关闭时写入所有待保存的会话。
+登记时（请求线程持有会话锁）复制消息列表，后台线程只保存该副本，从不等待会话锁，
+因此某个会话的请求长时间持有锁（如慢速读取的流式响应）不会推迟其他会话的保存。
+
+启用搜索时，保存（包括自动保存）和删除对话后同步更新全文搜索索引（见conversation_search.py），
+只写入新增或内容变化的消息。
 """
 
 import os
-import json
-import time
-import datetime
+import threading
 from pathlib import Path
+from .conversation_search import ConversationSearchIndex
+from .conversation_store import create_conversation_store
+from .logger import get_logger
+
+logger = get_logger("conversation_manager")
+
+# 全文搜索索引的文件名，保存在对话目录中
+SEARCH_INDEX_FILENAME = ".search.sqlite3"
 
 class ConversationManager:
     """对话历史管理器"""
 
-    def __init__(self, save_dir=None):
+    def __init__(self, save_dir=None, backend="json", sqlite_path=None, fsync_interval=1.0, compact_ratio=1.0,
+                 autosave=False, autosave_interval=5.0, autosave_batch=64, search=True):
         """
         初始化对话历史管理器
 
         Args:
             save_dir: 保存对话历史的目录，默认为项目根目录下的conversations目录
+            backend: 存储后端，json、sqlite或journal
+            sqlite_path: SQLite后端的数据库路径，默认为对话目录下的conversations.sqlite3
+            fsync_interval: journal后端统一fsync的间隔（秒），为0时每次追加后立即fsync
+            compact_ratio: journal后端中无效记录超过有效记录的多少倍时压缩日志
+            autosave: 是否在后台自动保存有新消息的会话，只在journal后端下生效
+            autosave_interval: 自动保存的间隔（秒）
+            autosave_batch: 待保存的会话达到该数量时不等间隔结束立即保存
+            search: 是否维护全文搜索索引
         """
         if save_dir is None:
             # 使用项目根目录下的conversations目录
@@ -30,44 +55,70 @@ class ConversationManager:
         # 确保目录存在
         os.makedirs(self.save_dir, exist_ok=True)
         
-        print(f"对话历史将保存在: {self.save_dir}")
+        self.store = create_conversation_store(backend, self.save_dir, sqlite_path,
+                                               fsync_interval=fsync_interval, compact_ratio=compact_ratio)
+        logger.info("conversation.init", "对话历史将保存在: %s", self.save_dir, backend=self.store.backend)
+        
+        # 全文搜索索引，为空而已有保存的对话时（首次启用或索引文件被删除）在后台建立
+        self.search_index = None
+        if search:
+            try:
+                self.search_index = ConversationSearchIndex(self.save_dir / SEARCH_INDEX_FILENAME, self.store.load)
+            except Exception as e:
+                logger.warning("conversation.search", "打开搜索索引失败，已停用对话搜索: %s", e)
+        if self.search_index is not None and self.search_index.count() == 0 and self.store.list(1):
+            threading.Thread(target=self.rebuild_search_index, name="conversation-search-index", daemon=True).start()
+        
+        # 待自动保存的会话，按会话ID合并
+        self.autosave_interval = autosave_interval
+        self.autosave_batch = max(1, autosave_batch)
+        self.autosaved = 0
+        self.autosave_errors = 0
+        self._pending = {}
+        # 自动保存后尚未写回会话的对话标识：会话ID -> (保存时的消息列表, 保存前的对话标识, 保存的对话标识)
+        self._saved_names = {}
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._flusher = None
+        if autosave:
+            if self.store.continues:
+                self._flusher = threading.Thread(target=self._run_flusher, name="conversation-autosave", daemon=True)
+                self._flusher.start()
+            else:
+                # 其他后端每次保存都会新建对话，定期保存会产生大量重复的对话
+                logger.warning("conversation.autosave", "自动保存需要journal后端，当前后端为%s，已停用",
+                               self.store.backend)
     
-    def save_conversation(self, messages, title=None):
+    def save_conversation(self, messages, title=None, name=None, role=None, model=None):
         """
         保存对话历史
 
         Args:
             messages: 对话历史列表
             title: 对话标题，如果为None则使用时间戳
+            name: 之前保存的对话，journal后端继续保存到该对话，只写入变化的消息；其他后端忽略
+            role: 对话使用的角色，列表可以按角色筛选
+            model: 对话最近使用的模型，列表可以按模型筛选
 
         Returns:
-            保存的文件路径
-        """
-        # 生成时间戳
-        timestamp = int(time.time())
-        datetime_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # 如果没有提供标题，使用时间戳
-        if not title:
-            title = f"对话_{timestamp}"
-        # 构建文件名
-        filename = f"{timestamp}_{title.replace(' ', '_')}.json"
-        filepath = self.save_dir / filename
-        
-        # 构建保存的数据
-        data = {
-            "timestamp": timestamp,
-            "datetime": datetime_str,
-            "title": title,
-            "messages": messages
-        }
-        
-        # 保存到文件
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        print(f"对话已保存到: {filepath}")
-        return str(filepath)
+            保存的文件路径（SQLite后端为对话标识）
+        """
+        filepath = self.store.save(messages, title, name, role=role, model=model)
+        self._index_conversation(filepath, messages)
+        return filepath
+    
+    def _index_conversation(self, filepath, messages):
+        # 搜索索引更新失败不影响保存结果，可以通过rebuild_search_index()重建
+        if self.search_index is None:
+            return
+        filename = os.path.basename(filepath)
+        try:
+            metadata = self.store.metadata(filename)
+            if metadata is not None:
+                self.search_index.update(filename, metadata, messages)
+        except Exception as e:
+            logger.error("conversation.search", "更新搜索索引失败: %s", e, filename=filename)
     
     def load_conversation(self, filename):
         """
@@ -77,56 +128,91 @@ class ConversationManager:
         Returns:
             对话历史列表
         """
-        # 如果提供的是文件名而不是完整路径，则构建完整路径
-        if not os.path.isabs(filename):
-            filepath = self.save_dir / filename
-        else:
-            filepath = Path(filename)
+        return self.store.load(filename)
+    
+    def list_conversations(self, limit=None):
+        """
+        列出所有保存的对话
         
-        # 检查文件是否存在
-        if not filepath.exists():
-            print(f"文件不存在: {filepath}")
-            return None
+        Args:
+            limit: 最多返回的条数，为None时返回全部
         
-        # 从文件加载数据
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # 返回对话历史
-            return data.get("messages", [])
-        except Exception as e:
-            print(f"加载对话失败: {e}")
+        Returns:
+            对话列表，按保存时间从新到旧排列，每个对话包含时间戳、日期时间、标题、文件名、消息数和文件大小
+        """
+        return self.store.list(limit)
+    
+    def query_conversations(self, limit, cursor=None, **filters):
+        """
+        按保存时间从新到旧分页查询对话
+        
+        Args:
+            limit: 页大小
+            cursor: 上一页返回的游标，为None时从第一页开始
+            filters: 筛选条件：since和until为时间戳范围，title_prefix为标题前缀，model和role为精确匹配
+        
+        Returns:
+            (本页的对话, 下一页的游标)，没有下一页时游标为None
+        
+        Raises:
+            ValueError: 游标无效
+        """
+        return self.store.query(limit, cursor, **filters)
+    
+    def search_conversations(self, query, limit=20):
+        """
+        全文搜索已保存对话的标题和消息内容
+        
+        Args:
+            query: 搜索词，多个词之间为AND关系，中文按连续的子串匹配
+            limit: 最多返回的结果数
+        
+        Returns:
+            按相关度从高到低排列的结果，每项包含filename、title、timestamp、datetime、score、message_index、
+            snippet和highlights；
+            未启用搜索时返回None
+        """
+        if self.search_index is None:
             return None
+        return self.search_index.search(query, limit)
     
-    def list_conversations(self):
+    def rebuild_index(self):
         """
-        列出所有保存的对话
+        重建对话列表使用的元数据
         
         Returns:
-            对话列表，每个对话包含时间戳、日期时间、标题和文件名
+            统计信息，包含added、updated、removed、failed和total；不可用时返回None
         """
-        conversations = []
+        return self.store.rebuild_index()
+    
+    def rebuild_search_index(self):
+        """
+        清空搜索索引（包括被删除或替换的消息留下的无效记录）后重新读取所有已保存的对话
         
-        # 遍历目录中的所有JSON文件
-        for filepath in sorted(self.save_dir.glob("*.json"), reverse=True):
+        Returns:
+            统计信息，包含indexed和failed；未启用搜索时返回None
+        """
+        if self.search_index is None:
+            return None
+        self.search_index.clear()
+        stats = {"indexed": 0, "failed": 0}
+        # 从旧到新写入，最近保存的对话行号最大，常用词的搜索结果优先从中排序
+        for item in reversed(self.store.list()):
+            messages = self.store.load(item["filename"])
+            if messages is None:
+                stats["failed"] += 1
+                continue
             try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                # 提取对话信息
-                conversation = {
-                    "timestamp": data.get("timestamp", 0),
-                    "datetime": data.get("datetime", ""),
-                    "title": data.get("title", ""),
-                    "filename": filepath.name
-                }
-                
-                conversations.append(conversation)
+                self.search_index.update(item["filename"], item, messages)
             except Exception as e:
-                print(f"读取对话文件失败: {filepath}, 错误: {e}")
-        
-        return conversations    
+                stats["failed"] += 1
+                logger.error("conversation.search", "更新搜索索引失败: %s", e, filename=item["filename"])
+                continue
+            stats["indexed"] += 1
+        self.search_index.optimize()
+        logger.info("conversation.search", "搜索索引已重建", **stats)
+        return stats
+    
     def delete_conversation(self, filename):
         """
         删除对话历史
@@ -137,22 +223,116 @@ class ConversationManager:
         Returns:
             是否成功删除
         """
-        # 如果提供的是文件名而不是完整路径，则构建完整路径
-        if not os.path.isabs(filename):
-            filepath = self.save_dir / filename
-        else:
-            filepath = Path(filename)
+        deleted = self.store.delete(filename)
+        if deleted and self.search_index is not None:
+            try:
+                self.search_index.remove(os.path.basename(filename))
+            except Exception as e:
+                logger.error("conversation.search", "更新搜索索引失败: %s", e, filename=filename)
+        return deleted
+    
+    @property
+    def autosave_enabled(self):
+        """是否已启用自动保存"""
+        return self._flusher is not None
+    
+    def mark_dirty(self, session):
+        """
+        登记有新消息的会话，由后台线程保存。必须在持有会话锁时调用，只复制消息列表，不访问磁盘
         
-        # 检查文件是否存在
-        if not filepath.exists():
-            print(f"文件不存在: {filepath}")
-            return False
+        Args:
+            session: 会话（session_store.Session）
+        """
+        if self._flusher is None:
+            return
+        with self._pending_lock:
+            self._apply_saved_name(session)
+            self._pending[session.session_id] = (session, session.messages, list(session.messages),
+                                                 session.conversation_name, session.role, session.model)
+            pending = len(self._pending)
+        if pending >= self.autosave_batch:
+            self._wakeup.set()
+    
+    def sync_conversation_name(self, session):
+        """
+        将自动保存的对话标识写回会话，手动保存前调用，使其继续保存到自动保存的对话。必须在持有会话锁时调用
         
-        # 删除文件
+        Args:
+            session: 会话（session_store.Session）
+        """
+        with self._pending_lock:
+            self._apply_saved_name(session)
+    
+    def _apply_saved_name(self, session):
+        saved = self._saved_names.pop(session.session_id, None)
+        if saved is not None:
+            history, name, filename = saved
+            if session.messages is history and session.conversation_name == name:
+                session.conversation_name = filename
+    
+    def pending_count(self):
+        """待自动保存的会话数"""
+        with self._pending_lock:
+            return len(self._pending)
+    
+    def flush_pending(self):
+        """立即保存所有待保存的会话"""
+        with self._pending_lock:
+            snapshots, self._pending = list(self._pending.values()), {}
+            # 在取出快照的同时确定保存到哪个对话，之后登记的快照不会影响这一批
+            targets = [self._saved_name(*snapshot[:2], snapshot[3]) for snapshot in snapshots]
+        for snapshot, target in zip(snapshots, targets):
+            self._autosave(*snapshot, target=target)
+    
+    def _saved_name(self, session, history, name):
+        """上次保存的对话标识还没有写回会话、快照中仍是旧标识时，返回已保存的对话。调用方需持有self._pending_lock"""
+        saved = self._saved_names.get(session.session_id)
+        if saved is not None and saved[0] is history and saved[1] == name:
+            return saved[2]
+        return name
+    
+    def _autosave(self, session, history, messages, name, role, model, target=None):
+        original = name
+        name = name if target is None else target
         try:
-            os.remove(filepath)
-            print(f"对话已删除: {filepath}")
-            return True
+            filepath = self.store.save(messages, None, name, role=role, model=model)
         except Exception as e:
-            print(f"删除对话失败: {e}")
-            return False
+            self.autosave_errors += 1
+            logger.error("conversation.autosave", "自动保存对话失败: %s", e, session_id=session.session_id)
+            return
+        self.autosaved += 1
+        self._index_conversation(filepath, messages)
+        filename = os.path.basename(filepath)
+        
+        # 会话锁被请求占用时不等待，由下次登记或保存时写回
+        if session.lock.acquire(blocking=False):
+            try:
+                # 保存期间会话被清除或加载了其他对话时，不再关联到刚保存的对话
+                if session.messages is history and session.conversation_name in (original, filename):
+                    session.conversation_name = filename
+            finally:
+                session.lock.release()
+            with self._pending_lock:
+                # 保存期间又登记的快照中仍是旧标识，保留记录使其保存到同一个对话
+                if session.session_id in self._pending:
+                    self._saved_names[session.session_id] = (history, original, filename)
+                else:
+                    self._saved_names.pop(session.session_id, None)
+        else:
+            with self._pending_lock:
+                self._saved_names[session.session_id] = (history, original, filename)
+    
+    def _run_flusher(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.autosave_interval)
+            self._wakeup.clear()
+            self.flush_pending()
+    
+    def close(self):
+        """保存所有待保存的会话，写出尚未持久化的对话数据"""
+        if self._flusher is not None:
+            self._stop.set()
+            self._wakeup.set()
+            self._flusher.join(timeout=30)
+        self.flush_pending()
+        self.store.close()
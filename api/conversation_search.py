@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+对话全文搜索 - 以SQLite FTS5倒排索引检索已保存对话的标题和消息内容
+
+FTS5自带的分词器不会切分连续的中文，本模块在写入和查询前自行分词：中日韩文字按相邻两字切分（二元组），
+英文和数字按单词切分并转为小写。查询中连续的中文被转换为二元组短语，文档中相邻的二元组在索引中的位置也相邻，
+因此能精确匹配任意长度的中文子串，而不需要词典。单个汉字按前缀匹配二元组，由一个字符的前缀索引支持。
+结果按BM25排序（标题命中的权重更高），每个对话取得分最高的一条消息，摘要从对话存储中读取该消息生成。
+
+索引中每条消息（以及对话标题）一行，并记录消息内容的摘要值。保存对话时只比较摘要值，
+只有新增或内容变化的消息需要分词和写入，没有变化时不写入，写入量与新增内容成正比。
+最近更新的对话在内存中保留上次索引的消息列表，会话继续保存时前面的消息是同一批对象，
+按对象比较即可确定只需写入末尾新增的消息，不需要重新计算和读取整个对话的摘要值。
+FTS表不保存原文（contentless），不重复占用对话存储已有的内容。这种表不能按行删除，
+被删除或替换的消息只从消息表中移除，其倒排记录成为无效记录，查询时被过滤，重建索引时清除。
+
+消息的行号只增不减，行号越大的消息越新。计算BM25的开销与匹配的消息数成正比，常用词可能匹配大部分消息；
+匹配超过SEARCH_CANDIDATES条时，先按行号跳过较早的消息，只对最近写入的SEARCH_CANDIDATES条排序，
+查询耗时不随对话总数增长，代价是更早的、可能更相关的对话不会出现在结果中。
+"""
+
+import re
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from .logger import get_logger
+
+logger = get_logger("conversation_search")
+
+# 中日韩文字：CJK统一表意文字（含扩展A和兼容区）、平假名、片假名和韩文音节
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(f"(?P<cjk>[{_CJK}]+)|(?P<word>[^\\W_{_CJK}]+)")
+
+# 标题和消息内容在BM25中的权重
+TITLE_WEIGHT = 5.0
+BODY_WEIGHT = 1.0
+
+# 参与相关度排序的最多消息数，超出时只对最近写入的消息排序
+SEARCH_CANDIDATES = 2000
+
+# 索引表结构的版本，与数据库中的不一致时删除旧表，由ConversationManager重新建立索引
+SCHEMA_VERSION = 1
+
+# 对话标题在消息表中的序号
+TITLE_SEQ = -1
+
+# 摘要在命中位置之前和之后保留的字符数
+SNIPPET_BEFORE = 30
+SNIPPET_AFTER = 60
+
+
+def _fragments(text: str) -> List[Tuple[str, str]]:
+    """将文本切分为连续的中日韩文字和单词片段，返回 [(类型, 小写片段)]"""
+    return [(match.lastgroup, match.group().lower()) for match in _TOKEN_RE.finditer(text)]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：连续的中日韩文字切分为相邻两字的二元组（单字保持不变），单词转为小写
+
+    Args:
+        text: 原文
+
+    Returns:
+        词元列表
+    """
+    tokens = []
+    for kind, fragment in _fragments(text):
+        if kind == "cjk" and len(fragment) > 1:
+            tokens.extend(fragment[i:i + 2] for i in range(len(fragment) - 1))
+        else:
+            tokens.append(fragment)
+    return tokens
+
+
+def build_match(query: str) -> Tuple[str, List[str]]:
+    """
+    将搜索词转换为FTS5查询表达式
+
+    连续的中文转换为二元组短语，单个汉字按前缀匹配，单词精确匹配，各部分之间为AND关系。
+
+    Args:
+        query: 搜索词
+
+    Returns:
+        (FTS5查询表达式, 用于生成摘要的片段)，搜索词中没有可检索的文字时表达式为空字符串
+    """
+    terms = []
+    fragments = []
+    for kind, fragment in _fragments(query):
+        fragments.append(fragment)
+        if kind == "cjk" and len(fragment) > 1:
+            bigrams = " ".join(fragment[i:i + 2] for i in range(len(fragment) - 1))
+            terms.append(f'"{bigrams}"')
+        elif kind == "cjk":
+            terms.append(f'"{fragment}"*')
+        else:
+            terms.append(f'"{fragment}"')
+    return " ".join(terms), fragments
+
+
+def build_snippet(content: str, fragments: List[str]) -> Tuple[str, List[List[int]]]:
+    """
+    截取包含搜索词的摘要
+
+    Args:
+        content: 对话的消息内容
+        fragments: build_match()返回的片段
+
+    Returns:
+        (摘要, 搜索词在摘要中的位置 [[开始, 结束], ...])
+    """
+    if not fragments:
+        return content[:SNIPPET_BEFORE + SNIPPET_AFTER], []
+    pattern = re.compile("|".join(re.escape(fragment) for fragment in sorted(fragments, key=len, reverse=True)),
+                         re.IGNORECASE)
+    first = pattern.search(content)
+    if first is None:
+        # 只在标题中命中
+        return content[:SNIPPET_BEFORE + SNIPPET_AFTER], []
+
+    start = max(0, first.start() - SNIPPET_BEFORE)
+    end = min(len(content), first.end() + SNIPPET_AFTER)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(content) else ""
+    window = content[start:end]
+    highlights = [[match.start() + len(prefix), match.end() + len(prefix)] for match in pattern.finditer(window)]
+    return prefix + window + suffix, highlights
+
+
+def indexable_messages(messages: Iterable[Dict[str, Any]]) -> Iterator[Tuple[int, str]]:
+    """
+    列出参与搜索的消息：用户和助手消息的文本内容，系统消息（角色提示词）不参与搜索
+
+    Args:
+        messages: 对话历史列表
+
+    Returns:
+        (消息在对话历史中的序号, 消息内容) 的迭代器
+    """
+    for seq, message in enumerate(messages):
+        content = message.get("content")
+        if message.get("role") != "system" and isinstance(content, str) and content:
+            yield seq, content
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+class ConversationSearchIndex:
+    """对话全文搜索索引"""
+
+    def __init__(self, db_path: str, loader: Callable[[str], Optional[List[Dict[str, Any]]]],
+                 max_cached: int = 256):
+        """
+        初始化搜索索引
+
+        Args:
+            db_path: SQLite索引文件路径
+            loader: 按对话标识加载对话历史的函数，用于生成摘要
+            max_cached: 在内存中保留上次索引的消息列表的对话数
+
+        Raises:
+            sqlite3.OperationalError: SQLite未编译FTS5扩展
+        """
+        self.db_path = str(db_path)
+        self.loader = loader
+        self.max_cached = max_cached
+        # 对话标识 -> (标题, 上次索引的消息列表)
+        self._indexed: "OrderedDict[str, Tuple[str, List[Dict[str, Any]]]]" = OrderedDict()
+        self._indexed_lock = threading.Lock()
+        # sqlite3连接不能跨线程使用，每个线程单独打开
+        self._local = threading.local()
+
+        conn = self._get_connection()
+        # 索引可以随时从对话存储重建，表结构变化时直接删除旧表
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            for table in ("documents", "documents_fts", "conversations", "entries", "entries_fts", "state"):
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id INTEGER PRIMARY KEY, filename TEXT NOT NULL UNIQUE, timestamp INTEGER NOT NULL, "
+            "datetime TEXT NOT NULL, title TEXT NOT NULL)"
+        )
+        # AUTOINCREMENT保证行号不被复用，无效的倒排记录不会被误认为新消息
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id INTEGER NOT NULL, seq INTEGER NOT NULL, "
+            "digest BLOB NOT NULL)"
+        )
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_entries_message ON entries (conversation_id, seq)")
+        conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        created = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries_fts'").fetchone() is None
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(title, body, content='', prefix='1')")
+        if created:
+            # ORDER BY rank按该权重的BM25排序
+            conn.execute("INSERT INTO entries_fts (entries_fts, rank) VALUES ('rank', ?)",
+                         (f"bm25({TITLE_WEIGHT}, {BODY_WEIGHT})",))
+        conn.commit()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            # WAL模式下多个工作进程可以同时读，写入不阻塞读取
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _add_dead(conn: sqlite3.Connection, count: int):
+        if count:
+            conn.execute("INSERT INTO state (key, value) VALUES ('dead', ?) "
+                         "ON CONFLICT (key) DO UPDATE SET value = value + excluded.value", (count,))
+
+    def update(self, filename: str, metadata: Dict[str, Any], messages: List[Dict[str, Any]]) -> int:
+        """
+        更新一个对话的索引，只写入新增或内容变化的消息
+
+        Args:
+            filename: 对话标识
+            metadata: 对话元数据，包含timestamp、datetime和title
+            messages: 对话历史列表
+
+        Returns:
+            写入的行数（包括标题），对话没有变化时为0
+        """
+        title = metadata.get("title") or ""
+        with self._indexed_lock:
+            cached = self._indexed.get(filename)
+        start = None
+        if (cached is not None and cached[0] == title and len(messages) >= len(cached[1])
+                and all(a is b for a, b in zip(cached[1], messages))):
+            start = len(cached[1])
+
+        try:
+            written = self._write(filename, metadata, title, messages, start)
+        except sqlite3.IntegrityError:
+            # 其他进程更新过该对话，内存中的消息列表已过期，改为逐条比较摘要值
+            written = self._write(filename, metadata, title, messages, None)
+
+        with self._indexed_lock:
+            self._indexed[filename] = (title, list(messages))
+            self._indexed.move_to_end(filename)
+            while len(self._indexed) > self.max_cached:
+                self._indexed.popitem(last=False)
+        return written
+
+    def _write(self, filename: str, metadata: Dict[str, Any], title: str, messages: List[Dict[str, Any]],
+               start: Optional[int]) -> int:
+        """写入索引；start不为None时前start条消息和标题已索引且未变化，只写入之后的消息"""
+        conn = self._get_connection()
+        with conn:
+            row = conn.execute("SELECT id FROM conversations WHERE filename = ?", (filename,)).fetchone()
+            if row is None:
+                conversation_id = conn.execute(
+                    "INSERT INTO conversations (filename, timestamp, datetime, title) VALUES (?, ?, ?, ?)",
+                    (filename, metadata.get("timestamp") or 0, metadata.get("datetime") or "", title)
+                ).lastrowid
+                start = None
+                existing = {}
+            else:
+                conversation_id = row[0]
+                existing = {}
+                if start is None:
+                    existing = {seq: (entry_id, digest) for entry_id, seq, digest in conn.execute(
+                        "SELECT id, seq, digest FROM entries WHERE conversation_id = ?", (conversation_id,))}
+                    conn.execute("UPDATE conversations SET title = ? WHERE id = ? AND title != ?",
+                                 (title, conversation_id, title))
+
+            texts = {seq: content for seq, content in indexable_messages(messages) if start is None or seq >= start}
+            wanted = {seq: _digest(content) for seq, content in texts.items()}
+            if title and start is None:
+                wanted[TITLE_SEQ] = _digest(title)
+
+            # 被删除或内容变化的消息：移除消息行，倒排记录成为无效记录
+            stale = [entry_id for seq, (entry_id, digest) in existing.items() if wanted.get(seq) != digest]
+            if stale:
+                conn.executemany("DELETE FROM entries WHERE id = ?", ((entry_id,) for entry_id in stale))
+                self._add_dead(conn, len(stale))
+
+            written = 0
+            for seq, digest in wanted.items():
+                known = existing.get(seq)
+                if known is not None and known[1] == digest:
+                    continue
+                entry_id = conn.execute("INSERT INTO entries (conversation_id, seq, digest) VALUES (?, ?, ?)",
+                                        (conversation_id, seq, digest)).lastrowid
+                if seq == TITLE_SEQ:
+                    conn.execute("INSERT INTO entries_fts (rowid, title, body) VALUES (?, ?, '')",
+                                 (entry_id, " ".join(tokenize(title))))
+                else:
+                    conn.execute("INSERT INTO entries_fts (rowid, title, body) VALUES (?, '', ?)",
+                                 (entry_id, " ".join(tokenize(texts[seq]))))
+                written += 1
+        return written
+
+    def remove(self, filename: str):
+        """
+        移除一个对话的索引
+
+        Args:
+            filename: 对话标识
+        """
+        with self._indexed_lock:
+            self._indexed.pop(filename, None)
+        conn = self._get_connection()
+        with conn:
+            row = conn.execute("SELECT id FROM conversations WHERE filename = ?", (filename,)).fetchone()
+            if row is not None:
+                removed = conn.execute("DELETE FROM entries WHERE conversation_id = ?", (row[0],)).rowcount
+                conn.execute("DELETE FROM conversations WHERE id = ?", (row[0],))
+                self._add_dead(conn, removed)
+
+    def clear(self):
+        """清空索引，包括无效记录"""
+        with self._indexed_lock:
+            self._indexed.clear()
+        conn = self._get_connection()
+        with conn:
+            conn.execute("INSERT INTO entries_fts (entries_fts) VALUES ('delete-all')")
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM conversations")
+            conn.execute("DELETE FROM state")
+
+    def optimize(self):
+        """合并索引的所有段，批量写入后调用可以加快查询"""
+        conn = self._get_connection()
+        with conn:
+            conn.execute("INSERT INTO entries_fts (entries_fts) VALUES ('optimize')")
+
+    def count(self) -> int:
+        """已索引的对话数"""
+        return self._get_connection().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        索引统计
+
+        Returns:
+            包含conversations（对话数）、entries（有效的消息和标题行数）和dead（等待重建时清除的无效行数）
+        """
+        conn = self._get_connection()
+        dead = conn.execute("SELECT value FROM state WHERE key = 'dead'").fetchone()
+        return {
+            "conversations": self.count(),
+            "entries": conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+            "dead": dead[0] if dead is not None else 0
+        }
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        搜索对话
+
+        Args:
+            query: 搜索词，多个词之间为AND关系（每个词须出现在同一条消息或标题中）
+            limit: 最多返回的对话数
+
+        Returns:
+            按相关度从高到低排列的结果，每项包含filename、title、timestamp、datetime、score、
+            message_index（命中的消息在对话历史中的序号，只命中标题时为None）、
+            snippet（摘要）和highlights（搜索词在摘要中的位置）
+        """
+        match, fragments = build_match(query)
+        if not match:
+            return []
+        conn = self._get_connection()
+        # 按行号倒序跳过候选数量的匹配只读取倒排列表，比计算BM25快得多；匹配不足时从头排序
+        row = conn.execute(
+            "SELECT rowid FROM entries_fts WHERE entries_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+            (match, SEARCH_CANDIDATES - 1)
+        ).fetchone()
+        floor = row[0] if row is not None else 0
+        hits = conn.execute(
+            "SELECT e.conversation_id, e.seq, hits.rank "
+            "FROM (SELECT rowid, rank FROM entries_fts WHERE entries_fts MATCH ? AND rowid >= ?) AS hits "
+            "JOIN entries AS e ON e.id = hits.rowid ORDER BY hits.rank",
+            (match, floor)
+        )
+
+        # 每个对话只保留得分最高的一条
+        best: Dict[int, Tuple[int, float]] = {}
+        for conversation_id, seq, rank in hits:
+            if conversation_id not in best:
+                best[conversation_id] = (seq, rank)
+                if len(best) >= limit:
+                    break
+        if not best:
+            return []
+
+        ids = list(best)
+        placeholders = ", ".join("?" * len(ids))
+        metadata = {row[0]: row[1:] for row in conn.execute(
+            f"SELECT id, filename, title, timestamp, datetime FROM conversations WHERE id IN ({placeholders})", ids)}
+
+        results = []
+        for conversation_id in ids:
+            seq, rank = best[conversation_id]
+            filename, title, timestamp, datetime_str = metadata[conversation_id]
+            message_index, snippet, highlights = self._snippet(filename, seq, fragments)
+            results.append({
+                "filename": filename,
+                "title": title,
+                "timestamp": timestamp,
+                "datetime": datetime_str,
+                "score": round(-rank, 4),
+                "message_index": message_index,
+                "snippet": snippet,
+                "highlights": highlights
+            })
+        return results
+
+    def _snippet(self, filename: str, seq: int, fragments: List[str]) -> Tuple[Optional[int], str, List[List[int]]]:
+        """从对话存储读取命中的消息生成摘要；只命中标题时使用第一条包含搜索词的消息"""
+        try:
+            messages = self.loader(filename) or []
+        except Exception as e:
+            logger.error("conversation.search", "读取对话失败: %s", e, filename=filename)
+            return None, "", []
+        texts = dict(indexable_messages(messages))
+        if seq in texts:
+            return (seq,) + build_snippet(texts[seq], fragments)
+        for index, content in texts.items():
+            snippet, highlights = build_snippet(content, fragments)
+            if highlights:
+                return index, snippet, highlights
+        if texts:
+            index = next(iter(texts))
+            return (index,) + build_snippet(texts[index], fragments)
+        return None, "", []
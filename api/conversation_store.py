@@ -0,0 +1,642 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+对话存储后端 - 保存、加载、列出和删除已保存的对话
+
+json: 每个对话一个JSON文件，列表从对话目录中的元数据索引读取（见conversation_index.py）
+sqlite: 对话元数据和消息分别保存在SQLite的conversations表和messages表中，使用WAL模式，
+        多个工作进程可以同时读写；加载和列出对话都走索引，不随已保存的消息总数变慢
+journal: 每个对话一个只追加的JSONL日志文件，继续保存同一个对话时只写入新增的消息（见conversation_journal.py）
+
+json和sqlite后端使用相同的对话标识（"{时间戳}_{标题}.json"，接口中的filename字段），
+由scripts/migrate_conversations.py从JSON文件导入SQLite后，客户端保存的标识仍然有效。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import datetime
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from .conversation_index import (COLUMNS, ConversationIndex, decode_cursor, encode_cursor, matches, page_query,
+                                 read_metadata)
+from .logger import get_logger
+
+logger = get_logger("conversation_store")
+
+# 对话元数据索引的文件名，保存在对话目录中
+INDEX_FILENAME = ".index.sqlite3"
+
+# SQLite后端未指定数据库路径时，在对话目录中使用的文件名
+SQLITE_FILENAME = "conversations.sqlite3"
+
+BACKENDS = ("json", "sqlite", "journal")
+
+
+def conversation_name(timestamp: int, title: str, suffix: str = ".json") -> str:
+    """
+    生成对话标识
+
+    Args:
+        timestamp: 保存时间戳
+        title: 对话标题
+        suffix: 扩展名
+
+    Returns:
+        对话标识，JSON和日志后端中即为文件名
+    """
+    return f"{timestamp}_{title.replace(' ', '_')}{suffix}"
+
+
+def new_conversation(title: Optional[str]) -> Tuple[int, str, str]:
+    """
+    生成新保存的对话的时间戳、日期时间和标题
+
+    Args:
+        title: 对话标题，如果为空则使用时间戳
+
+    Returns:
+        (时间戳, 日期时间, 标题)
+    """
+    timestamp = int(time.time())
+    datetime_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if not title:
+        title = f"对话_{timestamp}"
+    return timestamp, datetime_str, title
+
+
+def _list_item(filename: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """将对话文件的元数据转换为列表中的一项"""
+    return {
+        "filename": filename,
+        "timestamp": metadata["timestamp"],
+        "datetime": metadata["datetime"],
+        "title": metadata["title"],
+        "message_count": metadata["message_count"],
+        "size_bytes": metadata["size_bytes"],
+        "role": metadata.get("role"),
+        "model": metadata.get("model")
+    }
+
+
+def list_indexed(index: Optional[ConversationIndex], save_dir: Path, suffix: str,
+                 reader: Callable[[Path], Dict[str, Any]], limit: Optional[int]) -> List[Dict[str, Any]]:
+    """
+    从元数据索引列出对话，索引不可用时逐个读取对话文件
+
+    Args:
+        index: 元数据索引，打开失败时为None
+        save_dir: 对话文件所在的目录
+        suffix: 对话文件的扩展名
+        reader: 解析对话文件元数据的函数
+        limit: 最多返回的条数，为None时返回全部
+
+    Returns:
+        对话列表，格式同ConversationStore.list()
+    """
+    if index is not None:
+        try:
+            return index.list(limit)
+        except Exception as e:
+            logger.error("conversation.index", "读取对话索引失败，逐个读取文件: %s", e)
+
+    conversations = []
+
+    # 遍历目录中的所有对话文件
+    for filepath in sorted(save_dir.glob(f"*{suffix}"), reverse=True):
+        try:
+            metadata = reader(filepath)
+        except Exception as e:
+            logger.error("conversation.list", "读取对话文件失败: %s, 错误: %s", filepath, e)
+            continue
+
+        conversations.append(_list_item(filepath.name, metadata))
+        if limit is not None and len(conversations) >= limit:
+            break
+
+    return conversations
+
+
+def query_indexed(index: Optional[ConversationIndex], save_dir: Path, suffix: str,
+                  reader: Callable[[Path], Dict[str, Any]], limit: int, cursor: Optional[str],
+                  filters: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    从元数据索引分页查询对话，索引不可用时逐个读取对话文件后筛选
+
+    Returns:
+        (本页的对话, 下一页的游标)
+
+    Raises:
+        ValueError: 游标无效
+    """
+    if index is not None:
+        try:
+            return index.query(limit, cursor, **filters)
+        except sqlite3.Error as e:
+            logger.error("conversation.index", "读取对话索引失败，逐个读取文件: %s", e)
+
+    position = decode_cursor(cursor) if cursor else None
+    conversations = [
+        item for item in list_indexed(None, save_dir, suffix, reader, None)
+        if matches(item, filters) and (position is None or (item["timestamp"], item["filename"]) < position)
+    ]
+    conversations.sort(key=lambda item: (item["timestamp"], item["filename"]), reverse=True)
+    page = conversations[:limit]
+    next_cursor = None
+    if len(conversations) > limit:
+        next_cursor = encode_cursor(page[-1]["timestamp"], page[-1]["filename"])
+    return page, next_cursor
+
+
+def metadata_indexed(index: Optional[ConversationIndex], save_dir: Path,
+                     reader: Callable[[Path], Dict[str, Any]], name: str) -> Optional[Dict[str, Any]]:
+    """
+    从元数据索引获取一个对话的元数据，不在索引中或索引不可用时读取对话文件
+
+    Returns:
+        格式同ConversationStore.list()中的一项，对话不存在时返回None
+    """
+    filename = os.path.basename(name)
+    if index is not None:
+        try:
+            item = index.get(filename)
+            if item is not None:
+                return item
+        except sqlite3.Error as e:
+            logger.error("conversation.index", "读取对话索引失败，读取文件: %s", e)
+
+    filepath = save_dir / filename
+    if not filepath.exists():
+        return None
+    try:
+        return _list_item(filename, reader(filepath))
+    except Exception as e:
+        logger.error("conversation.list", "读取对话文件失败: %s, 错误: %s", filepath, e)
+        return None
+
+
+class ConversationStore:
+    """对话存储后端的接口"""
+
+    backend = ""
+    # 是否支持继续保存到已有的对话（save的name参数）
+    continues = False
+
+    def save(self, messages: List[Dict[str, Any]], title: Optional[str] = None, name: Optional[str] = None,
+             role: Optional[str] = None, model: Optional[str] = None) -> str:
+        """
+        保存对话
+
+        Args:
+            messages: 对话历史列表
+            title: 对话标题，如果为空则使用时间戳
+            name: 之前保存的对话标识，支持继续保存的后端（journal）只写入与之相比变化的消息；
+                  其他后端忽略此参数，每次保存为新的对话
+            role: 对话使用的角色，用于筛选
+            model: 对话最近使用的模型，用于筛选
+
+        Returns:
+            JSON和日志后端为保存的文件路径，SQLite后端为对话标识
+        """
+        raise NotImplementedError
+
+    def load(self, name: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        加载对话
+
+        Args:
+            name: 对话标识（JSON后端也可以是文件路径）
+
+        Returns:
+            对话历史列表，对话不存在或无法读取时返回None
+        """
+        raise NotImplementedError
+
+    def list(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        按保存时间从新到旧列出对话
+
+        Args:
+            limit: 最多返回的条数，为None时返回全部
+
+        Returns:
+            对话列表，每个对话包含filename、timestamp、datetime、title、message_count、size_bytes、role和model
+        """
+        raise NotImplementedError
+
+    def query(self, limit: int, cursor: Optional[str] = None,
+              **filters: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        按保存时间从新到旧分页查询对话
+
+        Args:
+            limit: 页大小
+            cursor: 上一页返回的游标，为空时从第一页开始
+            filters: 筛选条件，见conversation_index.FILTERS
+
+        Returns:
+            (本页的对话, 下一页的游标)，没有下一页时游标为None
+
+        Raises:
+            ValueError: 游标无效
+        """
+        raise NotImplementedError
+
+    def metadata(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        获取一个对话的元数据
+
+        Args:
+            name: 对话标识（也可以是save()返回的文件路径）
+
+        Returns:
+            格式同list()中的一项，对话不存在时返回None
+        """
+        raise NotImplementedError
+
+    def delete(self, name: str) -> bool:
+        """
+        删除对话
+
+        Args:
+            name: 对话标识（JSON后端也可以是文件路径）
+
+        Returns:
+            是否成功删除
+        """
+        raise NotImplementedError
+
+    def rebuild_index(self) -> Optional[Dict[str, int]]:
+        """
+        重建对话列表使用的元数据
+
+        Returns:
+            统计信息，包含added、updated、removed、failed和total；不可用时返回None
+        """
+        return None
+
+    def close(self):
+        """写出尚未持久化的数据，释放后台资源"""
+
+
+class JsonConversationStore(ConversationStore):
+    """每个对话一个JSON文件"""
+
+    backend = "json"
+
+    def __init__(self, save_dir: Path):
+        """
+        Args:
+            save_dir: 保存对话文件的目录
+        """
+        self.save_dir = Path(save_dir)
+
+        # 打开元数据索引，并补上索引之外新增、修改或删除的文件
+        self.index = None
+        try:
+            self.index = ConversationIndex(self.save_dir / INDEX_FILENAME, self.save_dir)
+            self.index.sync()
+        except Exception as e:
+            logger.error("conversation.index", "打开对话索引失败，列出对话时将逐个读取文件: %s", e)
+            self.index = None
+
+    def _path(self, name: str) -> Path:
+        # 如果提供的是文件名而不是完整路径，则构建完整路径
+        if not os.path.isabs(name):
+            return self.save_dir / name
+        return Path(name)
+
+    def save(self, messages: List[Dict[str, Any]], title: Optional[str] = None, name: Optional[str] = None,
+             role: Optional[str] = None, model: Optional[str] = None) -> str:
+        timestamp, datetime_str, title = new_conversation(title)
+        filename = conversation_name(timestamp, title)
+        filepath = self.save_dir / filename
+
+        # 构建保存的数据
+        data = {
+            "timestamp": timestamp,
+            "datetime": datetime_str,
+            "title": title,
+            "role": role,
+            "model": model,
+            "messages": messages
+        }
+
+        # 保存到文件
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+        # 更新索引，元数据直接取自内存中的数据，不需要重新解析文件
+        if self.index is not None:
+            stat = filepath.stat()
+            try:
+                self.index.upsert(filename, {
+                    "timestamp": timestamp,
+                    "datetime": datetime_str,
+                    "title": title,
+                    "message_count": len(messages),
+                    "size_bytes": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "role": role,
+                    "model": model
+                })
+            except Exception as e:
+                logger.error("conversation.index", "更新对话索引失败: %s", e)
+
+        logger.info("conversation.save", "对话已保存到: %s", filepath)
+        return str(filepath)
+
+    def load(self, name: str) -> Optional[List[Dict[str, Any]]]:
+        filepath = self._path(name)
+
+        # 检查文件是否存在
+        if not filepath.exists():
+            logger.warning("conversation.not_found", "文件不存在: %s", filepath)
+            return None
+
+        # 从文件加载数据
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data.get("messages", [])
+        except Exception as e:
+            logger.error("conversation.load", "加载对话失败: %s", e)
+            return None
+
+    def list(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return list_indexed(self.index, self.save_dir, ".json", read_metadata, limit)
+
+    def query(self, limit: int, cursor: Optional[str] = None,
+              **filters: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        return query_indexed(self.index, self.save_dir, ".json", read_metadata, limit, cursor, filters)
+
+    def metadata(self, name: str) -> Optional[Dict[str, Any]]:
+        return metadata_indexed(self.index, self.save_dir, read_metadata, name)
+
+    def delete(self, name: str) -> bool:
+        filepath = self._path(name)
+
+        # 检查文件是否存在
+        if not filepath.exists():
+            logger.warning("conversation.not_found", "文件不存在: %s", filepath)
+            return False
+
+        # 删除文件
+        try:
+            os.remove(filepath)
+            if self.index is not None:
+                self.index.remove(filepath.name)
+            logger.info("conversation.delete", "对话已删除: %s", filepath)
+            return True
+        except Exception as e:
+            logger.error("conversation.delete", "删除对话失败: %s", e)
+            return False
+
+    def rebuild_index(self) -> Optional[Dict[str, int]]:
+        if self.index is None:
+            return None
+        return self.index.rebuild()
+
+
+# 消息中单独成列的字段，其余字段以JSON保存在extra列中
+_MESSAGE_COLUMNS = ("role", "content")
+
+class SQLiteConversationStore(ConversationStore):
+    """对话保存在SQLite中，conversations表保存元数据，messages表每条消息一行"""
+
+    backend = "sqlite"
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: SQLite数据库路径
+        """
+        self.db_path = str(db_path)
+        # sqlite3连接不能跨线程使用，每个线程单独打开
+        self._local = threading.local()
+
+        conn = self._get_connection()
+        with self._transaction(conn):
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, timestamp INTEGER NOT NULL, "
+                "datetime TEXT NOT NULL, title TEXT NOT NULL, message_count INTEGER NOT NULL, "
+                "size_bytes INTEGER NOT NULL, role TEXT, model TEXT)"
+            )
+            # 早期版本的数据库没有role和model列
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}
+            for column in ("role", "model"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE conversations ADD COLUMN {column} TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_time ON conversations (timestamp DESC, name DESC)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_title ON conversations (title)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_model "
+                         "ON conversations (model, timestamp DESC, name DESC)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_role "
+                         "ON conversations (role, timestamp DESC, name DESC)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "conversation_id INTEGER NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT, extra TEXT, "
+                "PRIMARY KEY (conversation_id, seq)) WITHOUT ROWID"
+            )
+
+    def _get_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 事务由_transaction显式开始，语句按SQL文本缓存预编译结果
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, cached_statements=256)
+            # WAL模式下多个工作进程可以同时读，写入不阻塞读取
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self, conn: sqlite3.Connection):
+        """
+        写事务，开始时即取得写锁
+
+        先查询再写入的事务如果以DEFERRED开始，两个进程可能同时持有读锁而都无法升级为写锁。
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _message_row(conversation_id: int, seq: int, message: Dict[str, Any]) -> tuple:
+        content = message.get("content")
+        extra = {key: value for key, value in message.items() if key not in _MESSAGE_COLUMNS}
+        if content is not None and not isinstance(content, str):
+            # 多模态等非文本内容整体放在extra中
+            extra["content"] = content
+            content = None
+        return (conversation_id, seq, message.get("role", ""), content,
+                json.dumps(extra, ensure_ascii=False) if extra else None)
+
+    def _write(self, conn: sqlite3.Connection, name: str, timestamp: int, datetime_str: str, title: str,
+               messages: List[Dict[str, Any]], role: Optional[str] = None, model: Optional[str] = None):
+        """在当前事务中写入一个对话，同名的对话被覆盖"""
+        size_bytes = len(json.dumps(messages, ensure_ascii=False).encode("utf-8"))
+        row = conn.execute("SELECT id FROM conversations WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            conversation_id = conn.execute(
+                "INSERT INTO conversations (name, timestamp, datetime, title, message_count, size_bytes, role, model) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, timestamp, datetime_str, title, len(messages), size_bytes, role, model)
+            ).lastrowid
+        else:
+            conversation_id = row[0]
+            conn.execute(
+                "UPDATE conversations SET timestamp = ?, datetime = ?, title = ?, message_count = ?, size_bytes = ?, "
+                "role = ?, model = ? WHERE id = ?",
+                (timestamp, datetime_str, title, len(messages), size_bytes, role, model, conversation_id)
+            )
+            conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, seq, role, content, extra) VALUES (?, ?, ?, ?, ?)",
+            (self._message_row(conversation_id, seq, message) for seq, message in enumerate(messages))
+        )
+
+    def save(self, messages: List[Dict[str, Any]], title: Optional[str] = None, name: Optional[str] = None,
+             role: Optional[str] = None, model: Optional[str] = None) -> str:
+        timestamp, datetime_str, title = new_conversation(title)
+        name = conversation_name(timestamp, title)
+        conn = self._get_connection()
+        with self._transaction(conn):
+            self._write(conn, name, timestamp, datetime_str, title, messages, role, model)
+        logger.info("conversation.save", "对话已保存: %s", name, messages=len(messages))
+        return name
+
+    def import_conversations(self, conversations: Iterable[Tuple[str, Dict[str, Any]]],
+                             overwrite: bool = False) -> Dict[str, int]:
+        """
+        在一个事务中导入多个对话，保留原来的标识、时间戳和标题
+
+        Args:
+            conversations: (对话标识, 对话数据) 序列，对话数据的格式与JSON后端的文件相同
+            overwrite: 是否覆盖已存在的同名对话
+
+        Returns:
+            统计信息，包含imported和skipped
+        """
+        stats = {"imported": 0, "skipped": 0}
+        conn = self._get_connection()
+        with self._transaction(conn):
+            for name, data in conversations:
+                if not overwrite and conn.execute(
+                        "SELECT 1 FROM conversations WHERE name = ?", (name,)).fetchone() is not None:
+                    stats["skipped"] += 1
+                    continue
+                self._write(conn, name, data.get("timestamp", 0), data.get("datetime", ""), data.get("title", ""),
+                            data.get("messages") or [], data.get("role"), data.get("model"))
+                stats["imported"] += 1
+        return stats
+
+    def load(self, name: str) -> Optional[List[Dict[str, Any]]]:
+        name = os.path.basename(name)
+        try:
+            conn = self._get_connection()
+            row = conn.execute("SELECT id FROM conversations WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                logger.warning("conversation.not_found", "对话不存在: %s", name)
+                return None
+            rows = conn.execute(
+                "SELECT role, content, extra FROM messages WHERE conversation_id = ? ORDER BY seq", (row[0],)
+            ).fetchall()
+        except Exception as e:
+            logger.error("conversation.load", "加载对话失败: %s", e)
+            return None
+
+        messages = []
+        for role, content, extra in rows:
+            message = {"role": role}
+            if content is not None:
+                message["content"] = content
+            if extra:
+                message.update(json.loads(extra))
+            messages.append(message)
+        return messages
+
+    def list(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        query = ("SELECT name, timestamp, datetime, title, message_count, size_bytes, role, model FROM conversations "
+                 "ORDER BY timestamp DESC, name DESC")
+        params: tuple = ()
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (limit,)
+        rows = self._get_connection().execute(query, params).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def query(self, limit: int, cursor: Optional[str] = None,
+              **filters: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        return page_query(self._get_connection(), "conversations", "name", limit, cursor, **filters)
+
+    def metadata(self, name: str) -> Optional[Dict[str, Any]]:
+        row = self._get_connection().execute(
+            "SELECT name, timestamp, datetime, title, message_count, size_bytes, role, model FROM conversations "
+            "WHERE name = ?", (os.path.basename(name),)
+        ).fetchone()
+        return dict(zip(COLUMNS, row)) if row is not None else None
+
+    def delete(self, name: str) -> bool:
+        name = os.path.basename(name)
+        try:
+            conn = self._get_connection()
+            with self._transaction(conn):
+                row = conn.execute("SELECT id FROM conversations WHERE name = ?", (name,)).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM messages WHERE conversation_id = ?", (row[0],))
+                    conn.execute("DELETE FROM conversations WHERE id = ?", (row[0],))
+        except Exception as e:
+            logger.error("conversation.delete", "删除对话失败: %s", e)
+            return False
+        if row is None:
+            logger.warning("conversation.not_found", "对话不存在: %s", name)
+            return False
+        logger.info("conversation.delete", "对话已删除: %s", name)
+        return True
+
+    def rebuild_index(self) -> Optional[Dict[str, int]]:
+        # 元数据与消息在同一个事务中写入，只需按messages表校正消息数
+        conn = self._get_connection()
+        with self._transaction(conn):
+            updated = conn.execute(
+                "UPDATE conversations SET message_count = "
+                "(SELECT COUNT(*) FROM messages WHERE conversation_id = conversations.id) "
+                "WHERE message_count != (SELECT COUNT(*) FROM messages WHERE conversation_id = conversations.id)"
+            ).rowcount
+            total = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        return {"added": 0, "updated": updated, "removed": 0, "failed": 0, "total": total}
+
+
+def create_conversation_store(backend: str, save_dir: Path, sqlite_path: Optional[str] = None,
+                              fsync_interval: float = 1.0, compact_ratio: float = 1.0) -> ConversationStore:
+    """
+    按配置创建对话存储后端
+
+    Args:
+        backend: json、sqlite或journal
+        save_dir: 对话目录
+        sqlite_path: SQLite数据库路径，为空时使用对话目录中的conversations.sqlite3
+        fsync_interval: 日志后端统一fsync的间隔（秒），为0时每次追加后立即fsync
+        compact_ratio: 日志后端中无效记录超过有效记录的多少倍时压缩
+
+    Returns:
+        对话存储后端
+    """
+    if backend == "sqlite":
+        return SQLiteConversationStore(sqlite_path or Path(save_dir) / SQLITE_FILENAME)
+    if backend == "journal":
+        from .conversation_journal import JournalConversationStore
+        return JournalConversationStore(save_dir, fsync_interval=fsync_interval, compact_ratio=compact_ratio)
+    if backend != "json":
+        logger.warning("conversation.init", "未知的对话存储后端 %s，使用json", backend)
+    return JsonConversationStore(save_dir)
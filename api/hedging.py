@@ -0,0 +1,467 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求对冲（hedging） - 上游请求超过近期延迟的指定分位数仍未返回时，再发送一个备份请求，采用先成功的结果
+
+非流式请求按完整回复的延迟、流式请求按首个数据块的延迟统计分位数，样本不足时不对冲。
+备份请求发送到同一模型，或按配置发送到备用模型。备份请求受预算限制：每个请求积累budget_ratio个令牌
+（最多积累burst个），每次对冲消耗一个，对冲的请求长期不超过budget_ratio的比例，上游流量不会翻倍。
+
+配置了准入控制时，备份请求不排队地取得备份模型的并发名额，没有空闲名额时不对冲，对冲不会让模型超过其并发上限。
+
+落败的请求会被取消：协程版直接取消任务并关闭连接；线程版的流式请求在收到下一个数据块时关闭连接，
+非流式请求无法中断阻塞中的HTTP调用，只丢弃其结果。
+"""
+
+import time
+import queue
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from .admission import AdmissionController
+from .metrics import HEDGED_REQUESTS, HEDGES_THROTTLED
+from .logger import get_logger
+
+logger = get_logger("hedging")
+
+
+def _failed(event: Any) -> bool:
+    """回复或流式事件是否表示请求失败"""
+    if isinstance(event, BaseException):
+        return True
+    return bool(event.get("fallback")) and event.get("type", "done") == "done"
+
+
+def _noop():
+    pass
+
+
+def _spawn(fn: Callable[..., Any], *args) -> Future:
+    """在新线程中执行函数"""
+    future: Future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="hedge", daemon=True).start()
+    return future
+
+
+class Hedger:
+    """请求对冲策略，线程版和协程版共用延迟统计和预算"""
+
+    def __init__(self, percentile: float = 95, min_samples: int = 20, window: int = 200,
+                 budget_ratio: float = 0.05, burst: int = 10, backup_models: Optional[Dict[str, str]] = None,
+                 admission: Optional[AdmissionController] = None):
+        """
+        初始化请求对冲
+
+        Args:
+            percentile: 触发对冲的延迟分位数（0-100）
+            min_samples: 开始对冲前每个模型至少需要的延迟样本数
+            window: 每个模型保留的最近延迟样本数
+            budget_ratio: 对冲请求占全部请求的比例上限
+            burst: 最多积累的对冲令牌数，允许短时间内集中对冲
+            backup_models: 备份请求使用的备用模型，如 {"gpt-4": "gpt-4o"}，未配置时发送到同一模型
+            admission: 可选的准入控制，备份请求需要取得空闲的并发名额
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.budget_ratio = budget_ratio
+        self.burst = burst
+        self.backup_models = backup_models or {}
+        self.admission = admission
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "hedged": 0, "primary_wins": 0, "backup_wins": 0,
+                          "both_failed": 0, "throttled": 0, "no_slot": 0}
+
+    def delay(self, model: str, mode: str) -> Optional[float]:
+        """
+        获取触发对冲的等待时间
+
+        Args:
+            model: 模型ID
+            mode: "chat"或"stream"
+
+        Returns:
+            近期延迟的分位数（秒），样本不足时返回None
+        """
+        with self._lock:
+            samples = self._latencies.get((model, mode))
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+    def observe(self, model: str, mode: str, latency: float):
+        """记录一次成功请求的延迟，流式请求为首个数据块的延迟"""
+        with self._lock:
+            samples = self._latencies.get((model, mode))
+            if samples is None:
+                samples = self._latencies[(model, mode)] = deque(maxlen=self.window)
+            samples.append(latency)
+
+    def backup_model(self, model: str) -> str:
+        """获取备份请求使用的模型"""
+        return self.backup_models.get(model, model)
+
+    def _begin(self):
+        """记录一个新请求，积累对冲预算"""
+        with self._lock:
+            self._counters["requests"] += 1
+            self._tokens = min(float(self.burst), self._tokens + self.budget_ratio)
+
+    def _take_budget(self, model: str, mode: str) -> Optional[Callable[[], None]]:
+        """
+        取得备份模型的并发名额并消耗一个对冲令牌
+
+        Returns:
+            备份请求结束时调用的释放名额的函数，没有空闲名额或预算用完时返回None
+        """
+        ticket = None
+        if self.admission is not None:
+            ticket = self.admission.try_acquire(self.backup_model(model))
+            if ticket is None:
+                with self._lock:
+                    self._counters["no_slot"] += 1
+                HEDGES_THROTTLED.inc(model=model, mode=mode)
+                return None
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self._counters["hedged"] += 1
+                return ticket.release if ticket is not None else _noop
+            self._counters["throttled"] += 1
+        if ticket is not None:
+            ticket.release()
+        HEDGES_THROTTLED.inc(model=model, mode=mode)
+        return None
+
+    def _record(self, model: str, mode: str, winner: str):
+        """记录对冲的结果，winner为primary、backup或none（都失败）"""
+        counter = {"primary": "primary_wins", "backup": "backup_wins", "none": "both_failed"}[winner]
+        with self._lock:
+            self._counters[counter] += 1
+        HEDGED_REQUESTS.inc(model=model, mode=mode, winner=winner)
+        logger.info("hedge.finished", "对冲请求完成", model=model, mode=mode, winner=winner)
+
+    def _log_start(self, model: str, mode: str, delay: float):
+        logger.info("hedge.start", "请求超过延迟阈值，发送备份请求", model=model, mode=mode,
+                    backup_model=self.backup_model(model), threshold=f"{delay:.2f}s")
+
+    def call(self, model: str, fn: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        线程版：发送非流式请求，超过延迟阈值仍未返回时对冲
+
+        Args:
+            model: 模型ID
+            fn: 向指定模型发送请求的函数，失败时返回带fallback标记的提示回复
+
+        Returns:
+            先成功返回的回复，都失败时返回主请求的回复
+        """
+        self._begin()
+        start = time.monotonic()
+        delay = self.delay(model, "chat")
+        if delay is None:
+            result = fn(model)
+        else:
+            primary = _spawn(fn, model)
+            try:
+                result = primary.result(timeout=delay)
+            except FutureTimeoutError:
+                result = self._race(model, fn, primary, delay)
+        if not result.get("fallback"):
+            self.observe(model, "chat", time.monotonic() - start)
+        return result
+
+    def _race(self, model: str, fn: Callable[[str], Dict[str, Any]], primary: Future, delay: float) -> Dict[str, Any]:
+        release = self._take_budget(model, "chat")
+        if release is None:
+            return primary.result()
+        self._log_start(model, "chat", delay)
+        backup = _spawn(fn, self.backup_model(model))
+        backup.add_done_callback(lambda _: release())
+        roles = {primary: "primary", backup: "backup"}
+        pending = set(roles)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and not _failed(future.result()):
+                    # 线程中阻塞的HTTP调用无法中断，落败请求的结果被丢弃
+                    self._record(model, "chat", roles[future])
+                    return future.result()
+        self._record(model, "chat", "none")
+        return primary.result() if primary.exception() is None else backup.result()
+
+    def stream(self, model: str, fn: Callable[[str], Iterator[Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+        """
+        线程版：发送流式请求，超过首个数据块的延迟阈值时对冲
+
+        Args:
+            model: 模型ID
+            fn: 向指定模型发送流式请求的函数，返回事件迭代器，最后一个事件的type为"done"
+
+        Yields:
+            先返回内容的请求的事件
+        """
+        self._begin()
+        start = time.monotonic()
+        delay = self.delay(model, "stream")
+        if delay is None:
+            yield from self._observed(model, fn(model), start)
+            return
+
+        events: "queue.Queue" = queue.Queue()
+        pumps = {"primary": _Pump("primary", fn, model, events)}
+        race = _StreamRace(self, model, start)
+        deadline: Optional[float] = start + delay
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    role, event = events.get(timeout=timeout)
+                except queue.Empty:
+                    deadline = None
+                    release = self._take_budget(model, "stream")
+                    if release is not None:
+                        self._log_start(model, "stream", delay)
+                        pumps["backup"] = _Pump("backup", fn, self.backup_model(model), events, release)
+                        race.roles.append("backup")
+                    continue
+
+                event = race.pick(role, event)
+                if race.winner is not None:
+                    deadline = None
+                    for other, pump in pumps.items():
+                        if other != race.winner:
+                            pump.cancel()
+                if event is None:
+                    continue
+                if isinstance(event, BaseException):
+                    raise event
+                yield event
+                if event["type"] == "done":
+                    return
+        finally:
+            for pump in pumps.values():
+                pump.cancel()
+
+    def _observed(self, model: str, events: Iterator[Dict[str, Any]], start: float) -> Iterator[Dict[str, Any]]:
+        """转发事件并记录首个数据块的延迟"""
+        first = True
+        try:
+            for event in events:
+                if first and event["type"] != "done":
+                    first = False
+                    self.observe(model, "stream", time.monotonic() - start)
+                yield event
+        finally:
+            if hasattr(events, "close"):
+                events.close()
+
+    async def acall(self, model: str, fn: Callable[[str], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """协程版call，落败的请求被取消"""
+        self._begin()
+        start = time.monotonic()
+        delay = self.delay(model, "chat")
+        if delay is None:
+            result = await fn(model)
+        else:
+            primary = asyncio.ensure_future(fn(model))
+            try:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+            except asyncio.CancelledError:
+                primary.cancel()
+                raise
+            result = primary.result() if done else await self._arace(model, fn, primary, delay)
+        if not result.get("fallback"):
+            self.observe(model, "chat", time.monotonic() - start)
+        return result
+
+    async def _arace(self, model: str, fn: Callable[[str], Awaitable[Dict[str, Any]]],
+                     primary: "asyncio.Future", delay: float) -> Dict[str, Any]:
+        release = self._take_budget(model, "chat")
+        if release is None:
+            return await primary
+        self._log_start(model, "chat", delay)
+        backup = asyncio.ensure_future(fn(self.backup_model(model)))
+        # 任务被取消时也会回调，未开始执行就被取消的任务同样释放名额
+        backup.add_done_callback(lambda _: release())
+        roles = {primary: "primary", backup: "backup"}
+        pending = set(roles)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and not _failed(task.result()):
+                        self._record(model, "chat", roles[task])
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        self._record(model, "chat", "none")
+        return primary.result() if primary.exception() is None else backup.result()
+
+    async def astream(self, model: str, fn: Callable[[str], AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+        """协程版stream，落败的请求被取消"""
+        self._begin()
+        start = time.monotonic()
+        delay = self.delay(model, "stream")
+        if delay is None:
+            upstream = fn(model)
+            first = True
+            try:
+                async for event in upstream:
+                    if first and event["type"] != "done":
+                        first = False
+                        self.observe(model, "stream", time.monotonic() - start)
+                    yield event
+            finally:
+                await upstream.aclose()
+            return
+
+        events: "asyncio.Queue" = asyncio.Queue()
+        pumps = {"primary": asyncio.ensure_future(_apump("primary", fn(model), events))}
+        race = _StreamRace(self, model, start)
+        deadline: Optional[float] = start + delay
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    role, event = await asyncio.wait_for(events.get(), timeout)
+                except asyncio.TimeoutError:
+                    deadline = None
+                    release = self._take_budget(model, "stream")
+                    if release is not None:
+                        self._log_start(model, "stream", delay)
+                        pumps["backup"] = asyncio.ensure_future(
+                            _apump("backup", fn(self.backup_model(model)), events))
+                        pumps["backup"].add_done_callback(lambda _: release())
+                        race.roles.append("backup")
+                    continue
+
+                event = race.pick(role, event)
+                if race.winner is not None:
+                    deadline = None
+                    for other, pump in pumps.items():
+                        if other != race.winner:
+                            pump.cancel()
+                if event is None:
+                    continue
+                if isinstance(event, BaseException):
+                    raise event
+                yield event
+                if event["type"] == "done":
+                    return
+        finally:
+            for pump in pumps.values():
+                pump.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取对冲统计信息和各模型当前的触发阈值"""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["budget_tokens"] = round(self._tokens, 3)
+            keys = list(self._latencies)
+        stats["backup_win_rate"] = round(stats["backup_wins"] / stats["hedged"], 4) if stats["hedged"] else None
+        thresholds = {}
+        for model, mode in keys:
+            delay = self.delay(model, mode)
+            if delay is not None:
+                thresholds.setdefault(model, {})[mode] = round(delay, 3)
+        stats["thresholds"] = thresholds
+        return stats
+
+
+class _StreamRace:
+    """流式对冲的状态：先返回内容的请求获胜，失败的请求在另一个请求仍在进行时被忽略"""
+
+    def __init__(self, hedger: Hedger, model: str, start: float):
+        self.hedger = hedger
+        self.model = model
+        self.start = start
+        self.roles: List[str] = ["primary"]
+        self.winner: Optional[str] = None
+        self.failed: Dict[str, Any] = {}
+
+    def pick(self, role: str, event: Any) -> Any:
+        """
+        处理一个请求的事件
+
+        Returns:
+            要转发给调用方的事件或异常，不转发时返回None
+        """
+        if self.winner is None:
+            if _failed(event):
+                self.failed[role] = event
+                if len(self.failed) < len(self.roles):
+                    return None
+                # 所有请求都失败，以主请求的结果为准
+                self.winner = "primary"
+                if len(self.roles) > 1:
+                    self.hedger._record(self.model, "stream", "none")
+                return self.failed["primary"]
+            self.winner = role
+            if len(self.roles) > 1:
+                self.hedger._record(self.model, "stream", role)
+            if event["type"] != "done":
+                self.hedger.observe(self.model, "stream", time.monotonic() - self.start)
+        return event if role == self.winner else None
+
+
+class _Pump:
+    """在后台线程中读取一个流式请求的事件"""
+
+    def __init__(self, role: str, fn: Callable[[str], Iterator[Dict[str, Any]]], model: str, out: "queue.Queue",
+                 on_exit: Callable[[], None] = _noop):
+        self.role = role
+        self._on_exit = on_exit
+        self._cancelled = threading.Event()
+        threading.Thread(target=self._run, args=(fn, model, out), name=f"hedge-{role}", daemon=True).start()
+
+    def cancel(self):
+        """停止读取，收到下一个数据块时关闭上游连接"""
+        self._cancelled.set()
+
+    def _run(self, fn: Callable[[str], Iterator[Dict[str, Any]]], model: str, out: "queue.Queue"):
+        upstream = None
+        try:
+            upstream = fn(model)
+            for event in upstream:
+                if self._cancelled.is_set():
+                    break
+                out.put((self.role, event))
+        except Exception as e:
+            out.put((self.role, e))
+        finally:
+            try:
+                if upstream is not None and hasattr(upstream, "close"):
+                    upstream.close()
+            finally:
+                self._on_exit()
+
+
+async def _apump(role: str, upstream: AsyncIterator[Dict[str, Any]], out: "asyncio.Queue"):
+    """读取一个流式请求的事件，任务被取消时关闭上游连接"""
+    try:
+        async for event in upstream:
+            out.put_nowait((role, event))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        out.put_nowait((role, e))
+    finally:
+        await upstream.aclose()
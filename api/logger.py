@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+结构化日志 - 基于标准库logging，由后台线程格式化并写出
+
+请求线程只做级别判断、采样和入队：日志记录不在请求线程中格式化，
+用lazy()包装的字段只在记录真正写出时才在后台线程中计算，适合json.dumps等开销较大的内容。
+队列写满时丢弃新记录并计数，不阻塞请求线程。
+"""
+
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+import logging.handlers
+from typing import Any, Callable, Dict, Optional
+
+# 本项目日志记录器的公共前缀，mcp包等使用标准库logging的模块同样通过根记录器写出
+ROOT_LOGGER_NAME = "ai_agent"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["_DroppingQueueHandler"] = None
+_sample_rates: Dict[str, float] = {}
+_setup_lock = threading.Lock()
+
+
+class lazy:
+    """延迟计算的日志字段，只有记录被写出时才调用函数"""
+
+    __slots__ = ("fn",)
+
+    def __init__(self, fn: Callable[[], Any]):
+        self.fn = fn
+
+    def __str__(self) -> str:
+        try:
+            return str(self.fn())
+        except Exception as e:
+            return f"<计算日志字段失败: {e}>"
+
+
+def _resolve(value: Any) -> Any:
+    return str(value) if isinstance(value, lazy) else value
+
+
+class StructuredFormatter(logging.Formatter):
+    """输出带事件名和字段的日志，format为text时输出key=value，为json时每行一个JSON对象"""
+
+    def __init__(self, output_format: str = "text"):
+        super().__init__()
+        self.output_format = output_format
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {key: _resolve(value) for key, value in (getattr(record, "fields", None) or {}).items()}
+        event = getattr(record, "event", None)
+        message = record.getMessage()
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}"
+
+        if self.output_format == "json":
+            data = {"ts": timestamp, "level": record.levelname, "logger": record.name}
+            if event:
+                data["event"] = event
+            data["msg"] = message
+            data.update(fields)
+            if record.exc_info:
+                data["exc_info"] = self.formatException(record.exc_info)
+            return json.dumps(data, ensure_ascii=False, default=str)
+
+        parts = [timestamp, record.levelname, record.name]
+        if event:
+            parts.append(event)
+        parts.append(message)
+        parts.extend(f"{key}={value}" for key, value in fields.items())
+        line = " ".join(parts)
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """不在调用线程中格式化记录，队列已满时丢弃"""
+
+    def __init__(self, log_queue: "queue.Queue"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 默认实现会在调用线程中格式化消息，这里原样入队，由后台线程格式化
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructuredLogger:
+    """带事件名、字段和采样的日志记录器"""
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+    def isEnabledFor(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level: int, event: str, message: str, args: tuple, fields: Dict[str, Any], exc_info=None):
+        if not self._logger.isEnabledFor(level):
+            return
+        # 警告及以上级别的记录不采样
+        if level < logging.WARNING:
+            rate = _sample_rates.get(event)
+            if rate is not None and random.random() >= rate:
+                return
+        if exc_info:
+            exc_info = sys.exc_info()
+        # 直接构造记录，跳过Logger._log中查找调用位置的栈回溯
+        record = self._logger.makeRecord(self._logger.name, level, "(unknown file)", 0, message, args, exc_info,
+                                         extra={"event": event, "fields": fields})
+        self._logger.handle(record)
+
+    def debug(self, event: str, message: str, *args, **fields):
+        self._log(logging.DEBUG, event, message, args, fields)
+
+    def info(self, event: str, message: str, *args, **fields):
+        self._log(logging.INFO, event, message, args, fields)
+
+    def warning(self, event: str, message: str, *args, **fields):
+        self._log(logging.WARNING, event, message, args, fields)
+
+    def error(self, event: str, message: str, *args, **fields):
+        self._log(logging.ERROR, event, message, args, fields)
+
+    def exception(self, event: str, message: str, *args, **fields):
+        """记录错误和当前异常的堆栈"""
+        self._log(logging.ERROR, event, message, args, fields, exc_info=True)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    """
+    获取结构化日志记录器
+
+    Args:
+        name: 模块名，如"api_server"
+
+    Returns:
+        日志记录器
+    """
+    return StructuredLogger(name)
+
+
+def setup_logging(level: str = "INFO", output_format: str = "text", queue_size: int = 10000,
+                  sample_rates: Optional[Dict[str, float]] = None, stream=None):
+    """
+    配置日志：根记录器的记录经有界队列交给后台线程写出，重复调用时只更新级别和采样率
+
+    Args:
+        level: 日志级别
+        output_format: "text"或"json"
+        queue_size: 队列长度，写满后丢弃新记录
+        sample_rates: 按事件名设置的采样率（0-1），只对INFO及以下级别生效
+        stream: 输出流，默认为标准输出
+    """
+    global _listener, _handler, _sample_rates
+
+    with _setup_lock:
+        _sample_rates = dict(sample_rates or {})
+        root = logging.getLogger()
+        root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+        if _listener is not None:
+            return
+
+        log_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(StructuredFormatter(output_format))
+
+        # 替换已有的处理器（如其他模块调用basicConfig添加的同步输出）
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        _handler = _DroppingQueueHandler(log_queue)
+        root.addHandler(_handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """写出队列中剩余的记录并停止后台线程"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            root = logging.getLogger()
+            if _handler is not None:
+                root.removeHandler(_handler)
+
+
+def get_dropped_count() -> int:
+    """获取因队列已满被丢弃的记录数"""
+    return _handler.dropped if _handler is not None else 0
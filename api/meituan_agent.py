@@ -7,66 +7,172 @@
 
 import os
 import json
+import math
 import requests
 import time
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Iterator, Optional
 from . import config
+from .response_cache import ResponseCache, make_cache_key
+from .single_flight import SingleFlight
+from .hedging import Hedger
+from .resilience import CircuitBreakers, RetryPolicy, parse_retry_after
+from .metrics import (UPSTREAM_REQUESTS, UPSTREAM_SECONDS, UPSTREAM_TTFT_SECONDS, UPSTREAM_IN_FLIGHT,
+                      UPSTREAM_RETRIES, FALLBACK_RESPONSES, record_usage, status_class)
+from .logger import get_logger, lazy
+
+logger = get_logger("meituan_agent")
+
+class UpstreamSettings:
+    """
+    上游地址、凭据和超时
+
+    配置变化时整体替换为新的对象。每个请求开始时取一次当前的设置，进行中的请求继续使用发起时的地址和凭据。
+    """
+
+    __slots__ = ("tenant_id", "app_id", "base_url", "openai_api_base", "timeout", "connect_timeout", "headers")
+
+    def __init__(self, tenant_id: str, app_id: str, base_url: str, openai_api_base: str, timeout: float,
+                 connect_timeout: Optional[float] = None):
+        """
+        Args:
+            tenant_id: 租户ID
+            app_id: 应用ID，同时作为API密钥
+            base_url: FRIDAY平台地址，用于健康检查
+            openai_api_base: OpenAI兼容接口的地址
+            timeout: 请求超时时间（秒），异步客户端为读取超时
+            connect_timeout: 连接超时时间（秒），只用于异步客户端
+        """
+        self.tenant_id = tenant_id
+        self.app_id = app_id
+        self.base_url = base_url
+        self.openai_api_base = openai_api_base
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        # 设置请求头，使用app_id作为API密钥
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {app_id}"
+        }
+
+    def _key(self) -> tuple:
+        return (self.tenant_id, self.app_id, self.base_url, self.openai_api_base, self.timeout, self.connect_timeout)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, UpstreamSettings) and self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def changes(self, previous: "UpstreamSettings") -> List[str]:
+        """与之前的设置相比发生变化的字段名"""
+        return [name for name in self.__slots__[:-1] if getattr(self, name) != getattr(previous, name)]
+
 
 class MeituanAIAgent:
     """美团AI Agent客户端 - 使用FRIDAY大模型平台API"""
 
-    def __init__(self):
+    def __init__(self, cache: Optional[ResponseCache] = None, coalesce: bool = True,
+                 hedger: Optional[Hedger] = None, retry_policy: Optional[RetryPolicy] = None,
+                 breakers: Optional[CircuitBreakers] = None, check_health: bool = True):
         """
         初始化美团AI Agent
-        """
-        self.tenant_id = config.get_tenant_id()
-        self.app_id = config.get_app_id()
 
-        # 从配置文件获取API URL
-        api_urls = config.get_api_urls()
-        self.base_url = api_urls.get("base_url")
-        self.openai_api_base = api_urls.get("openai_api_base")
+        Args:
+            cache: 可选的响应缓存，完全相同的请求直接返回缓存的回复
+            coalesce: 是否合并同时进行的相同请求，只向上游发送一次
+            hedger: 可选的请求对冲策略，上游请求超过延迟阈值时发送备份请求
+            retry_policy: 可选的重试策略，连接失败和可重试的状态码按退避策略重试，默认不重试
+            breakers: 可选的按模型熔断器，连续失败的模型快速返回提示回复
+            check_health: 是否在初始化时同步测试API连接，为False时由调用方在合适的时机调用health_check
+        """
+        # 从配置文件获取API URL、凭据和超时设置，配置变化时由reload_config整体替换
+        self.upstream = self._load_upstream()
 
         self.session = requests.Session()
 
-        # 从配置文件获取超时设置
-        self.timeout = config.get_timeout()
-
-        # 设置请求头，使用app_id作为API密钥
-        self.headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.app_id}"
-        }
+        self.cache = cache
+        self.single_flight = SingleFlight() if coalesce else None
+        self.hedger = hedger
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+        self.breakers = breakers
 
-        # 打印初始化信息
-        print(f"初始化美团AI Agent - 基于FRIDAY大模型平台")
-        print(f"租户ID: {self.tenant_id}")
-        print(f"应用ID: {self.app_id}")
-        print(f"API地址: {self.base_url}")
-        print(f"OpenAI兼容API地址: {self.openai_api_base}")
-        print(f"请求超时时间: {self.timeout}秒")
+        # 记录初始化信息
+        logger.info("agent.init", "初始化美团AI Agent - 基于FRIDAY大模型平台",
+                    tenant_id=self.tenant_id, app_id=self.app_id, base_url=self.base_url,
+                    openai_api_base=self.openai_api_base, timeout=self.timeout)
 
         # 测试API连接
-        self._test_api_connection()
+        if check_health:
+            self.health_check()
+
+    # 以下属性为当前上游设置的只读视图
+    @property
+    def tenant_id(self) -> str:
+        return self.upstream.tenant_id
+
+    @property
+    def app_id(self) -> str:
+        return self.upstream.app_id
+
+    @property
+    def base_url(self) -> str:
+        return self.upstream.base_url
+
+    @property
+    def openai_api_base(self) -> str:
+        return self.upstream.openai_api_base
+
+    @property
+    def timeout(self) -> float:
+        return self.upstream.timeout
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return self.upstream.headers
 
-    def _test_api_connection(self):
-        """测试API连接"""
-        print("测试API连接: " + f"{self.openai_api_base}/chat/completions")
+    def _load_upstream(self) -> UpstreamSettings:
+        """从配置文件读取上游设置"""
+        api_urls = config.get_api_urls()
+        return UpstreamSettings(config.get_tenant_id(), config.get_app_id(), api_urls.get("base_url"),
+                                api_urls.get("openai_api_base"), config.get_timeout())
+
+    def reload_config(self) -> bool:
+        """
+        重新读取上游地址、凭据和超时，之后发起的请求使用新的设置，进行中的请求不受影响
+
+        Returns:
+            设置是否有变化
+        """
+        upstream = self._load_upstream()
+        previous = self.upstream
+        if upstream == previous:
+            return False
+        # 替换引用是原子操作，请求线程读到的要么是完整的旧设置，要么是完整的新设置
+        self.upstream = upstream
+        logger.info("agent.reload", "已更新上游设置", changed=upstream.changes(previous),
+                    base_url=upstream.base_url, openai_api_base=upstream.openai_api_base, timeout=upstream.timeout)
+        return True
+
+    def health_check(self) -> bool:
+        """测试API连接，返回上游是否可用"""
+        upstream = self.upstream
+        logger.info("agent.health_check", "测试API连接", url=f"{upstream.base_url}/health")
         try:
             response = self.session.get(
-                f"{self.base_url}/health",
-                headers=self.headers,
+                f"{upstream.base_url}/health",
+                headers=upstream.headers,
                 timeout=5  # 健康检查使用较短的超时时间
             )
             if response.status_code == 200:
-                print("API连接测试成功!")
-            else:
-                print(f"API连接测试失败: 状态码 {response.status_code}")
-                print(f"响应内容: {response.text}")
+                logger.info("agent.health_check", "API连接测试成功")
+                return True
+            logger.warning("agent.health_check", "API连接测试失败", status_code=response.status_code,
+                           response=lazy(lambda: response.text[:500]))
         except Exception as e:
-            print(f"API连接测试异常: {e}")
+            logger.warning("agent.health_check", "API连接测试异常: %s", e)
+        return False
 
-    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, model: str = "gpt-3.5-turbo") -> Dict[str, Any]:
+    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, model: str = "gpt-3.5-turbo", use_cache: bool = True) -> Dict[str, Any]:
         """
         与AI进行对话 - 使用FRIDAY大模型平台的chat/completions接口
 
@@ -74,12 +180,81 @@ class MeituanAIAgent:
             messages: 对话历史
             temperature: 温度参数，控制随机性
             model: 使用的模型，默认为gpt-3.5-turbo
+            use_cache: 是否使用响应缓存，为False时跳过缓存直接请求模型
+
+        Returns:
+            AI响应，命中缓存时包含"cache": "hit"，与同时进行的相同请求共享结果时包含"coalesced": True
+        """
+        cache_key = self._lookup_cache_key(messages, temperature, model, use_cache)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("cache.hit", "命中响应缓存", model=model)
+                return dict(cached, cache="hit")
+
+        def request():
+            if self.hedger is None:
+                response = self._request_chat(messages, temperature, model)
+            else:
+                response = self.hedger.call(model, lambda target: self._request_chat(messages, temperature, target))
+            # 请求失败时的提示回复不写入缓存
+            if cache_key is not None and not response.get("fallback"):
+                self.cache.set(cache_key, response)
+            return response
+
+        flight_key = self._flight_key(messages, temperature, model, use_cache, cache_key)
+        if flight_key is None:
+            return request()
+
+        response, coalesced = self.single_flight.do(flight_key, request)
+        if coalesced:
+            logger.info("upstream.coalesced", "合并相同的进行中请求", model=model)
+            return dict(response, coalesced=True)
+        return response
+
+    def cached_chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, model: str = "gpt-3.5-turbo",
+                    use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        只查找响应缓存，不请求模型。用于在取得准入名额之前先返回缓存的回复
+
+        Args:
+            messages: 对话历史
+            temperature: 温度参数
+            model: 使用的模型
+            use_cache: 是否使用响应缓存
 
         Returns:
-            AI响应
+            带有"cache": "hit"标记的缓存回复，未命中时返回None（未命中由随后的chat计数）
         """
+        if self.cache is None or not use_cache:
+            return None
+        cached = self.cache.get(make_cache_key(model, messages, temperature), record_miss=False)
+        if cached is None:
+            return None
+        logger.info("cache.hit", "命中响应缓存", model=model)
+        return dict(cached, cache="hit")
+
+    def _flight_key(self, messages: List[Dict[str, str]], temperature: float, model: str, use_cache: bool,
+                    cache_key: Optional[str]) -> Optional[str]:
+        """返回请求合并使用的键，未启用合并或跳过缓存（要求新回复）时返回None"""
+        if self.single_flight is None or not use_cache:
+            return None
+        return cache_key or make_cache_key(model, messages, temperature)
+
+    def _lookup_cache_key(self, messages: List[Dict[str, str]], temperature: float, model: str, use_cache: bool) -> Optional[str]:
+        """返回请求的缓存键，未启用缓存或跳过缓存时返回None"""
+        if self.cache is None:
+            return None
+        if not use_cache:
+            self.cache.record_bypass()
+            return None
+        return make_cache_key(model, messages, temperature)
+
+    def _request_chat(self, messages: List[Dict[str, str]], temperature: float, model: str) -> Dict[str, Any]:
+        """向chat/completions接口发送请求"""
+        upstream = self.upstream
         # 使用OpenAI兼容的接口
-        url = f"{self.openai_api_base}/chat/completions"
+        url = f"{upstream.openai_api_base}/chat/completions"
 
         payload = {
             "model": model,
@@ -87,46 +262,42 @@ class MeituanAIAgent:
             "temperature": temperature
         }
 
-        print(f"发送请求到: {url}")
-        print(f"使用模型: {model}")
-        print(f"请求参数: {json.dumps(payload, ensure_ascii=False)[:200]}...")
-        
+        # 请求参数只在DEBUG级别写出，序列化在后台线程中进行
+        logger.debug("upstream.request", "发送请求", url=url, model=model,
+                     payload=lazy(lambda: json.dumps(payload, ensure_ascii=False)[:200]))
+
+        circuit_open_message = self._check_circuit(model)
+        if circuit_open_message is not None:
+            return self._build_reply(circuit_open_message, "circuit_open")
+
         # 记录开始时间
         start_time = time.time()
+        status = "error"
+        UPSTREAM_IN_FLIGHT.inc(model=model)
 
         try:
-            print(f"开始请求模型 {model}，超时设置: {self.timeout}秒")
-            response = self.session.post(url, json=payload, headers=self.headers, timeout=self.timeout)
+            response = self._post(upstream, url, payload, model, "chat")
+            status = status_class(response.status_code)
             # 计算请求耗时
             elapsed_time = time.time() - start_time
-            print(f"模型 {model} 请求完成，耗时: {elapsed_time:.2f}秒")
-            print(f"API响应状态码: {response.status_code}")
-
-            # 尝试打印响应内容
-            try:
-                print(f"API响应内容: {response.text[:500]}...")
-            except:
-                print("无法打印响应内容")
+            logger.info("upstream.response", "模型请求完成", model=model, status_code=response.status_code,
+                        elapsed=f"{elapsed_time:.2f}s")
+            logger.debug("upstream.response_body", "API响应内容", model=model,
+                         body=lazy(lambda: response.text[:500]))
 
             response.raise_for_status()
-            return response.json()
+            result = response.json()
+            record_usage(model, result.get("usage"))
+            return result
         except requests.exceptions.Timeout:
-            print(f"请求超时: 模型 {model} 请求超过 {self.timeout} 秒")
-            # 为不同模型提供特定的超时错误消息
-            model_specific_timeout_message = self._get_model_timeout_message(model)
-            return {
-                "choices": [
-                    {
-                        "message": {
-                            "content": model_specific_timeout_message
-                        }
-                    }
-                ]
-            }
+            status = "timeout"
+            FALLBACK_RESPONSES.inc(model=model, reason=status)
+            logger.warning("upstream.timeout", "请求超时", model=model, timeout=upstream.timeout)
+            return self._build_reply(self._get_model_timeout_message(model), status)
         except requests.exceptions.RequestException as e:
+            FALLBACK_RESPONSES.inc(model=model, reason=status)
             # 计算请求耗时
             elapsed_time = time.time() - start_time
-            print(f"请求失败: {e}，耗时: {elapsed_time:.2f}秒")
             # 添加更详细的错误信息
             error_details = {
                 "error": str(e),
@@ -144,39 +315,280 @@ class MeituanAIAgent:
                 except:
                     error_details["response_text"] = e.response.text
 
-            print(f"错误详情: {json.dumps(error_details, ensure_ascii=False)}")
+            logger.error("upstream.error", "请求失败，返回提示回复: %s", e,
+                         details=lazy(lambda: json.dumps(error_details, ensure_ascii=False)))
 
             # 返回一个模拟的成功响应，避免前端报错
-            print("返回模拟响应")
-            
-            # 获取系统角色提示
-            system_prompt = ""
-            for msg in messages:
-                if msg["role"] == "system":
-                    system_prompt = msg["content"]
-                    break
-            
-            # 根据系统角色提示生成合适的回复
-            if "程序员" in system_prompt:
-                ai_content = "你好！我是你的编程助手，有什么代码问题需要解决吗？"
-            elif "教师" in system_prompt:
-                ai_content = "你好！我是你的学习助手，有什么问题需要解答吗？"
-            elif "创意" in system_prompt:
-                ai_content = "你好！我是你的创意顾问，需要一些新奇的想法吗？"
+            return self._build_reply(self._get_fallback_message(messages, model, e), status)
+        finally:
+            UPSTREAM_IN_FLIGHT.dec(model=model)
+            UPSTREAM_REQUESTS.inc(model=model, mode="chat", status=status)
+            UPSTREAM_SECONDS.observe(time.time() - start_time, model=model, mode="chat")
+            self._record_circuit(model, status)
+
+    def _post(self, upstream: UpstreamSettings, url: str, payload: Dict[str, Any], model: str, mode: str,
+              stream: bool = False) -> requests.Response:
+        """
+        发送POST请求，连接失败和可重试的状态码（如429、502、503）按重试策略退避后重试
+
+        重试时仍使用请求发起时的上游设置upstream，不会在一次请求中途切换凭据
+
+        Returns:
+            最后一次尝试的响应
+
+        Raises:
+            requests.exceptions.RequestException: 最后一次尝试连接失败或超时
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(url, json=payload, headers=upstream.headers, timeout=upstream.timeout,
+                                             stream=stream)
+            except requests.exceptions.ConnectionError:
+                # 读取超时（ReadTimeout）不是ConnectionError，不会重试
+                delay = self.retry_policy.backoff(attempt)
+                if delay is None:
+                    raise
+                reason = "connect"
+            else:
+                if response.status_code not in self.retry_policy.retry_statuses:
+                    return response
+                delay = self.retry_policy.backoff(attempt, parse_retry_after(response.headers.get("Retry-After")))
+                if delay is None:
+                    return response
+                response.close()
+                reason = str(response.status_code)
+
+            UPSTREAM_RETRIES.inc(model=model, mode=mode, reason=reason)
+            logger.warning("upstream.retry", "请求失败，%.2f秒后重试", delay, model=model, attempt=attempt + 1,
+                           reason=reason)
+            time.sleep(delay)
+            attempt += 1
+
+    def _check_circuit(self, model: str) -> Optional[str]:
+        """
+        检查模型的熔断器
+
+        Returns:
+            熔断器打开时返回提示信息，否则返回None；放行的请求结束时需调用_record_circuit
+        """
+        if self.breakers is None:
+            return None
+        breaker = self.breakers.get(model)
+        if breaker.allow():
+            return None
+        FALLBACK_RESPONSES.inc(model=model, reason="circuit_open")
+        retry_in = math.ceil(breaker.retry_in())
+        logger.warning("upstream.circuit_open", "熔断器已打开，跳过请求", model=model, retry_in=f"{retry_in}s")
+        return f"模型 {model} 近期连续请求失败，已暂停请求，约 {retry_in} 秒后恢复。请尝试使用其他模型或稍后再试。"
+
+    def _record_circuit(self, model: str, status: str):
+        """将请求结果记入模型的熔断器"""
+        if self.breakers is not None:
+            self.breakers.get(model).record(status)
+
+    def chat_stream(self, messages: List[Dict[str, str]], temperature: float = 0.7, model: str = "gpt-3.5-turbo", use_cache: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        流式对话 - 使用chat/completions接口的stream模式，收到上游数据块后立即返回增量内容
+
+        Args:
+            messages: 对话历史
+            temperature: 温度参数，控制随机性
+            model: 使用的模型，默认为gpt-3.5-turbo
+            use_cache: 是否使用响应缓存
+
+        Yields:
+            增量事件，格式为 {"type": "delta" 或 "reasoning", "content": 增量文本}；
+            最后一个事件为 {"type": "done", "message": 完整回复, "finish_reason": 结束原因}，
+            请求失败时完整回复为与chat相同的提示信息，并带有"fallback": True和失败原因"fallback_reason"；
+            与同时进行的相同请求共享上游数据时，最后一个事件带有"coalesced": True
+        """
+        cache_key = self._lookup_cache_key(messages, temperature, model, use_cache)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("cache.hit", "命中响应缓存", model=model)
+                yield from self._replay_cached_stream(cached)
+                return
+
+        def request():
+            if self.hedger is None:
+                events = self._request_chat_stream(messages, temperature, model)
             else:
-                ai_content = f"抱歉，模型 {model} 请求失败。错误信息: {str(e)[:100]}... 请尝试使用其他模型或稍后再试。"
-            
-            return {
-                "choices": [
-                    {
-                        "message": {
-                            "content": ai_content
-                        }
+                events = self.hedger.stream(model, lambda target: self._request_chat_stream(messages, temperature, target))
+            for event in events:
+                if event["type"] == "done" and cache_key is not None and not event.get("fallback"):
+                    self.cache.set(cache_key, self._build_completion(event["message"], event.get("finish_reason")))
+                yield event
+
+        flight_key = self._flight_key(messages, temperature, model, use_cache, cache_key)
+        if flight_key is None:
+            yield from request()
+            return
+
+        for event, coalesced in self.single_flight.stream(flight_key, request):
+            if coalesced and event["type"] == "done":
+                event = dict(event, coalesced=True)
+            yield event
+
+    @staticmethod
+    def _replay_cached_stream(cached: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """将缓存的完整回复转换为流式事件"""
+        choice = cached["choices"][0]
+        content = choice["message"]["content"]
+        yield {"type": "delta", "content": content}
+        yield {"type": "done", "message": content, "finish_reason": choice.get("finish_reason"), "cache": "hit"}
+
+    def _request_chat_stream(self, messages: List[Dict[str, str]], temperature: float, model: str) -> Iterator[Dict[str, Any]]:
+        """以stream模式向chat/completions接口发送请求"""
+        upstream = self.upstream
+        url = f"{upstream.openai_api_base}/chat/completions"
+
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True
+        }
+
+        logger.debug("upstream.request", "发送流式请求", url=url, model=model)
+
+        circuit_open_message = self._check_circuit(model)
+        if circuit_open_message is not None:
+            yield {"type": "done", "message": circuit_open_message, "finish_reason": "error", "fallback": True,
+                   "fallback_reason": "circuit_open"}
+            return
+
+        start_time = time.time()
+        first_chunk_time = None
+        content_parts = []
+        finish_reason = None
+        usage = None
+        status = "error"
+        UPSTREAM_IN_FLIGHT.inc(model=model)
+
+        try:
+            with self._post(upstream, url, payload, model, "stream", stream=True) as response:
+                status = status_class(response.status_code)
+                response.raise_for_status()
+
+                # chunk_size=None: 数据到达即处理，不等待缓冲区填满
+                for line in response.iter_lines(chunk_size=None):
+                    if not line or not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        break
+
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        logger.warning("upstream.bad_chunk", "无法解析流式数据块", model=model, data=data[:200])
+                        continue
+
+                    if first_chunk_time is None:
+                        first_chunk_time = time.time() - start_time
+                        UPSTREAM_TTFT_SECONDS.observe(first_chunk_time, model=model)
+                        logger.debug("upstream.first_chunk", "收到首个数据块", model=model,
+                                     elapsed=f"{first_chunk_time:.2f}s")
+
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    for choice in chunk.get("choices") or []:
+                        delta = choice.get("delta") or {}
+                        if delta.get("reasoning_content"):
+                            yield {"type": "reasoning", "content": delta["reasoning_content"]}
+                        if delta.get("content"):
+                            content_parts.append(delta["content"])
+                            yield {"type": "delta", "content": delta["content"]}
+                        if choice.get("finish_reason"):
+                            finish_reason = choice["finish_reason"]
+
+            elapsed_time = time.time() - start_time
+            logger.info("upstream.response", "流式请求完成", model=model, elapsed=f"{elapsed_time:.2f}s")
+            record_usage(model, usage)
+            yield {"type": "done", "message": "".join(content_parts), "finish_reason": finish_reason, "usage": usage}
+        except requests.exceptions.Timeout:
+            status = "timeout"
+            FALLBACK_RESPONSES.inc(model=model, reason=status)
+            logger.warning("upstream.timeout", "流式请求超时", model=model, timeout=upstream.timeout)
+            # 已经返回了部分内容时保留这部分内容
+            message = "".join(content_parts) or self._get_model_timeout_message(model)
+            yield {"type": "done", "message": message, "finish_reason": "timeout", "fallback": True,
+                   "fallback_reason": status}
+        except requests.exceptions.RequestException as e:
+            if status == "2xx":
+                # 返回响应头之后连接中断或读取超时，熔断器应计为失败
+                status = "error"
+            FALLBACK_RESPONSES.inc(model=model, reason=status)
+            elapsed_time = time.time() - start_time
+            logger.error("upstream.error", "流式请求失败: %s", e, model=model, elapsed=f"{elapsed_time:.2f}s")
+            message = "".join(content_parts) or self._get_fallback_message(messages, model, e)
+            yield {"type": "done", "message": message, "finish_reason": "error", "fallback": True,
+                   "fallback_reason": status}
+        finally:
+            UPSTREAM_IN_FLIGHT.dec(model=model)
+            UPSTREAM_REQUESTS.inc(model=model, mode="stream", status=status)
+            UPSTREAM_SECONDS.observe(time.time() - start_time, model=model, mode="stream")
+            self._record_circuit(model, status)
+
+    @staticmethod
+    def _build_reply(content: str, reason: str = "error") -> Dict[str, Any]:
+        """
+        构造请求失败时返回的提示回复，格式与chat/completions接口相同，并带有fallback标记
+
+        Args:
+            content: 提示信息
+            reason: 失败原因，timeout、4xx、5xx、error（连接失败等）或circuit_open（熔断器打开）
+        """
+        return {
+            "choices": [
+                {
+                    "message": {
+                        "content": content
                     }
-                ]
-            }
+                }
+            ],
+            "fallback": True,
+            "fallback_reason": reason
+        }
+
+    @staticmethod
+    def _build_completion(content: str, finish_reason: Optional[str] = None) -> Dict[str, Any]:
+        """根据流式请求拼接出的完整回复构造chat/completions格式的响应"""
+        return {
+            "choices": [
+                {
+                    "message": {
+                        "role": "assistant",
+                        "content": content
+                    },
+                    "finish_reason": finish_reason
+                }
+            ]
+        }
+
+    @staticmethod
+    def _get_fallback_message(messages: List[Dict[str, str]], model: str, error: Exception) -> str:
+        """请求失败时根据系统角色提示生成回复内容"""
+        # 获取系统角色提示
+        system_prompt = ""
+        for msg in messages:
+            if msg["role"] == "system":
+                system_prompt = msg["content"]
+                break
+
+        # 根据系统角色提示生成合适的回复
+        if "程序员" in system_prompt:
+            return "你好！我是你的编程助手，有什么代码问题需要解决吗？"
+        elif "教师" in system_prompt:
+            return "你好！我是你的学习助手，有什么问题需要解答吗？"
+        elif "创意" in system_prompt:
+            return "你好！我是你的创意顾问，需要一些新奇的想法吗？"
+        return f"抱歉，模型 {model} 请求失败。错误信息: {str(error)[:100]}... 请尝试使用其他模型或稍后再试。"
     
-    def _get_model_timeout_message(self, model: str) -> str:
+    @staticmethod
+    def _get_model_timeout_message(model: str) -> str:
         """根据不同模型返回特定的超时错误消息"""
         model_messages = {
             "claude-3-opus": "Claude 3 Opus 模型响应超时。这个模型较大，处理时间可能较长，请尝试使用 Claude 3 Sonnet 或其他更轻量级的模型。",
@@ -203,7 +615,8 @@ class MeituanAIAgent:
             生成的图像信息，包含url和revised_prompt
         """
         # 使用OpenAI兼容的接口
-        url = f"{self.openai_api_base}/images/generations"
+        upstream = self.upstream
+        url = f"{upstream.openai_api_base}/images/generations"
 
         payload = {
             "model": model,
@@ -214,16 +627,15 @@ class MeituanAIAgent:
             "n": n
         }
 
-        print(f"发送图像生成请求到: {url}")
-        print(f"图像描述: {prompt}")
-        print(f"图像参数: 尺寸={size}, 质量={quality}, 风格={style}")
+        logger.info("image.request", "发送图像生成请求", url=url, model=model, size=size, quality=quality, style=style)
+        logger.debug("image.prompt", "图像描述: %s", prompt)
 
         try:
-            response = self.session.post(url, json=payload, headers=self.headers, timeout=self.timeout)
+            response = self.session.post(url, json=payload, headers=upstream.headers, timeout=upstream.timeout)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"图像生成请求失败: {e}")
+            logger.error("image.error", "图像生成请求失败: %s", e)
 
             # 返回错误信息
             error_details = {
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+监控指标 - 计数器、仪表和直方图，以Prometheus文本格式导出
+
+记录指标时不加锁：每个线程写入自己的分片，只有首次在某个线程中记录时才需要注册分片。
+导出时汇总所有分片，已退出线程的分片合并到保留值中。分片数每次翻倍时也会合并一次已退出线程的分片，
+即使长期没有抓取，大量短生命周期的线程（请求线程、后台任务）也不会使分片无限增长。
+已经由其他组件统计的值（如缓存命中数、队列深度）通过set_function在导出时读取，不占用请求路径。
+"""
+
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from .logger import get_dropped_count, get_logger
+
+logger = get_logger("metrics")
+
+# 分片数达到该值后，新注册分片时合并已退出线程的分片
+MIN_PRUNE_SHARDS = 64
+
+# 默认的延迟分桶（秒），覆盖从快速缓存命中到慢速推理模型
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Shard:
+    """单个线程的指标值"""
+
+    __slots__ = ("thread", "values")
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.values: Dict[LabelValues, list] = {}
+
+
+class _Metric:
+    """指标基类，按线程分片保存每组标签的值"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._retired: Dict[LabelValues, list] = {}
+        self._prune_at = MIN_PRUNE_SHARDS
+        self._lock = threading.Lock()
+        self._callback: Optional[Callable[[], Dict[LabelValues, float]]] = None
+
+    def _new_value(self) -> list:
+        return [0.0]
+
+    def _values(self) -> Dict[LabelValues, list]:
+        """获取当前线程的分片"""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+                # 分片数翻倍时才扫描一次，每次注册的均摊开销为常数
+                if len(self._shards) >= self._prune_at:
+                    self._retire_dead()
+                    self._prune_at = max(MIN_PRUNE_SHARDS, 2 * len(self._shards))
+        return shard.values
+
+    def _retire_dead(self):
+        """把已退出线程的分片合并到保留值中，调用方需持有self._lock"""
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                self._merge_into(self._retired, shard.values)
+        self._shards = alive
+
+    def _slot(self, labels: LabelValues) -> list:
+        values = self._values()
+        slot = values.get(labels)
+        if slot is None:
+            slot = values[labels] = self._new_value()
+        return slot
+
+    @staticmethod
+    def _merge_into(target: Dict[LabelValues, list], values: Dict[LabelValues, list]):
+        for labels, slot in list(values.items()):
+            merged = target.get(labels)
+            if merged is None:
+                target[labels] = list(slot)
+            else:
+                for i, value in enumerate(slot):
+                    merged[i] += value
+
+    def _collect(self) -> Dict[LabelValues, list]:
+        """汇总所有分片"""
+        with self._lock:
+            self._retire_dead()
+            total: Dict[LabelValues, list] = {labels: list(slot) for labels, slot in self._retired.items()}
+            for shard in self._shards:
+                self._merge_into(total, shard.values)
+        return total
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, labels: LabelValues, extra: Iterable[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def set_function(self, callback: Callable[[], Dict[LabelValues, float]]):
+        """
+        设置导出时调用的取值函数，设置后不再使用记录的值
+
+        Args:
+            callback: 返回 {标签值元组: 数值} 的函数，无标签时键为空元组
+        """
+        self._callback = callback
+
+    def _samples(self) -> Iterable[str]:
+        if self._callback is not None:
+            try:
+                values = self._callback()
+            except Exception as e:
+                logger.error("metrics.collect", "读取指标 %s 失败: %s", self.name, e)
+                return
+            for labels, value in sorted(values.items()):
+                yield f"{self.name}{self._format_labels(labels)} {_format_number(value)}"
+            return
+        for labels, slot in sorted(self._collect().items()):
+            yield f"{self.name}{self._format_labels(labels)} {_format_number(slot[0])}"
+
+    def expose(self) -> str:
+        """导出为Prometheus文本格式"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """单调递增的计数器"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels: str):
+        """
+        增加计数
+
+        Args:
+            amount: 增加量
+            labels: 标签值
+        """
+        self._slot(self._label_values(labels))[0] += amount
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+
+    type_name = "gauge"
+
+    def inc(self, amount: float = 1, **labels: str):
+        """增加当前值"""
+        self._slot(self._label_values(labels))[0] += amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        """减少当前值"""
+        self._slot(self._label_values(labels))[0] -= amount
+
+
+class Histogram(_Metric):
+    """分桶直方图，每组标签保存各分桶的计数、总和与总数"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self) -> list:
+        # 各分桶（含+Inf）的计数，之后是总和与总数
+        return [0.0] * (len(self.buckets) + 3)
+
+    def observe(self, value: float, **labels: str):
+        """
+        记录一次观测值
+
+        Args:
+            value: 观测值，如耗时（秒）
+            labels: 标签值
+        """
+        slot = self._slot(self._label_values(labels))
+        slot[bisect.bisect_left(self.buckets, value)] += 1
+        slot[-2] += value
+        slot[-1] += 1
+
+    def _samples(self) -> Iterable[str]:
+        for labels, slot in sorted(self._collect().items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), slot):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_number(bound)
+                yield f"{self.name}_bucket{self._format_labels(labels, [('le', le)])} {_format_number(cumulative)}"
+            yield f"{self.name}_sum{self._format_labels(labels)} {_format_number(slot[-2])}"
+            yield f"{self.name}_count{self._format_labels(labels)} {_format_number(slot[-1])}"
+
+
+def _format_number(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def expose(self) -> str:
+        """导出所有指标"""
+        return "\n".join(metric.expose() for metric in self._metrics) + "\n"
+
+
+# 默认注册表和各模块共用的指标
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "ai_agent_http_requests_total", "按路由、方法和状态码分类统计的HTTP请求数", ("route", "method", "status"))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "ai_agent_http_request_duration_seconds", "HTTP请求处理耗时（流式接口为返回响应头的耗时）", ("route", "method"))
+
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "ai_agent_upstream_requests_total",
+    "上游模型请求数，status为2xx/4xx/5xx、timeout或error（连接失败等）", ("model", "mode", "status"))
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "ai_agent_upstream_request_duration_seconds", "上游模型请求耗时", ("model", "mode"))
+UPSTREAM_TTFT_SECONDS = REGISTRY.histogram(
+    "ai_agent_upstream_time_to_first_token_seconds", "流式请求收到首个数据块的耗时", ("model",))
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    "ai_agent_upstream_in_flight", "正在进行的上游模型请求数", ("model",))
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "ai_agent_upstream_retries_total", "上游请求的重试次数，reason为connect或触发重试的HTTP状态码", ("model", "mode", "reason"))
+CIRCUIT_BREAKER_STATE = REGISTRY.gauge(
+    "ai_agent_circuit_breaker_state", "各模型熔断器的状态，0为关闭，1为半开，2为打开", ("model",))
+FALLBACK_RESPONSES = REGISTRY.counter(
+    "ai_agent_fallback_responses_total", "请求失败后返回的提示回复数", ("model", "reason"))
+TOKENS = REGISTRY.counter(
+    "ai_agent_tokens_total", "上游返回的token用量，type为prompt或completion", ("model", "type"))
+CACHE_LOOKUPS = REGISTRY.counter(
+    "ai_agent_cache_lookups_total", "缓存查找次数，cache为exact或semantic，result为hit或miss", ("cache", "result"))
+COALESCED_REQUESTS = REGISTRY.counter(
+    "ai_agent_coalesced_requests_total", "与进行中的相同请求合并、没有发送到上游的请求数", ("mode",))
+SESSIONS = REGISTRY.gauge(
+    "ai_agent_sessions", "当前保存的会话数")
+AUTOSAVE_PENDING = REGISTRY.gauge(
+    "ai_agent_autosave_pending", "等待后台自动保存的会话数")
+AUTOSAVED_CONVERSATIONS = REGISTRY.counter(
+    "ai_agent_autosaved_conversations_total", "后台自动保存会话的次数，result为ok或error", ("result",))
+ADMISSION_ACTIVE = REGISTRY.gauge(
+    "ai_agent_admission_active", "已取得名额、正在进行的请求数，model为__global__时表示全局", ("model",))
+ADMISSION_WAITING = REGISTRY.gauge(
+    "ai_agent_admission_waiting", "排队等待名额的请求数，model为__global__时表示全局", ("model",))
+ADMISSION_REJECTED = REGISTRY.counter(
+    "ai_agent_admission_rejected_total", "因队列已满或排队超时被拒绝的请求数", ("model", "reason"))
+ROUTED_REQUESTS = REGISTRY.counter(
+    "ai_agent_routed_requests_total", "按路由组选择模型的请求数，model为最终返回回复的模型", ("group", "model"))
+ROUTER_FAILOVERS = REGISTRY.counter(
+    "ai_agent_router_failovers_total", "路由请求切换到下一个模型的次数，model和reason为被放弃的模型及其失败原因",
+    ("group", "model", "reason"))
+HEDGED_REQUESTS = REGISTRY.counter(
+    "ai_agent_hedged_requests_total", "发送了备份请求的上游请求数，winner为primary、backup或none（都失败）",
+    ("model", "mode", "winner"))
+HEDGES_THROTTLED = REGISTRY.counter(
+    "ai_agent_hedges_throttled_total", "超过延迟阈值但因预算用完或备份模型没有空闲名额而没有对冲的请求数", ("model", "mode"))
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "ai_agent_log_records_dropped_total", "日志队列已满时丢弃的记录数")
+LOG_RECORDS_DROPPED.set_function(lambda: {(): get_dropped_count()})
+
+
+def status_class(status_code: Optional[int]) -> str:
+    """将HTTP状态码归类为2xx、4xx、5xx等"""
+    if not status_code:
+        return "error"
+    return f"{status_code // 100}xx"
+
+
+def record_usage(model: str, usage: Optional[Dict[str, int]]):
+    """记录上游响应中的token用量"""
+    if not usage:
+        return
+    TOKENS.inc(usage.get("prompt_tokens") or 0, model=model, type="prompt")
+    TOKENS.inc(usage.get("completion_tokens") or 0, model=model, type="completion")
@@ -195,6 +195,12 @@ SUPPORTED_MODELS = {
 # 默认模型
 DEFAULT_MODEL = "Doubao-deepseek-r1"
 
+# 支持的图像生成模型
+SUPPORTED_IMAGE_MODELS = ["dall-e-3"]
+
+# 默认图像生成模型
+DEFAULT_IMAGE_MODEL = "dall-e-3"
+
 # 获取按类别分组的模型列表
 def get_models_by_category():
     """
@@ -230,6 +236,19 @@ def is_model_supported(model_id):
     """
     return model_id in SUPPORTED_MODELS
 
+# 检查图像生成模型是否支持
+def is_image_model_supported(model_id):
+    """
+    检查图像生成模型是否支持
+    
+    Args:
+        model_id: 模型ID
+        
+    Returns:
+        bool: 如果模型支持则返回True，否则返回False
+    """
+    return model_id in SUPPORTED_IMAGE_MODELS
+
 # 获取模型信息
 def get_model_info(model_id):
     """
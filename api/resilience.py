@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+重试和熔断 - 上游请求的可重试失败按指数退避加随机抖动重试，连续失败的模型由熔断器快速失败
+
+只重试连接失败和429、502、503等可重试的状态码，响应头带有Retry-After时按其等待；
+读取超时不重试，以免一个慢请求占用两倍的超时时间。
+每个模型有独立的熔断器：连续失败达到阈值后打开，之后的请求不再发送到上游而是立即返回提示回复，
+不再让工作线程等满超时时间；经过recovery_timeout后进入半开状态，放行少量探测请求，
+探测成功则关闭熔断器，失败则重新打开。
+"""
+
+import time
+import random
+import threading
+import email.utils
+from typing import Any, Dict, Iterable, Optional
+
+# 熔断器计为失败的请求结果（metrics.status_class的取值），4xx是请求本身的问题，不计入
+BREAKER_FAILURES = ("timeout", "5xx", "error")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析Retry-After响应头
+
+    Args:
+        value: 秒数或HTTP日期
+
+    Returns:
+        需要等待的秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """重试策略"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8,
+                 max_retry_after: float = 30, retry_statuses: Iterable[int] = (429, 502, 503)):
+        """
+        初始化重试策略
+
+        Args:
+            max_attempts: 最多尝试次数（含第一次），为1时不重试
+            base_delay: 第一次重试的退避上限（秒），之后每次翻倍
+            max_delay: 退避上限（秒）
+            max_retry_after: 上游要求的Retry-After超过该值（秒）时不再重试，直接返回失败
+            retry_statuses: 可重试的HTTP状态码
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        计算第attempt次尝试（从0开始）失败后的等待时间
+
+        Args:
+            attempt: 已失败的尝试序号
+            retry_after: 上游通过Retry-After要求的等待时间（秒）
+
+        Returns:
+            等待时间（秒），不应再重试时返回None
+        """
+        if attempt + 1 >= self.max_attempts:
+            return None
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            # 在上游要求的时间之后加少量抖动，避免所有等待的请求同时重试
+            return retry_after + random.uniform(0, self.base_delay)
+        # 完全抖动：在0到指数退避上限之间随机等待
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """单个模型的熔断器"""
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30, half_open_max_calls: int = 1):
+        """
+        初始化熔断器
+
+        Args:
+            failure_threshold: 连续失败多少次后打开
+            recovery_timeout: 打开后经过多少秒进入半开状态
+            half_open_max_calls: 半开状态下同时放行的探测请求数
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.rejected = 0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """请求是否可以发送到上游，放行后必须调用record记录结果"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self.probes = 0
+            if self.state == HALF_OPEN:
+                if self.probes >= self.half_open_max_calls:
+                    self.rejected += 1
+                    return False
+                self.probes += 1
+            return True
+
+    def record(self, status: str):
+        """
+        记录一次请求的结果
+
+        Args:
+            status: 请求结果，取值同metrics.status_class，timeout、5xx和error计为失败
+        """
+        with self._lock:
+            if status in BREAKER_FAILURES:
+                self.consecutive_failures += 1
+                if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                    if self.state != OPEN:
+                        self.times_opened += 1
+                    self.state = OPEN
+                    self.opened_at = time.monotonic()
+                return
+            self.consecutive_failures = 0
+            self.state = CLOSED
+
+    def retry_in(self) -> float:
+        """距离进入半开状态的秒数"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+
+    def snapshot(self) -> Dict[str, Any]:
+        retry_in = self.retry_in()
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "retry_in_seconds": round(retry_in, 1)
+            }
+
+
+class CircuitBreakers:
+    """按模型管理熔断器"""
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30, half_open_max_calls: int = 1):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后打开
+            recovery_timeout: 打开后经过多少秒进入半开状态
+            half_open_max_calls: 半开状态下同时放行的探测请求数
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str) -> CircuitBreaker:
+        """获取模型的熔断器"""
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(model)
+                if breaker is None:
+                    breaker = self._breakers[model] = CircuitBreaker(
+                        self.failure_threshold, self.recovery_timeout, self.half_open_max_calls)
+        return breaker
+
+    def reset(self, model: Optional[str] = None):
+        """关闭指定模型（默认所有模型）的熔断器"""
+        with self._lock:
+            breakers = list(self._breakers.values()) if model is None else [self._breakers.get(model)]
+        for breaker in breakers:
+            if breaker is not None:
+                breaker.record("2xx")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取各模型熔断器的状态"""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            "failure_threshold": self.failure_threshold,
+            "recovery_timeout": self.recovery_timeout,
+            "models": {model: breaker.snapshot() for model, breaker in breakers.items()}
+        }
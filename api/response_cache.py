@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+响应缓存 - 对(模型, 消息, 温度)完全相同的对话请求直接返回缓存的回复
+内存层为有界LRU，可选的SQLite磁盘层在重启后保留，并可由多个工作进程共享
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from .logger import get_logger
+
+logger = get_logger("response_cache")
+
+# 磁盘层每写入多少条清理一次过期条目
+PURGE_EVERY_WRITES = 1000
+
+
+def make_cache_key(model: str, messages: List[Dict[str, str]], temperature: float) -> str:
+    """
+    生成请求的缓存键
+
+    Args:
+        model: 模型ID
+        messages: 对话历史，只使用role和content字段
+        temperature: 温度参数
+
+    Returns:
+        稳定的SHA-256十六进制摘要
+    """
+    canonical = json.dumps(
+        [model, round(float(temperature), 4), [[m.get("role"), m.get("content")] for m in messages]],
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """对话响应缓存 - 内存LRU + TTL，可选SQLite磁盘层"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600, disk_path: Optional[str] = None):
+        """
+        初始化响应缓存
+
+        Args:
+            max_entries: 内存层最多缓存的条目数
+            ttl: 缓存有效期（秒）
+            disk_path: SQLite磁盘层文件路径，为None时只使用内存层
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # sqlite3连接不能跨线程使用，每个线程单独打开
+        self._local = threading.local()
+        self._counters = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "bypass": 0,
+                          "purged": 0}
+        self._writes_since_purge = 0
+
+        if self.disk_path:
+            conn = self._get_connection()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_expires ON responses(expires_at)")
+            conn.commit()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=5)
+            # WAL模式下多个进程可以同时读，写入不阻塞读取
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key: str, record_miss: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存
+
+        Args:
+            key: 缓存键
+            record_miss: 是否记录未命中，未命中后还会再次查找时为False，避免重复计数
+
+        Returns:
+            缓存的响应，未命中或已过期时返回None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, response = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    self._counters["memory_hits"] += 1
+                    return response
+                del self._entries[key]
+
+        if self.disk_path:
+            try:
+                row = self._get_connection().execute(
+                    "SELECT response, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                    (key, now)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error("cache.read", "读取响应缓存失败: %s", e)
+                row = None
+            if row is not None:
+                response = json.loads(row[0])
+                self._remember(key, response, row[1])
+                self._count("hits")
+                self._count("disk_hits")
+                return response
+
+        if record_miss:
+            self._count("misses")
+        return None
+
+    def set(self, key: str, response: Dict[str, Any]):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            response: 模型响应
+        """
+        expires_at = time.time() + self.ttl
+        self._remember(key, response, expires_at)
+        self._count("stores")
+
+        if self.disk_path:
+            try:
+                conn = self._get_connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(response, ensure_ascii=False), expires_at)
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error("cache.write", "写入响应缓存失败: %s", e)
+                return
+            # 过期条目只在查找时被忽略，定期删除，磁盘层不会无限增长
+            with self._lock:
+                self._writes_since_purge += 1
+                due = self._writes_since_purge >= PURGE_EVERY_WRITES
+                if due:
+                    self._writes_since_purge = 0
+            if due:
+                try:
+                    self.purge_expired()
+                except sqlite3.Error as e:
+                    logger.error("cache.purge", "清理过期的响应缓存失败: %s", e)
+
+    def record_bypass(self):
+        """记录一次跳过缓存的请求"""
+        self._count("bypass")
+
+    def _remember(self, key: str, response: Dict[str, Any], expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def purge_expired(self) -> int:
+        """
+        清理磁盘层中已过期的条目
+
+        Returns:
+            清理的条目数
+        """
+        if not self.disk_path:
+            return 0
+        conn = self._get_connection()
+        cursor = conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        conn.commit()
+        with self._lock:
+            self._counters["purged"] += cursor.rowcount
+        if cursor.rowcount:
+            logger.info("cache.purge", "已清理过期的响应缓存", purged=cursor.rowcount)
+        return cursor.rowcount
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path:
+            conn = self._get_connection()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["ttl"] = self.ttl
+        stats["disk_path"] = self.disk_path
+        return stats
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+模型路由 - 客户端指定路由组，由服务端按实时延迟、错误率和上下文长度选择模型，失败时切换到下一个模型
+
+路由组可以是get_models_by_category()中的类别名，也可以是配置中自定义的模型列表。
+每个模型的延迟和错误率以指数移动平均（EWMA）统计，错误率随时间按半衰期衰减，
+出错的模型过一段时间后会重新排到前面。能容纳完整对话历史（不需要裁剪）的模型优先，
+其中按 预估延迟 × (1 + 错误率惩罚系数 × 错误率) 从低到高排序；都需要裁剪时优先上下文窗口大的模型。
+"""
+
+import time
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from .admission import AdmissionRejected
+from .context_manager import ContextManager
+from .metrics import ROUTED_REQUESTS, ROUTER_FAILOVERS
+from .models_config import get_models_by_category, is_model_supported
+
+# 切换到下一个模型的失败原因：超时、上游5xx、连接失败和熔断器打开。4xx通常是请求本身的问题，换模型也无济于事
+FAILOVER_REASONS = ("timeout", "5xx", "error", "circuit_open")
+
+
+def outcome_of(response: Dict[str, Any]) -> str:
+    """
+    获取回复（或流式请求的done事件）的结果
+
+    Returns:
+        "ok"，或提示回复的失败原因：timeout、4xx、5xx、error、circuit_open
+    """
+    if not response.get("fallback"):
+        return "ok"
+    return response.get("fallback_reason") or "error"
+
+
+class _ModelStats:
+    """单个模型的延迟和错误率"""
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.updated_at = time.monotonic()
+
+
+class ModelRouter:
+    """按路由组选择模型"""
+
+    def __init__(self, context_manager: ContextManager, groups: Optional[Dict[str, List[str]]] = None,
+                 max_attempts: int = 3, ewma_alpha: float = 0.3, default_latency: float = 5.0,
+                 error_penalty: float = 4.0, error_half_life: float = 300):
+        """
+        初始化模型路由
+
+        Args:
+            context_manager: 上下文管理器，用于计算对话历史的token数和各模型的预算
+            groups: 自定义路由组，如 {"fast": ["gpt-4o-mini", "gemini-2.0-flash"]}，同名时覆盖模型类别
+            max_attempts: 单次请求最多尝试的模型数
+            ewma_alpha: 延迟和错误率的平滑系数，越大越偏重最近的请求
+            default_latency: 尚未观测到延迟的模型的预估延迟（秒）
+            error_penalty: 错误率惩罚系数
+            error_half_life: 错误率衰减的半衰期（秒）
+        """
+        self.context_manager = context_manager
+        self.max_attempts = max(1, max_attempts)
+        self.ewma_alpha = ewma_alpha
+        self.default_latency = default_latency
+        self.error_penalty = error_penalty
+        self.error_half_life = error_half_life
+
+        self.groups: Dict[str, List[str]] = {
+            category: [model["id"] for model in models]
+            for category, models in get_models_by_category().items()
+        }
+        for name, models in (groups or {}).items():
+            self.groups[name] = [model for model in models if is_model_supported(model)]
+
+        self._stats: Dict[str, _ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def has_group(self, group: Any) -> bool:
+        """检查路由组是否存在且包含模型"""
+        return isinstance(group, str) and bool(self.groups.get(group))
+
+    def _error_rate(self, stats: _ModelStats, now: float) -> float:
+        """按距离上次更新的时间衰减后的错误率"""
+        return stats.error_rate * 0.5 ** ((now - stats.updated_at) / self.error_half_life)
+
+    def _score(self, model: str, now: float) -> float:
+        """预估代价，调用方需持有self._lock"""
+        stats = self._stats.get(model)
+        if stats is None:
+            return self.default_latency
+        latency = stats.latency if stats.latency is not None else self.default_latency
+        return latency * (1 + self.error_penalty * self._error_rate(stats, now))
+
+    def candidates(self, group: str, messages: List[Dict[str, str]]) -> List[str]:
+        """
+        获取路由组中按优先级排序的候选模型
+
+        Args:
+            group: 路由组名
+            messages: 完整的对话历史
+
+        Returns:
+            候选模型列表，最多max_attempts个
+        """
+        models = self.groups.get(group) or []
+        tokens = self.context_manager.count_tokens(messages)
+        budgets = {model: self.context_manager.get_budget(model) for model in models}
+        now = time.monotonic()
+        with self._lock:
+            scores = {model: self._score(model, now) for model in models}
+
+        fitting = [model for model in models if budgets[model] is None or tokens <= budgets[model]]
+        fitting.sort(key=scores.get)
+        # 都需要裁剪时优先上下文窗口大的模型，被移出的历史最少
+        rest = [model for model in models if model not in fitting]
+        rest.sort(key=lambda model: (-budgets[model], scores[model]))
+        return (fitting + rest)[:self.max_attempts]
+
+    def observe(self, model: str, outcome: str, elapsed: Optional[float] = None):
+        """
+        记录一次请求的结果
+
+        Args:
+            model: 模型ID
+            outcome: outcome_of()返回的结果
+            elapsed: 请求耗时（秒），缓存命中或合并的请求不代表模型延迟，传None
+        """
+        failed = outcome in FAILOVER_REASONS
+        alpha = self.ewma_alpha
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                stats = self._stats[model] = _ModelStats()
+            stats.error_rate = (1 - alpha) * self._error_rate(stats, now) + alpha * (1.0 if failed else 0.0)
+            stats.updated_at = now
+            stats.requests += 1
+            if failed:
+                stats.failures += 1
+            elif elapsed is not None:
+                stats.latency = elapsed if stats.latency is None else (1 - alpha) * stats.latency + alpha * elapsed
+
+    def report(self, group: str, model: str, attempts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        记录路由结果的指标并返回路由信息
+
+        Args:
+            group: 路由组名
+            model: 最终返回回复的模型
+            attempts: 依次尝试的模型及结果
+
+        Returns:
+            路由信息 {"group", "model", "attempts"}
+        """
+        ROUTED_REQUESTS.inc(group=group, model=model)
+        for attempt in attempts[:-1]:
+            ROUTER_FAILOVERS.inc(group=group, model=attempt["model"], reason=attempt["outcome"])
+        return {"group": group, "model": model, "attempts": attempts}
+
+    def route(self, group: str, messages: List[Dict[str, str]],
+              send: Callable[[str], Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        依次尝试候选模型，超时、上游5xx、连接失败或未准入时切换到下一个
+
+        Args:
+            group: 路由组名
+            messages: 完整的对话历史
+            send: 向指定模型发送请求的函数，返回回复（失败时为带fallback标记的提示回复）
+
+        Returns:
+            (回复, 路由信息)，所有模型都失败时返回最后一个提示回复
+
+        Raises:
+            AdmissionRejected: 所有候选模型都未准入
+        """
+        attempts: List[Dict[str, Any]] = []
+        chosen: Optional[Tuple[str, Dict[str, Any]]] = None
+        rejected: Optional[AdmissionRejected] = None
+
+        for model in self.candidates(group, messages):
+            start = time.monotonic()
+            try:
+                response = send(model)
+            except AdmissionRejected as e:
+                rejected = e
+                attempts.append(attempt_info(model, e.reason, start))
+                continue
+
+            outcome = outcome_of(response)
+            representative = not response.get("cache") and not response.get("coalesced")
+            self.observe(model, outcome, time.monotonic() - start if representative else None)
+            attempts.append(attempt_info(model, outcome, start))
+            chosen = (model, response)
+            if outcome not in FAILOVER_REASONS:
+                break
+
+        if chosen is None:
+            raise rejected
+        model, response = chosen
+        return response, self.report(group, model, attempts)
+
+    async def aroute(self, group: str, messages: List[Dict[str, str]],
+                     send: Callable[[str], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """协程版route，send为协程函数"""
+        attempts: List[Dict[str, Any]] = []
+        chosen: Optional[Tuple[str, Dict[str, Any]]] = None
+        rejected: Optional[AdmissionRejected] = None
+
+        for model in self.candidates(group, messages):
+            start = time.monotonic()
+            try:
+                response = await send(model)
+            except AdmissionRejected as e:
+                rejected = e
+                attempts.append(attempt_info(model, e.reason, start))
+                continue
+
+            outcome = outcome_of(response)
+            representative = not response.get("cache") and not response.get("coalesced")
+            self.observe(model, outcome, time.monotonic() - start if representative else None)
+            attempts.append(attempt_info(model, outcome, start))
+            chosen = (model, response)
+            if outcome not in FAILOVER_REASONS:
+                break
+
+        if chosen is None:
+            raise rejected
+        model, response = chosen
+        return response, self.report(group, model, attempts)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取各模型的延迟、错误率和当前排序代价"""
+        now = time.monotonic()
+        with self._lock:
+            models = {
+                model: {
+                    "latency_ms": None if stats.latency is None else round(stats.latency * 1000, 1),
+                    "error_rate": round(self._error_rate(stats, now), 4),
+                    "requests": stats.requests,
+                    "failures": stats.failures,
+                    "score": round(self._score(model, now), 3)
+                }
+                for model, stats in self._stats.items()
+            }
+        return {"groups": self.groups, "models": models, "max_attempts": self.max_attempts}
+
+
+def attempt_info(model: str, outcome: str, start: float) -> Dict[str, Any]:
+    """
+    构造一次尝试的记录
+
+    Args:
+        model: 模型ID
+        outcome: 结果，outcome_of()的返回值或准入控制的拒绝原因
+        start: 开始时间（time.monotonic()）
+    """
+    return {"model": model, "outcome": outcome, "elapsed_ms": round((time.monotonic() - start) * 1000, 1)}
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+语义缓存 - 对只在标点、措辞上略有不同的问题返回缓存的回复
+
+最后一条用户消息去掉标点和空白后，被向量化为字符n-gram的哈希特征（适用于中文），相似度为余弦相似度。
+只有模型、系统提示和之前的对话完全相同（同一作用域）的请求之间才会互相命中。
+
+字符n-gram无法区分字面相近而意思不同的问题（"2+2"和"2*2"、"safe"和"unsafe"、"应该"和"不应该"），
+因此相似度达到阈值后还要核对：数字和符号的序列必须相同，否定词的个数必须相同，
+英文单词不能只差一个否定前缀，否则按未命中处理。
+
+所有向量保存在一个预分配的矩阵中。条目较少时查找是一次矩阵-向量乘法；
+条目数超过index_threshold后，后台训练k-means聚类中心，把条目分桶（IVF倒排索引），
+查找时只扫描与问题最接近的nprobe个桶，查找耗时不再随条目数线性增长。
+"""
+
+import re
+import time
+import hashlib
+import itertools
+import threading
+import unicodedata
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.feature_extraction.text import HashingVectorizer
+from typing import Any, Dict, List, Optional, Tuple
+from .logger import get_logger
+
+logger = get_logger("semantic_cache")
+
+# 否定字词：出现次数不同的两个问题不会互相命中
+_NEGATION_CHARS = frozenset("不没无非别未勿莫")
+_NEGATION_WORDS = frozenset(("not", "no", "never", "none", "nothing", "neither", "nor", "without", "cannot"))
+# 加在单词前表示相反意思的前缀，如unsafe、dislike、nonprofit
+_NEGATION_PREFIXES = ("un", "non", "dis", "in", "im", "ir", "il")
+_WORD_RE = re.compile(r"[a-z]+(?:'t)?")
+
+
+def _guard_of(text: str) -> Tuple[str, int, frozenset]:
+    """提取核对命中时使用的特征：数字和符号的序列、否定字词的个数、英文单词"""
+    text = unicodedata.normalize("NFKC", text).casefold().replace("\u2019", "'")
+    symbols = "".join(ch for ch in text if ch.isdigit() or unicodedata.category(ch)[0] == "S")
+    words = _WORD_RE.findall(text)
+    negations = sum(ch in _NEGATION_CHARS for ch in text)
+    negations += sum(word in _NEGATION_WORDS or word.endswith("n't") for word in words)
+    return symbols, negations, frozenset(words)
+
+
+def _conflicts(a: Tuple[str, int, frozenset], b: Tuple[str, int, frozenset]) -> bool:
+    """两个问题的数字、符号或否定不同时返回True"""
+    if a[0] != b[0] or a[1] != b[1]:
+        return True
+    for word in a[2] ^ b[2]:
+        other = b[2] if word in a[2] else a[2]
+        for prefix in _NEGATION_PREFIXES:
+            if word.startswith(prefix) and word[len(prefix):] in other:
+                return True
+    return False
+
+
+class SemanticCache:
+    """基于向量相似度的对话回复缓存"""
+
+    def __init__(self, max_entries: int = 10000, threshold: float = 0.9, ttl: float = 3600,
+                 n_features: int = 1024, index_threshold: int = 20000, n_clusters: int = 256,
+                 nprobe: int = 8):
+        """
+        初始化语义缓存
+
+        Args:
+            max_entries: 最多缓存的条目数，写满后覆盖最早的条目
+            threshold: 命中所需的最低余弦相似度
+            ttl: 缓存有效期（秒）
+            n_features: 向量维度，中文二元组种类很多，维度过小时哈希冲突会抬高不相关问题的相似度
+            index_threshold: 条目数超过该值后建立聚类索引
+            n_clusters: 聚类索引的桶数
+            nprobe: 每次查找扫描的桶数
+        """
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+
+        self._vectorizer = HashingVectorizer(
+            analyzer="char",
+            ngram_range=(1, 2),
+            n_features=n_features,
+            alternate_sign=False,
+            norm="l2",
+            preprocessor=self._normalize
+        )
+
+        # 预分配的环形缓冲区：向量、作用域、过期时间和回复
+        self._vectors = np.zeros((max_entries, n_features), dtype=np.float32)
+        self._scopes = np.zeros(max_entries, dtype=np.int64)
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._answers: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._guards: List[Optional[Tuple[str, int, frozenset]]] = [None] * max_entries
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0}
+
+        # 聚类索引：中心向量、每个条目所在的桶以及每个桶包含的条目
+        self.index_threshold = index_threshold
+        self.n_clusters = n_clusters
+        self.nprobe = nprobe
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.full(max_entries, -1, dtype=np.int32)
+        self._buckets: List[set] = []
+        self._trained_size = 0
+        self._training = False
+        # 训练期间写入的条目，训练完成后重新分桶
+        self._pending_slots: List[int] = []
+
+    @staticmethod
+    def _scope_of(model: str, messages: List[Dict[str, str]]) -> int:
+        """作用域 = 模型 + 最后一条用户消息之前的全部消息（包括系统提示）"""
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(model.encode("utf-8"))
+        for message in messages[:-1]:
+            digest.update(b"\x00" + (message.get("role") or "").encode("utf-8"))
+            digest.update(b"\x01" + (message.get("content") or "").encode("utf-8"))
+        return int.from_bytes(digest.digest(), "little", signed=True)
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        """统一全角/半角和大小写，去掉标点、空白和控制字符，保留数字和符号（如运算符）"""
+        text = unicodedata.normalize("NFKC", text).casefold()
+        return "".join(ch for ch in text if unicodedata.category(ch)[0] not in ("P", "Z", "C"))
+
+    def _vectorize(self, text: str) -> np.ndarray:
+        return self._vectorizer.transform([text]).toarray()[0].astype(np.float32)
+
+    @staticmethod
+    def _query_of(messages: List[Dict[str, str]]) -> Optional[str]:
+        if not messages or messages[-1].get("role") != "user":
+            return None
+        return messages[-1].get("content") or None
+
+    def lookup(self, model: str, messages: List[Dict[str, str]]) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        查找语义相近的缓存回复
+
+        Args:
+            model: 模型ID
+            messages: 将要发送的对话历史，最后一条为用户消息
+
+        Returns:
+            (缓存的回复, 相似度)，未命中时返回None
+        """
+        query = self._query_of(messages)
+        if query is None:
+            return None
+
+        vector = self._vectorize(query)
+        scope = self._scope_of(model, messages)
+        guard = _guard_of(query)
+        now = time.time()
+
+        with self._lock:
+            rows = self._candidate_rows(vector)
+            if rows is None:
+                vectors, scopes, expires = self._vectors[:self._size], self._scopes[:self._size], self._expires[:self._size]
+            else:
+                vectors, scopes, expires = self._vectors[rows], self._scopes[rows], self._expires[rows]
+
+            if len(vectors):
+                scores = vectors @ vector
+                # 排除其他作用域和已过期的条目
+                scores[(scopes != scope) | (expires <= now)] = -1.0
+                best = int(np.argmax(scores))
+                similarity = float(scores[best])
+                slot = best if rows is None else int(rows[best])
+                if similarity >= self.threshold and not _conflicts(guard, self._guards[slot]):
+                    self._counters["hits"] += 1
+                    return self._answers[slot], similarity
+            self._counters["misses"] += 1
+        return None
+
+    def _candidate_rows(self, vector: np.ndarray) -> Optional[np.ndarray]:
+        """返回需要扫描的条目，未建立索引时返回None表示扫描全部，调用方需持有self._lock"""
+        if self._centroids is None:
+            return None
+        nearest = np.argpartition(self._centroids @ vector, -self.nprobe)[-self.nprobe:]
+        return np.fromiter(itertools.chain.from_iterable(self._buckets[c] for c in nearest), dtype=np.int64)
+
+    def _assign(self, slot: int):
+        """把条目放入最近的桶，调用方需持有self._lock"""
+        old = self._assignments[slot]
+        if old >= 0:
+            self._buckets[old].discard(slot)
+        cluster = int(np.argmax(self._centroids @ self._vectors[slot]))
+        self._assignments[slot] = cluster
+        self._buckets[cluster].add(slot)
+
+    def _train_index(self):
+        """在后台线程中训练聚类中心并重建索引"""
+        try:
+            with self._lock:
+                size = self._size
+                sample_rows = np.random.choice(size, min(size, self.index_threshold), replace=False)
+                sample = self._vectors[sample_rows].copy()
+                self._pending_slots = []
+
+            kmeans = MiniBatchKMeans(n_clusters=self.n_clusters, batch_size=2048, n_init=3, random_state=0)
+            kmeans.fit(sample)
+            centroids = kmeans.cluster_centers_.astype(np.float32)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+            # 分块计算所有条目所属的桶，不持有锁
+            assignments = np.empty(size, dtype=np.int32)
+            for start in range(0, size, 8192):
+                block = self._vectors[start:min(start + 8192, size)]
+                assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+            with self._lock:
+                buckets = [set() for _ in range(self.n_clusters)]
+                for slot, cluster in enumerate(assignments.tolist()):
+                    buckets[cluster].add(slot)
+                self._centroids = centroids
+                self._assignments[:size] = assignments
+                self._buckets = buckets
+                # 训练期间被写入或覆盖的条目重新分桶
+                for slot in self._pending_slots:
+                    self._assign(slot)
+                self._pending_slots = []
+                self._trained_size = size
+        except Exception as e:
+            logger.exception("cache.semantic_index", "训练语义缓存索引失败: %s", e)
+        finally:
+            self._training = False
+
+    def store(self, model: str, messages: List[Dict[str, str]], response: Dict[str, Any]):
+        """
+        写入缓存
+
+        Args:
+            model: 模型ID
+            messages: 发送的对话历史，最后一条为用户消息
+            response: 模型回复
+        """
+        query = self._query_of(messages)
+        if query is None:
+            return
+
+        vector = self._vectorize(query)
+        scope = self._scope_of(model, messages)
+        guard = _guard_of(query)
+
+        with self._lock:
+            slot = self._next
+            self._vectors[slot] = vector
+            self._scopes[slot] = scope
+            self._expires[slot] = time.time() + self.ttl
+            self._answers[slot] = response
+            self._guards[slot] = guard
+            self._next = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+            self._counters["stores"] += 1
+
+            if self._training:
+                self._pending_slots.append(slot)
+            if self._centroids is not None:
+                self._assign(slot)
+
+            # 条目数超过阈值、或比上次训练时翻倍后，在后台重新训练索引
+            if (not self._training and self._size >= self.index_threshold
+                    and self._size >= 2 * self._trained_size):
+                self._training = True
+                threading.Thread(target=self._train_index, name="semantic-cache-index", daemon=True).start()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = self._size
+            stats["indexed"] = self._centroids is not None
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["threshold"] = self.threshold
+        return stats
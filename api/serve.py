@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+生产环境API服务器入口 - 使用gunicorn的多线程工作进程运行Flask应用
+
+用法:
+    python -m api.serve --port 5001 --workers 1 --threads 64
+
+收到SIGTERM后，服务器停止接受新连接，等待正在处理的请求完成（最长graceful_timeout秒），
+随后在每个工作进程中调用api_server.shutdown()释放MCP连接和上游连接池。
+每个工作进程开始接收请求时输出从创建到就绪的各阶段耗时（server.worker_ready日志），
+上游健康检查和MCP管理器在后台启动，完成前/api/ready返回503。
+"""
+
+import os
+import argparse
+import importlib
+from gunicorn.app.base import BaseApplication
+
+
+def _post_fork(server, worker):
+    """工作进程创建后立即导入启动跟踪器开始计时，启动耗时覆盖导入应用的全部时间"""
+    importlib.import_module("api.startup")
+
+
+def _post_worker_init(worker):
+    """工作进程加载完应用、即将开始接收请求时输出启动耗时"""
+    from api.startup import STARTUP
+    STARTUP.mark("worker_init")
+    STARTUP.log_summary("server.worker_ready")
+
+
+def _worker_exit(server, worker):
+    """工作进程退出时释放后台资源"""
+    import sys
+    api_server = sys.modules.get("api.api_server")
+    if api_server is not None:
+        api_server.shutdown()
+
+
+class APIServerApplication(BaseApplication):
+    """以编程方式配置的gunicorn应用"""
+
+    def __init__(self, options):
+        """
+        初始化gunicorn应用
+
+        Args:
+            options: gunicorn配置项
+        """
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # 每个工作进程独立导入应用，MCP事件循环等后台线程不能跨fork共享
+        from api.api_server import app
+        return app
+
+
+def build_options(args):
+    """
+    根据命令行参数构建gunicorn配置
+
+    Args:
+        args: 命令行参数
+
+    Returns:
+        dict: gunicorn配置项
+    """
+    return {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": args.threads,
+        # 长时间的模型请求和流式响应不能被工作进程超时打断
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "keepalive": 5,
+        "backlog": 2048,
+        "preload_app": False,
+        "post_fork": _post_fork,
+        "post_worker_init": _post_worker_init,
+        "worker_exit": _worker_exit,
+        "accesslog": "-" if args.access_log else None,
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='美团AI Agent API服务器（生产模式）')
+    parser.add_argument('--host', default=os.environ.get("API_HOST", "127.0.0.1"), help='监听地址')
+    parser.add_argument('--port', type=int, default=int(os.environ.get("API_PORT", 5001)), help='服务器端口号')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get("API_WORKERS", 1)), help='工作进程数')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get("API_THREADS", 64)), help='每个工作进程的线程数')
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get("API_WORKER_TIMEOUT", 300)), help='工作进程无响应多少秒后重启')
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.environ.get("API_GRACEFUL_TIMEOUT", 30)), help='收到SIGTERM后等待请求完成的秒数')
+    parser.add_argument('--access-log', action='store_true', help='输出访问日志')
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # 会话保存在各工作进程的内存中，多进程部署时需要按X-Session-Id做会话保持
+        print("注意: 会话保存在工作进程内存中，多个工作进程时请在反向代理上按X-Session-Id做会话保持")
+
+    print(f"API服务器正在启动（生产模式），地址: {args.host}:{args.port}，工作进程: {args.workers}，线程: {args.threads}")
+    APIServerApplication(build_options(args)).run()
+
+
+if __name__ == '__main__':
+    main()
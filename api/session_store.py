@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+会话存储 - 按会话ID隔离对话历史和当前角色
+每个会话有独立的锁，同一会话内的请求按顺序执行，不同会话之间可以并行处理
+"""
+
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def _message_size(message: Dict[str, str]) -> int:
+    """估算单条消息占用的字节数"""
+    return len(message.get("content") or "") * 3 + 64
+
+
+class Session:
+    """单个会话的状态"""
+
+    def __init__(self, session_id: str, system_content: str, role: str = "assistant",
+                 on_resize: Optional[Callable[[int], None]] = None):
+        """
+        初始化会话
+
+        Args:
+            session_id: 会话ID
+            system_content: 系统消息内容
+            role: 当前角色
+            on_resize: 消息占用内存变化时的回调，参数为变化量
+        """
+        self.session_id = session_id
+        self._on_resize = None
+        self.role = role
+        self.messages: List[Dict[str, str]] = []
+        self.size = 0
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        # 本会话上次保存或加载的对话标识，journal后端继续保存到该对话
+        self.conversation_name: Optional[str] = None
+        # 最近一次回复使用的模型，保存对话时记录
+        self.model: Optional[str] = None
+        # 同一会话内的请求按顺序执行
+        self.lock = threading.RLock()
+        self.reset([{"role": "system", "content": system_content}])
+        # 初始消息的占用由创建方自行计入
+        self._on_resize = on_resize
+
+    def append(self, message: Dict[str, str]):
+        """追加一条消息"""
+        self.messages.append(message)
+        self._resize(_message_size(message))
+
+    def pop(self) -> Dict[str, str]:
+        """移除并返回最后一条消息"""
+        message = self.messages.pop()
+        self._resize(-_message_size(message))
+        return message
+
+    def reset(self, messages: List[Dict[str, str]]):
+        """替换整个对话历史"""
+        self.messages = list(messages)
+        self._resize(sum(_message_size(m) for m in self.messages) - self.size)
+
+    def set_system_content(self, system_content: str):
+        """更新系统消息"""
+        if self.messages and self.messages[0]["role"] == "system":
+            delta = len(system_content) * 3 - len(self.messages[0].get("content") or "") * 3
+            self.messages[0] = {"role": "system", "content": system_content}
+            self._resize(delta)
+        else:
+            self.reset([{"role": "system", "content": system_content}] + self.messages)
+
+    def _resize(self, delta: int):
+        self.size += delta
+        if self._on_resize is not None and delta:
+            self._on_resize(delta)
+
+    def touch(self):
+        """刷新最近访问时间"""
+        self.last_access = time.time()
+
+
+class SessionStore:
+    """会话存储 - 支持LRU淘汰、空闲过期和内存上限"""
+
+    def __init__(self, max_sessions: int = 10000, idle_ttl: float = 3600,
+                 max_memory_bytes: int = 512 * 1024 * 1024):
+        """
+        初始化会话存储
+
+        Args:
+            max_sessions: 最多保留的会话数
+            idle_ttl: 会话空闲多少秒后过期
+            max_memory_bytes: 所有会话消息占用内存的上限（估算值）
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_memory_bytes = max_memory_bytes
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        # 只保护字典本身，不在持有该锁时执行模型请求
+        self._lock = threading.Lock()
+        self._memory = 0
+        self.evicted = 0
+
+    @staticmethod
+    def new_session_id() -> str:
+        """生成新的会话ID"""
+        return uuid.uuid4().hex
+
+    def get_or_create(self, session_id: Optional[str], system_content: str,
+                      role: str = "assistant") -> Tuple[Session, bool]:
+        """
+        获取会话，不存在时创建
+
+        Args:
+            session_id: 会话ID，为空时生成新的ID
+            system_content: 新会话使用的系统消息
+            role: 新会话使用的角色
+
+        Returns:
+            (会话, 是否新建)
+        """
+        if not session_id:
+            session_id = self.new_session_id()
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and not self._is_expired(session):
+                self._sessions.move_to_end(session_id)
+                session.touch()
+                return session, False
+
+            if session is not None:
+                self._drop_locked(session_id)
+            session = Session(session_id, system_content, role, on_resize=self._add_memory)
+            self._sessions[session_id] = session
+            self._memory += session.size
+            self._evict_locked()
+            return session, True
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """获取会话，不存在或已过期时返回None"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or self._is_expired(session):
+                return None
+            self._sessions.move_to_end(session_id)
+            session.touch()
+            return session
+
+    def remove(self, session_id: str) -> bool:
+        """删除会话"""
+        with self._lock:
+            return self._drop_locked(session_id) is not None
+
+    def enforce_limits(self):
+        """在会话内容增长后检查内存上限"""
+        with self._lock:
+            self._evict_locked()
+
+    def stats(self) -> Dict[str, int]:
+        """获取会话存储统计信息"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "memory_bytes": self._memory,
+                "max_sessions": self.max_sessions,
+                "max_memory_bytes": self.max_memory_bytes,
+                "evicted": self.evicted
+            }
+
+    def _add_memory(self, delta: int):
+        with self._lock:
+            self._memory += delta
+
+    def _drop_locked(self, session_id: Optional[str] = None) -> Optional[Session]:
+        """移除指定会话（默认最久未使用的会话），调用方需持有self._lock"""
+        if session_id is None:
+            _, session = self._sessions.popitem(last=False)
+        else:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            # 被移除的会话不再计入内存占用
+            session._on_resize = None
+            self._memory -= session.size
+        return session
+
+    def _is_expired(self, session: Session) -> bool:
+        return self.idle_ttl > 0 and time.time() - session.last_access > self.idle_ttl
+
+    def _evict_locked(self):
+        """按LRU顺序淘汰过期、超量的会话，调用方需持有self._lock"""
+        now = time.time()
+
+        # 先淘汰空闲过期的会话（OrderedDict按访问时间排序，最旧的在前）
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if self.idle_ttl <= 0 or now - session.last_access <= self.idle_ttl:
+                break
+            self._drop_locked()
+            self.evicted += 1
+
+        # 会话数超限
+        while len(self._sessions) > self.max_sessions:
+            self._drop_locked()
+            self.evicted += 1
+
+        # 内存超限，保留最近使用的会话
+        while self._memory > self.max_memory_bytes and len(self._sessions) > 1:
+            self._drop_locked()
+            self.evicted += 1
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求合并（single-flight） - 同时进行的相同请求只向上游发送一次，所有调用方共享结果
+
+流式请求由后台生产者读取上游数据块并追加到共享缓冲区，每个调用方从缓冲区开头重放，
+中途加入的调用方也能收到完整回复。所有调用方都停止迭代后，生产者关闭上游请求。
+"""
+
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class _Flight:
+    """一次进行中的请求"""
+
+    def __init__(self):
+        self.done = False
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        # 流式请求的共享事件缓冲区和当前订阅者数量
+        self.events: List[Dict[str, Any]] = []
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """线程版请求合并，供MeituanAIAgent使用"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._counters = {"calls": 0, "coalesced": 0, "stream_calls": 0, "stream_coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        执行请求，相同key的请求正在进行时等待其结果
+
+        Args:
+            key: 请求键
+            fn: 实际发送请求的函数
+
+        Returns:
+            (结果, 是否与其他请求合并)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._counters["coalesced"] += 1
+                while not flight.done:
+                    self._cond.wait()
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result, True
+            flight = self._flights[key] = _Flight()
+            self._counters["calls"] += 1
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                flight.done = True
+                del self._flights[key]
+                self._cond.notify_all()
+        return flight.result, False
+
+    def stream(self, key: str, fn: Callable[[], Iterator[Dict[str, Any]]]) -> Iterator[Tuple[Dict[str, Any], bool]]:
+        """
+        流式执行请求，相同key的流式请求正在进行时订阅其事件
+
+        Args:
+            key: 请求键
+            fn: 返回上游事件迭代器的函数
+
+        Yields:
+            (事件, 是否与其他请求合并)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            coalesced = flight is not None
+            if coalesced:
+                self._counters["stream_coalesced"] += 1
+            else:
+                flight = self._flights[key] = _Flight()
+                self._counters["stream_calls"] += 1
+            flight.subscribers += 1
+
+        if not coalesced:
+            threading.Thread(target=self._produce, args=(key, flight, fn),
+                             name="single-flight-stream", daemon=True).start()
+
+        position = 0
+        try:
+            while True:
+                with self._lock:
+                    while position >= len(flight.events) and not flight.done:
+                        self._cond.wait()
+                    pending = flight.events[position:]
+                    finished = flight.done
+                    error = flight.error
+                for event in pending:
+                    yield event, coalesced
+                position += len(pending)
+                if finished and position >= len(flight.events):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            with self._lock:
+                flight.subscribers -= 1
+
+    def _produce(self, key: str, flight: _Flight, fn: Callable[[], Iterator[Dict[str, Any]]]):
+        """在后台线程中读取上游事件并写入共享缓冲区"""
+        upstream = None
+        try:
+            upstream = fn()
+            for event in upstream:
+                with self._lock:
+                    flight.events.append(event)
+                    self._cond.notify_all()
+                    # 所有调用方都已离开时停止读取上游，之后的相同请求重新发起
+                    if flight.subscribers == 0:
+                        self._discard(key, flight)
+                        break
+        except BaseException as e:
+            flight.error = e
+        finally:
+            if upstream is not None and hasattr(upstream, "close"):
+                upstream.close()
+            with self._lock:
+                flight.done = True
+                self._discard(key, flight)
+                self._cond.notify_all()
+
+    def _discard(self, key: str, flight: _Flight):
+        """移除进行中的请求，调用方需持有self._lock"""
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """获取合并统计信息"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["in_flight"] = len(self._flights)
+        return stats
+
+
+class AsyncSingleFlight:
+    """协程版请求合并，供AsyncMeituanAIAgent使用，只能在同一个事件循环中调用"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._cond: Optional[asyncio.Condition] = None
+        # 事件循环只保存任务的弱引用，生产者任务需要在这里保持引用
+        self._tasks: set = set()
+        self._counters = {"calls": 0, "coalesced": 0, "stream_calls": 0, "stream_coalesced": 0}
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Condition绑定创建时的事件循环，首次使用时再创建
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行请求，相同key的请求正在进行时等待其结果
+
+        Args:
+            key: 请求键
+            fn: 返回实际请求协程的函数
+
+        Returns:
+            (结果, 是否与其他请求合并)
+        """
+        future = self._futures.get(key)
+        if future is not None:
+            self._counters["coalesced"] += 1
+            # shield: 单个等待方被取消时不影响其他调用方
+            return await asyncio.shield(future), True
+
+        self._counters["calls"] += 1
+        future = asyncio.ensure_future(fn())
+        self._futures[key] = future
+        future.add_done_callback(lambda _: self._futures.pop(key, None))
+        return await asyncio.shield(future), False
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Tuple[Dict[str, Any], bool]]:
+        """
+        流式执行请求，相同key的流式请求正在进行时订阅其事件
+
+        Args:
+            key: 请求键
+            fn: 返回上游异步事件迭代器的函数
+
+        Yields:
+            (事件, 是否与其他请求合并)
+        """
+        cond = self._get_condition()
+        flight = self._flights.get(key)
+        coalesced = flight is not None
+        if coalesced:
+            self._counters["stream_coalesced"] += 1
+        else:
+            flight = self._flights[key] = _Flight()
+            self._counters["stream_calls"] += 1
+            task = asyncio.ensure_future(self._produce(key, flight, fn))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        flight.subscribers += 1
+
+        position = 0
+        try:
+            while True:
+                async with cond:
+                    await cond.wait_for(lambda: position < len(flight.events) or flight.done)
+                pending = flight.events[position:]
+                for event in pending:
+                    yield event, coalesced
+                position += len(pending)
+                if flight.done and position >= len(flight.events):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+
+    async def _produce(self, key: str, flight: _Flight, fn: Callable[[], AsyncIterator[Dict[str, Any]]]):
+        """读取上游事件并写入共享缓冲区"""
+        cond = self._get_condition()
+        upstream = fn()
+        try:
+            async for event in upstream:
+                flight.events.append(event)
+                if flight.subscribers == 0:
+                    break
+                async with cond:
+                    cond.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            # 先移除再关闭上游，关闭期间到达的相同请求会重新发起
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.done = True
+            await upstream.aclose()
+            async with cond:
+                cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取合并统计信息"""
+        stats = dict(self._counters)
+        stats["in_flight"] = len(self._futures) + len(self._flights)
+        return stats
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+启动跟踪 - 记录服务器启动各阶段的耗时，在后台执行不影响接收请求的启动任务，并汇总就绪状态
+
+本模块只依赖标准库和日志模块，需要在api_server最先导入：模块导入的时间即为计时起点。
+gunicorn工作进程在fork之后立即导入本模块（见serve.py），因此计时覆盖从工作进程创建到开始接收请求的全部时间。
+上游健康检查、MCP管理器等启动任务在后台线程中执行，全部必需任务完成后/api/ready才返回就绪。
+"""
+
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .logger import get_logger
+
+logger = get_logger("startup")
+
+PENDING = "pending"
+OK = "ok"
+FAILED = "failed"
+
+
+class _Task:
+    """单个启动任务的状态"""
+
+    def __init__(self, name: str, required: bool):
+        self.name = name
+        self.required = required
+        self.status = PENDING
+        self.error: Optional[str] = None
+        self.result: Any = None
+        self.attempts = 0
+        self.started_at = time.perf_counter()
+        self.elapsed: Optional[float] = None
+        self.done = threading.Event()
+
+
+class StartupTracker:
+    """启动阶段计时和启动任务管理"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self._last_mark = self.started_at
+        self._phases: List[Tuple[str, float]] = []
+        self._tasks: Dict[str, _Task] = {}
+        self._lock = threading.Lock()
+
+    def mark(self, phase: str) -> float:
+        """
+        结束一个启动阶段，阶段耗时为距离上一次mark（或计时起点）的时间
+
+        Args:
+            phase: 阶段名称
+
+        Returns:
+            阶段耗时（秒）
+        """
+        now = time.perf_counter()
+        with self._lock:
+            elapsed = now - self._last_mark
+            self._last_mark = now
+            self._phases.append((phase, elapsed))
+        return elapsed
+
+    def elapsed(self) -> float:
+        """距离计时起点的秒数"""
+        return time.perf_counter() - self.started_at
+
+    def run(self, name: str, fn: Callable[[], Any], required: bool = True, background: bool = True,
+            retry_interval: Optional[float] = None):
+        """
+        执行启动任务
+
+        任务返回False或抛出异常时视为失败。指定retry_interval时，失败的任务每隔retry_interval秒重试，直到成功为止，
+        适合服务器必须等待其恢复后才能就绪的依赖。
+
+        Args:
+            name: 任务名称
+            fn: 任务函数，返回值可以通过result()获取
+            required: 是否为就绪的必要条件
+            background: 是否在后台线程中执行，为False时在当前线程中执行完再返回
+            retry_interval: 失败后的重试间隔（秒），为None时不重试
+        """
+        task = _Task(name, required)
+        with self._lock:
+            self._tasks[name] = task
+
+        if background:
+            threading.Thread(target=self._run_task, args=(task, fn, retry_interval),
+                             name=f"startup-{name}", daemon=True).start()
+        else:
+            self._run_task(task, fn, retry_interval)
+
+    def _run_task(self, task: _Task, fn: Callable[[], Any], retry_interval: Optional[float]):
+        while True:
+            task.attempts += 1
+            try:
+                result = fn()
+                error = None if result is not False else "检查未通过"
+            except Exception as e:
+                result = None
+                error = str(e) or type(e).__name__
+
+            task.error = error
+            if error is None or retry_interval is None:
+                break
+            logger.warning("startup.task", "启动任务 %s 失败，%s秒后重试", task.name, retry_interval,
+                           attempts=task.attempts, error=error)
+            time.sleep(retry_interval)
+
+        task.result = result
+        task.elapsed = time.perf_counter() - task.started_at
+        task.status = OK if error is None else FAILED
+        task.done.set()
+        if error is None:
+            logger.info("startup.task", "启动任务 %s 完成", task.name, elapsed_ms=round(task.elapsed * 1000, 1))
+        else:
+            logger.warning("startup.task", "启动任务 %s 失败: %s", task.name, error,
+                           elapsed_ms=round(task.elapsed * 1000, 1), required=task.required)
+
+    def wait(self, name: str, timeout: Optional[float] = None) -> bool:
+        """
+        等待启动任务完成
+
+        Args:
+            name: 任务名称
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            任务是否已成功完成
+        """
+        task = self._tasks.get(name)
+        if task is None:
+            return False
+        task.done.wait(timeout)
+        return task.status == OK
+
+    def result(self, name: str) -> Any:
+        """获取已完成的启动任务的返回值，未完成时返回None"""
+        task = self._tasks.get(name)
+        return task.result if task is not None and task.status == OK else None
+
+    def is_ready(self) -> bool:
+        """所有必需的启动任务是否都已成功完成"""
+        with self._lock:
+            tasks = list(self._tasks.values())
+        return all(task.status == OK for task in tasks if task.required)
+
+    def status(self) -> Dict[str, Any]:
+        """获取就绪状态、各启动任务的状态和各阶段耗时"""
+        with self._lock:
+            tasks = list(self._tasks.values())
+            phases = list(self._phases)
+        return {
+            "ready": all(task.status == OK for task in tasks if task.required),
+            "uptime_seconds": round(self.elapsed(), 1),
+            "checks": {
+                task.name: {
+                    "status": task.status,
+                    "required": task.required,
+                    "attempts": task.attempts,
+                    "error": task.error,
+                    "elapsed_ms": None if task.elapsed is None else round(task.elapsed * 1000, 1)
+                }
+                for task in tasks
+            },
+            "phases_ms": {phase: round(elapsed * 1000, 1) for phase, elapsed in phases}
+        }
+
+    def log_summary(self, event: str = "server.startup"):
+        """输出各阶段耗时"""
+        with self._lock:
+            phases = list(self._phases)
+            pending = [name for name, task in self._tasks.items() if task.status == PENDING]
+        breakdown = " ".join(f"{phase}={elapsed * 1000:.1f}ms" for phase, elapsed in phases)
+        logger.info(event, "启动耗时 %.1fms: %s", self.elapsed() * 1000, breakdown, pending=pending)
+
+
+# 进程内共用的启动跟踪器，计时起点为本模块首次导入的时间
+STARTUP = StartupTracker()
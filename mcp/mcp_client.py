@@ -13,9 +13,9 @@ import asyncio
 import aiohttp
 import sseclient
 from typing import Dict, List, Any, Optional, Callable
+from api.config import get_config_store
 
 # 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mcp_client")
 
 class MCPClient:
@@ -29,32 +29,35 @@ class MCPClient:
             config_path: 配置文件路径，默认为项目根目录下的config.json
         """
         self.config_path = config_path or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
+        # 与API服务器共用同一个配置存储，配置文件只解析一次
+        self.store = get_config_store(self.config_path)
         self.mcp_servers = {}
         self.load_config()
+        # 配置文件被其他进程或手动修改时同步MCP服务器配置
+        self.store.subscribe(self._on_config_change)
         
         # 记录活跃的连接
         self.active_connections = {}
         
-        logger.info(f"MCP客户端初始化完成，已加载 {len(self.mcp_servers)} 个MCP服务器配置")
+        logger.info("MCP客户端初始化完成，已加载 %s 个MCP服务器配置", len(self.mcp_servers))
     
     def load_config(self):
         """从配置文件加载MCP服务器配置"""
         try:
-            if os.path.exists(self.config_path):
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    
-                # 获取MCP服务器配置
-                self.mcp_servers = config.get('mcpServers', {})
-                
-                if self.mcp_servers:
-                    logger.info(f"已加载MCP服务器配置: {list(self.mcp_servers.keys())}")
-                else:
-                    logger.warning("配置文件中未找到MCP服务器配置")
+            # 获取MCP服务器配置
+            self.mcp_servers = dict(self.store.settings.mcp_servers)
+            
+            if self.mcp_servers:
+                logger.info("已加载MCP服务器配置: %s", list(self.mcp_servers.keys()))
             else:
-                logger.warning(f"配置文件不存在: {self.config_path}")
+                logger.warning("配置文件中未找到MCP服务器配置")
         except Exception as e:
-            logger.error(f"加载MCP配置失败: {str(e)}")
+            logger.error("加载MCP配置失败: %s", e)
+    
+    def _on_config_change(self, previous, current):
+        """配置变化时更新内存中的MCP服务器配置"""
+        if previous is None or previous.mcp_servers != current.mcp_servers:
+            self.mcp_servers = dict(current.mcp_servers)
     
     def get_available_servers(self) -> List[str]:
         """获取可用的MCP服务器列表"""
@@ -76,14 +79,14 @@ class MCPClient:
             连接是否成功
         """
         if not self.is_server_available(server_id):
-            logger.error(f"MCP服务器不存在: {server_id}")
+            logger.error("MCP服务器不存在: %s", server_id)
             return False
         
         server_config = self.mcp_servers[server_id]
         server_url = server_config.get('url')
         
         if not server_url:
-            logger.error(f"MCP服务器URL未配置: {server_id}")
+            logger.error("MCP服务器URL未配置: %s", server_id)
             return False
         
         # 如果已经有活跃连接，先关闭
@@ -94,10 +97,10 @@ class MCPClient:
             # 创建异步任务处理SSE连接
             task = asyncio.create_task(self._handle_sse_connection(server_id, server_url, message_callback))
             self.active_connections[server_id] = task
-            logger.info(f"已连接到MCP服务器: {server_id}")
+            logger.info("已连接到MCP服务器: %s", server_id)
             return True
         except Exception as e:
-            logger.error(f"连接MCP服务器失败: {server_id}, 错误: {str(e)}")
+            logger.error("连接MCP服务器失败: %s, 错误: %s", server_id, e)
             return False
     
     async def disconnect_from_server(self, server_id: str) -> bool:
@@ -118,7 +121,7 @@ class MCPClient:
             except asyncio.CancelledError:
                 pass
             del self.active_connections[server_id]
-            logger.info(f"已断开与MCP服务器的连接: {server_id}")
+            logger.info("已断开与MCP服务器的连接: %s", server_id)
             return True
         return False
     
@@ -146,7 +149,7 @@ class MCPClient:
                 }
                 async with session.get(server_url, headers=headers) as response:
                     if response.status != 200:
-                        logger.error(f"连接MCP服务器失败: {server_id}, 状态码: {response.status}")
+                        logger.error("连接MCP服务器失败: %s, 状态码: %s", server_id, response.status)
                         return
                     
                     # 直接处理响应流
@@ -184,12 +187,12 @@ class MCPClient:
                                         "data": data
                                     })
                                 except json.JSONDecodeError:
-                                    logger.error(f"解析MCP消息失败: {event_dict['data']}")
+                                    logger.error("解析MCP消息失败: %s", event_dict['data'])
         except asyncio.CancelledError:
-            logger.info(f"MCP连接已取消: {server_id}")
+            logger.info("MCP连接已取消: %s", server_id)
             raise
         except Exception as e:
-            logger.error(f"MCP连接异常: {server_id}, 错误: {str(e)}")
+            logger.error("MCP连接异常: %s, 错误: %s", server_id, e)
     
     def update_config(self, new_mcp_servers: Dict[str, Dict[str, str]]) -> bool:
         """
@@ -202,27 +205,16 @@ class MCPClient:
             更新是否成功
         """
         try:
-            # 读取当前配置
-            if os.path.exists(self.config_path):
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            else:
-                config = {}
-            
-            # 更新MCP服务器配置
-            config['mcpServers'] = new_mcp_servers
-            
-            # 保存配置
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
+            # 更新并保存MCP服务器配置
+            self.store.update(lambda config: config.update({'mcpServers': new_mcp_servers}))
             
             # 更新内存中的配置
             self.mcp_servers = new_mcp_servers
             
-            logger.info(f"MCP服务器配置已更新: {list(new_mcp_servers.keys())}")
+            logger.info("MCP服务器配置已更新: %s", list(new_mcp_servers.keys()))
             return True
         except Exception as e:
-            logger.error(f"更新MCP配置失败: {str(e)}")
+            logger.error("更新MCP配置失败: %s", e)
             return False
     
     def add_server(self, server_id: str, server_config: Dict[str, str]) -> bool:
@@ -237,31 +229,16 @@ class MCPClient:
             添加是否成功
         """
         try:
-            # 读取当前配置
-            if os.path.exists(self.config_path):
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            else:
-                config = {}
-            
-            # 确保mcpServers字段存在
-            if 'mcpServers' not in config:
-                config['mcpServers'] = {}
-            
-            # 添加新服务器
-            config['mcpServers'][server_id] = server_config
-            
-            # 保存配置
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
+            # 添加新服务器并保存配置，确保mcpServers字段存在
+            self.store.update(lambda config: config.setdefault('mcpServers', {}).update({server_id: server_config}))
             
             # 更新内存中的配置
-            self.mcp_servers = config['mcpServers']
+            self.mcp_servers = dict(self.store.settings.mcp_servers)
             
-            logger.info(f"已添加MCP服务器: {server_id}")
+            logger.info("已添加MCP服务器: %s", server_id)
             return True
         except Exception as e:
-            logger.error(f"添加MCP服务器失败: {str(e)}")
+            logger.error("添加MCP服务器失败: %s", e)
             return False
     
     def remove_server(self, server_id: str) -> bool:
@@ -275,36 +252,28 @@ class MCPClient:
             移除是否成功
         """
         if server_id not in self.mcp_servers:
-            logger.warning(f"MCP服务器不存在: {server_id}")
+            logger.warning("MCP服务器不存在: %s", server_id)
             return False
         
         try:
-            # 读取当前配置
-            if os.path.exists(self.config_path):
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            else:
-                return False
+            removed = []
             
-            # 确保mcpServers字段存在
-            if 'mcpServers' not in config:
+            def remove(config):
+                # 移除服务器
+                servers = config.get('mcpServers') or {}
+                if server_id in servers:
+                    del servers[server_id]
+                    removed.append(server_id)
+            
+            self.store.update(remove)
+            if not removed:
                 return False
             
-            # 移除服务器
-            if server_id in config['mcpServers']:
-                del config['mcpServers'][server_id]
-                
-                # 保存配置
-                with open(self.config_path, 'w', encoding='utf-8') as f:
-                    json.dump(config, f, indent=2, ensure_ascii=False)
-                
-                # 更新内存中的配置
-                self.mcp_servers = config['mcpServers']
-                
-                logger.info(f"已移除MCP服务器: {server_id}")
-                return True
+            # 更新内存中的配置
+            self.mcp_servers = dict(self.store.settings.mcp_servers)
             
-            return False
+            logger.info("已移除MCP服务器: %s", server_id)
+            return True
         except Exception as e:
-            logger.error(f"移除MCP服务器失败: {str(e)}")
+            logger.error("移除MCP服务器失败: %s", e)
             return False
\ No newline at end of file
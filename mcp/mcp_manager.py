@@ -13,7 +13,6 @@ from typing import Dict, List, Any, Optional, Callable
 from .mcp_client import MCPClient
 
 # 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mcp_manager")
 
 class MCPManager:
@@ -51,6 +50,9 @@ class MCPManager:
         # 创建事件循环
         self.loop = asyncio.new_event_loop()
         
+        # 配置文件中的mcpServers变化时同步连接
+        self.mcp_client.store.subscribe(self._on_config_change)
+        
         # 标记为已初始化
         self._initialized = True
         
@@ -92,7 +94,7 @@ class MCPManager:
             handler: 消息处理函数
         """
         self.message_handlers[server_id] = handler
-        logger.info(f"已注册MCP消息处理器: {server_id}")
+        logger.info("已注册MCP消息处理器: %s", server_id)
     
     def unregister_message_handler(self, server_id: str):
         """
@@ -103,7 +105,7 @@ class MCPManager:
         """
         if server_id in self.message_handlers:
             del self.message_handlers[server_id]
-            logger.info(f"已注销MCP消息处理器: {server_id}")
+            logger.info("已注销MCP消息处理器: %s", server_id)
     
     def _handle_mcp_message(self, message: Dict):
         """
@@ -120,7 +122,7 @@ class MCPManager:
                 # 调用注册的处理器
                 self.message_handlers[server_id](data)
             except Exception as e:
-                logger.error(f"处理MCP消息失败: {server_id}, 错误: {str(e)}")
+                logger.error("处理MCP消息失败: %s, 错误: %s", server_id, e)
     
     def connect_to_server(self, server_id: str) -> bool:
         """
@@ -133,7 +135,7 @@ class MCPManager:
             是否成功发起连接请求
         """
         if not self.mcp_client.is_server_available(server_id):
-            logger.error(f"MCP服务器不存在: {server_id}")
+            logger.error("MCP服务器不存在: %s", server_id)
             return False
         
         # 更新连接状态
@@ -154,7 +156,7 @@ class MCPManager:
             
             return result
         except Exception as e:
-            logger.error(f"连接MCP服务器失败: {server_id}, 错误: {str(e)}")
+            logger.error("连接MCP服务器失败: %s, 错误: %s", server_id, e)
             self.connection_status[server_id] = "failed"
             return False
     
@@ -169,7 +171,7 @@ class MCPManager:
             是否成功发起断开连接请求
         """
         if server_id not in self.connection_status or self.connection_status[server_id] != "connected":
-            logger.warning(f"MCP服务器未连接: {server_id}")
+            logger.warning("MCP服务器未连接: %s", server_id)
             return False
         
         # 更新连接状态
@@ -193,10 +195,50 @@ class MCPManager:
             
             return result
         except Exception as e:
-            logger.error(f"断开MCP服务器连接失败: {server_id}, 错误: {str(e)}")
+            logger.error("断开MCP服务器连接失败: %s, 错误: %s", server_id, e)
             self.connection_status[server_id] = "unknown"
             return False
     
+    def _on_config_change(self, previous, current):
+        """
+        配置变化时同步MCP连接：连接新增的服务器，断开已移除的服务器，重新连接地址变化且已连接的服务器
+        
+        在事件循环中异步执行，不阻塞检测到变化的线程，其他服务器的连接不受影响
+        """
+        if previous is None or previous.mcp_servers == current.mcp_servers:
+            return
+        if not self.loop.is_running():
+            return
+        
+        old_servers = previous.mcp_servers
+        new_servers = current.mcp_servers
+        added = [server_id for server_id in new_servers if server_id not in old_servers]
+        removed = [server_id for server_id in old_servers if server_id not in new_servers]
+        changed = [server_id for server_id in new_servers
+                   if server_id in old_servers and new_servers[server_id] != old_servers[server_id]
+                   and self.connection_status.get(server_id) == "connected"]
+        
+        logger.info("MCP服务器配置已变化，新增: %s，移除: %s，重新连接: %s", added, removed, changed)
+        asyncio.run_coroutine_threadsafe(self._reconcile(added, removed, changed), self.loop)
+    
+    async def _reconcile(self, added: List[str], removed: List[str], changed: List[str]):
+        """在事件循环中断开已移除的服务器，连接新增和配置变化的服务器"""
+        for server_id in removed:
+            if server_id in self.mcp_client.active_connections:
+                self.connection_status[server_id] = "disconnecting"
+                await self.mcp_client.disconnect_from_server(server_id)
+            self.connection_status.pop(server_id, None)
+        
+        # connect_to_server会先关闭已有的连接
+        for server_id in added + changed:
+            self.connection_status[server_id] = "connecting"
+            try:
+                result = await self.mcp_client.connect_to_server(server_id, self._handle_mcp_message)
+            except Exception as e:
+                logger.error("连接MCP服务器失败: %s, 错误: %s", server_id, e)
+                result = False
+            self.connection_status[server_id] = "connected" if result else "failed"
+    
     def get_connection_status(self, server_id: str = None) -> Dict[str, str]:
         """
         获取MCP服务器连接状态
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+日志开销压测脚本 - 比较每次聊天请求在请求线程上花在日志上的时间
+
+用法:
+    python scripts/benchmark_logging.py --iterations 2000 --turns 20
+
+print: 原来的写法，每次请求序列化完整的请求参数、模型信息并同步写出
+logger INFO: 结构化日志，INFO级别，请求参数等DEBUG字段不会被计算
+logger DEBUG: 结构化日志，DEBUG级别，所有字段都写出，但序列化和写出都在后台线程中进行
+
+输出写入临时文件，避免终端速度影响结果。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from api.logger import get_logger, lazy, setup_logging, shutdown_logging  # noqa: E402
+from api.models_config import get_model_info  # noqa: E402
+
+
+def build_request(turns):
+    """构造一个多轮对话请求和对应的模型响应"""
+    messages = [{"role": "system", "content": "你是美团AI助手，请提供专业、准确、有帮助的回答。"}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"第{i}个问题：" + "请介绍一下美团外卖的配送流程。" * 20})
+        messages.append({"role": "assistant", "content": f"第{i}个回答：" + "美团外卖的配送由骑手完成。" * 40})
+    payload = {"model": "gpt-4o-mini", "messages": messages, "temperature": 0.7}
+    response_text = json.dumps({
+        "choices": [{"message": {"role": "assistant", "content": "回复" * 500}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 4000, "completion_tokens": 500, "total_tokens": 4500}
+    }, ensure_ascii=False)
+    return payload, response_text
+
+
+def log_with_print(payload, response_text, model_info):
+    """原来/api/chat和MeituanAIAgent.chat中每次请求的日志输出"""
+    model = payload["model"]
+    print(f"处理聊天请求: 模型={model}, 消息长度={len(payload['messages'][-1]['content'])}")
+    print(f"模型信息: {json.dumps(model_info, ensure_ascii=False)}")
+    print(f"开始请求模型 {model}...")
+    print("发送请求到: https://example.com/v1/chat/completions")
+    print(f"使用模型: {model}")
+    print(f"请求参数: {json.dumps(payload, ensure_ascii=False)[:200]}...")
+    print(f"开始请求模型 {model}，超时设置: 120秒")
+    print(f"模型 {model} 请求完成，耗时: 1.23秒")
+    print("API响应状态码: 200")
+    print(f"API响应内容: {response_text[:500]}...")
+    print(f"模型 {model} 请求完成")
+    print("AI回复长度: 1000")
+
+
+server_logger = get_logger("api_server")
+agent_logger = get_logger("meituan_agent")
+
+
+def log_with_logger(payload, response_text, model_info):
+    """使用结构化日志后每次请求的日志输出"""
+    model = payload["model"]
+    server_logger.info("chat.request", "处理聊天请求", model=model,
+                       message_length=len(payload["messages"][-1]["content"]))
+    server_logger.debug("chat.model_info", "模型信息", model=model,
+                        info=lazy(lambda: json.dumps(model_info, ensure_ascii=False)))
+    agent_logger.debug("upstream.request", "发送请求", url="https://example.com/v1/chat/completions", model=model,
+                       payload=lazy(lambda: json.dumps(payload, ensure_ascii=False)[:200]))
+    agent_logger.info("upstream.response", "模型请求完成", model=model, status_code=200, elapsed="1.23s")
+    agent_logger.debug("upstream.response_body", "API响应内容", model=model, body=lazy(lambda: response_text[:500]))
+    server_logger.info("chat.response", "聊天请求完成", model=model, reply_length=1000, cache=None, fallback=False)
+
+
+def measure(fn, iterations, *args):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(*args)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志开销压测")
+    parser.add_argument("--iterations", type=int, default=2000, help="模拟的请求数")
+    parser.add_argument("--turns", type=int, default=20, help="每个请求的对话轮数")
+    args = parser.parse_args()
+
+    payload, response_text = build_request(args.turns)
+    model_info = get_model_info(payload["model"])
+    print(f"请求参数大小: {len(json.dumps(payload, ensure_ascii=False))} 字符，请求数: {args.iterations}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "print.log"), "w", encoding="utf-8") as out:
+            with contextlib.redirect_stdout(out):
+                results.append(("print", measure(log_with_print, args.iterations, payload, response_text, model_info)))
+
+        for level in ("INFO", "DEBUG"):
+            with open(os.path.join(tmp, f"{level}.log"), "w", encoding="utf-8") as out:
+                setup_logging(level=level, queue_size=args.iterations * 10, stream=out)
+                elapsed = measure(log_with_logger, args.iterations, payload, response_text, model_info)
+                # 等待后台线程写完，写出时间不计入请求线程
+                drain_start = time.perf_counter()
+                shutdown_logging()
+                drain = (time.perf_counter() - drain_start) / args.iterations * 1e6
+            results.append((f"logger {level}", elapsed, drain))
+
+    print(f"{'方式':<14}{'请求线程耗时(us/请求)':>24}{'后台写出(us/请求)':>22}")
+    for row in results:
+        name, elapsed = row[0], row[1]
+        drain = f"{row[2]:.1f}" if len(row) > 2 else "-"
+        print(f"{name:<14}{elapsed:>24.1f}{drain:>22}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+API服务器压测脚本 - 在本地启动模拟上游和API服务器，测量/api/chat的吞吐量
+
+用法:
+    python scripts/benchmark_server.py --server prod --workers 1 --threads 64
+    python scripts/benchmark_server.py --server dev
+
+模拟上游对每个chat/completions请求等待--upstream-delay秒后返回固定回复，
+压测客户端使用--concurrency个线程，每个线程使用独立的会话ID。
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class MockUpstreamHandler(BaseHTTPRequestHandler):
+    """模拟FRIDAY大模型平台的chat/completions接口"""
+
+    protocol_version = "HTTP/1.1"
+    delay = 0.2
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send_json({"status": "ok"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        time.sleep(self.delay)
+        self._send_json({
+            "choices": [{"message": {"role": "assistant", "content": "模拟回复"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 4, "total_tokens": 14}
+        })
+
+
+def free_port():
+    """获取一个空闲端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock_upstream(port, delay):
+    """在后台线程中启动模拟上游"""
+    MockUpstreamHandler.delay = delay
+    ThreadingHTTPServer.daemon_threads = True
+    ThreadingHTTPServer.request_queue_size = 2048
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockUpstreamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_config(upstream_port, agent_mode):
+    """写入指向模拟上游的临时配置文件"""
+    config = {
+        "tenant_id": "benchmark",
+        "app_id": "benchmark",
+        "api_urls": {
+            "base_url": f"http://127.0.0.1:{upstream_port}",
+            "openai_api_base": f"http://127.0.0.1:{upstream_port}/v1"
+        },
+        "timeout": 30,
+        "is_configured": True,
+        "agent_mode": agent_mode,
+        "mcpServers": {}
+    }
+    fd, path = tempfile.mkstemp(suffix=".json", prefix="benchmark_config_")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return path
+
+
+def start_api_server(args, port, config_path):
+    """启动被测API服务器子进程"""
+    env = dict(os.environ, AI_AGENT_CONFIG=config_path, PYTHONUNBUFFERED="1")
+    if args.server == "prod":
+        cmd = [sys.executable, "-m", "api.serve", "--port", str(port),
+               "--workers", str(args.workers), "--threads", str(args.threads)]
+    else:
+        cmd = [sys.executable, "-m", "api.api_server", "--port", str(port)]
+    return subprocess.Popen(cmd, cwd=PROJECT_ROOT, env=env, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(port, timeout=30):
+    """等待API服务器可以响应请求"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/models", timeout=1).read()
+            return True
+        except Exception:
+            time.sleep(0.2)
+    return False
+
+
+def run_load(port, total, concurrency, model):
+    """
+    并发发送聊天请求
+
+    Returns:
+        (每个请求的耗时列表, 失败数, 总耗时)
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker(worker_id):
+        session_id = f"benchmark-{worker_id}"
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            body = json.dumps({"message": "你好", "model": model}).encode("utf-8")
+            req = urllib.request.Request(
+                f"http://127.0.0.1:{port}/api/chat",
+                data=body,
+                headers={"Content-Type": "application/json", "X-Session-Id": session_id}
+            )
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(req, timeout=60).read()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors[0], time.perf_counter() - start
+
+
+def percentile(values, p):
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='API服务器压测')
+    parser.add_argument('--server', choices=['prod', 'dev'], default='prod', help='prod为gunicorn，dev为Flask开发服务器')
+    parser.add_argument('--workers', type=int, default=1, help='工作进程数（prod）')
+    parser.add_argument('--threads', type=int, default=64, help='每个工作进程的线程数（prod）')
+    parser.add_argument('--agent-mode', choices=['sync', 'async'], default='sync', help='上游请求模式')
+    parser.add_argument('--requests', type=int, default=2000, help='请求总数')
+    parser.add_argument('--concurrency', type=int, default=64, help='并发客户端数')
+    parser.add_argument('--upstream-delay', type=float, default=0.2, help='模拟上游的响应延迟（秒）')
+    parser.add_argument('--model', default='gpt-4o-mini', help='请求使用的模型')
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    api_port = free_port()
+    upstream = start_mock_upstream(upstream_port, args.upstream_delay)
+    config_path = write_config(upstream_port, args.agent_mode)
+    server = start_api_server(args, api_port, config_path)
+
+    try:
+        if not wait_until_ready(api_port):
+            print("API服务器启动失败")
+            sys.exit(1)
+
+        # 预热
+        run_load(api_port, args.concurrency, args.concurrency, args.model)
+
+        latencies, errors, elapsed = run_load(api_port, args.requests, args.concurrency, args.model)
+        completed = len(latencies)
+
+        print(f"服务器: {args.server}, 工作进程: {args.workers}, 线程: {args.threads}, 上游模式: {args.agent_mode}")
+        print(f"并发: {args.concurrency}, 上游延迟: {args.upstream_delay * 1000:.0f}ms")
+        print(f"完成请求: {completed}, 失败: {errors}, 总耗时: {elapsed:.2f}秒")
+        print(f"吞吐量: {completed / elapsed:.1f} 请求/秒")
+        print(f"延迟: p50={percentile(latencies, 50) * 1000:.0f}ms, "
+              f"p99={percentile(latencies, 99) * 1000:.0f}ms")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=40)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        upstream.shutdown()
+        os.remove(config_path)
+
+
+if __name__ == '__main__':
+    main()
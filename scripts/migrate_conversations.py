@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+对话迁移脚本 - 将JSON文件保存的对话导入SQLite对话存储
+
+用法:
+    python scripts/migrate_conversations.py
+    python scripts/migrate_conversations.py --source conversations --db conversations/conversations.sqlite3
+
+导入的对话保留原来的文件名作为标识，以及时间戳、日期时间和标题。已存在的同名对话默认跳过，
+因此可以重复执行。导入完成后将config.json中conversations.backend设置为"sqlite"即可切换后端，原JSON文件不会被删除。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from api.config import get_conversation_settings  # noqa: E402
+from api.conversation_store import SQLITE_FILENAME, SQLiteConversationStore  # noqa: E402
+
+
+def read_batches(paths, batch_size):
+    """按批读取对话文件，无法解析或格式不是对话的文件输出错误后跳过"""
+    batch = []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"跳过无法读取的文件: {path}, 错误: {e}")
+            continue
+        # 一个格式不对的文件会让整批导入失败
+        if not isinstance(data, dict) or not isinstance(data.get("messages", []), list):
+            print(f"跳过格式不正确的文件: {path}")
+            continue
+        batch.append((os.path.basename(path), data))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    settings = get_conversation_settings()
+    default_source = settings["dir"] or os.path.join(PROJECT_ROOT, "conversations")
+
+    parser = argparse.ArgumentParser(description="将JSON对话文件导入SQLite对话存储")
+    parser.add_argument("--source", default=default_source, help="JSON对话文件所在的目录")
+    parser.add_argument("--db", default=None, help="SQLite数据库路径，默认使用配置中的sqlite_path或对话目录下的conversations.sqlite3")
+    parser.add_argument("--batch-size", type=int, default=500, help="每个事务导入的对话数")
+    parser.add_argument("--overwrite", action="store_true", help="覆盖已存在的同名对话")
+    args = parser.parse_args()
+
+    db_path = args.db or settings["sqlite_path"] or os.path.join(args.source, SQLITE_FILENAME)
+    paths = sorted(
+        os.path.join(args.source, name) for name in os.listdir(args.source) if name.endswith(".json")
+    )
+    print(f"从 {args.source} 导入 {len(paths)} 个对话文件到 {db_path}")
+
+    store = SQLiteConversationStore(db_path)
+    imported = skipped = 0
+    start = time.perf_counter()
+    for batch in read_batches(paths, max(1, args.batch_size)):
+        stats = store.import_conversations(batch, overwrite=args.overwrite)
+        imported += stats["imported"]
+        skipped += stats["skipped"]
+        print(f"已导入 {imported} 个，跳过 {skipped} 个")
+
+    failed = len(paths) - imported - skipped
+    print(f"完成: 导入 {imported} 个，跳过已存在的 {skipped} 个，无法读取或格式不正确 {failed} 个，耗时 {time.perf_counter() - start:.1f}秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""准入控制：按模型的并发上限、有界队列、排队超时和协程版acquire"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.admission import AdmissionController, AdmissionRejected  # noqa: E402
+
+MODEL = "gpt-4o-mini"
+OTHER = "deepseek-chat"
+
+
+def _active(admission, model=MODEL):
+    return admission.stats()["models"][model]["active"]
+
+
+class AdmissionControllerTest(unittest.TestCase):
+
+    def test_acquire_and_release(self):
+        admission = AdmissionController(model_concurrency=2)
+        with admission.acquire(MODEL) as ticket:
+            self.assertEqual(_active(admission), 1)
+            self.assertEqual(admission.stats()["global"]["active"], 1)
+            ticket.release()
+        # release可重复调用
+        self.assertEqual(_active(admission), 0)
+        self.assertEqual(admission.stats()["global"]["active"], 0)
+
+    def test_queue_full_rejected(self):
+        admission = AdmissionController(model_concurrency=1, model_queue=0)
+        with admission.acquire(MODEL):
+            with self.assertRaises(AdmissionRejected) as ctx:
+                admission.acquire(MODEL)
+        self.assertEqual(ctx.exception.reason, "queue_full")
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(admission.stats()["models"][MODEL]["rejected"], 1)
+
+    def test_queue_timeout_rejected(self):
+        admission = AdmissionController(model_concurrency=1, queue_timeout=0.05)
+        with admission.acquire(MODEL):
+            with self.assertRaises(AdmissionRejected) as ctx:
+                admission.acquire(MODEL)
+        self.assertEqual(ctx.exception.reason, "queue_timeout")
+        stats = admission.stats()["models"][MODEL]
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["waiting"], 0)
+
+    def test_waiter_admitted_after_release(self):
+        admission = AdmissionController(model_concurrency=1, queue_timeout=5)
+        ticket = admission.acquire(MODEL)
+        admitted = threading.Event()
+
+        def wait():
+            with admission.acquire(MODEL):
+                admitted.set()
+
+        thread = threading.Thread(target=wait, daemon=True)
+        thread.start()
+        time.sleep(0.05)
+        self.assertFalse(admitted.is_set())
+        ticket.release()
+        self.assertTrue(admitted.wait(2))
+        thread.join(2)
+        self.assertEqual(_active(admission), 0)
+
+    def test_models_have_separate_lanes(self):
+        admission = AdmissionController(model_concurrency=1, model_queue=0)
+        with admission.acquire(MODEL):
+            # 一个模型占满名额不影响其他模型
+            with admission.acquire(OTHER):
+                self.assertEqual(_active(admission, OTHER), 1)
+
+    def test_global_limit(self):
+        admission = AdmissionController(max_concurrency=1, max_queue=0, model_concurrency=4)
+        with admission.acquire(MODEL):
+            with self.assertRaises(AdmissionRejected):
+                admission.acquire(OTHER)
+        # 未取得全局名额时归还已取得的模型名额
+        self.assertEqual(_active(admission, OTHER), 0)
+
+    def test_model_override(self):
+        admission = AdmissionController(model_concurrency=4, model_queue=4,
+                                        models={MODEL: {"max_concurrency": 1, "max_queue": 0}})
+        with admission.acquire(MODEL):
+            with self.assertRaises(AdmissionRejected):
+                admission.acquire(MODEL)
+
+    def test_try_acquire(self):
+        admission = AdmissionController(model_concurrency=1)
+        ticket = admission.try_acquire(MODEL)
+        self.assertIsNotNone(ticket)
+        self.assertIsNone(admission.try_acquire(MODEL))
+        ticket.release()
+        self.assertIsNotNone(admission.try_acquire(MODEL))
+
+
+class AcquireAsyncTest(unittest.TestCase):
+
+    def test_free_slot(self):
+        admission = AdmissionController(model_concurrency=1)
+
+        async def run():
+            with await admission.acquire_async(MODEL):
+                return _active(admission)
+
+        self.assertEqual(asyncio.run(run()), 1)
+        self.assertEqual(_active(admission), 0)
+
+    def test_waits_without_blocking_loop(self):
+        admission = AdmissionController(model_concurrency=1, queue_timeout=5)
+        ticket = admission.acquire(MODEL)
+
+        async def run():
+            waiting = asyncio.ensure_future(admission.acquire_async(MODEL))
+            await asyncio.sleep(0.05)
+            self.assertFalse(waiting.done())
+            # 事件循环没有被阻塞，可以释放名额
+            ticket.release()
+            with await asyncio.wait_for(waiting, 2):
+                return _active(admission)
+
+        self.assertEqual(asyncio.run(run()), 1)
+        self.assertEqual(_active(admission), 0)
+
+    def test_rejected(self):
+        admission = AdmissionController(model_concurrency=1, model_queue=0)
+
+        async def run():
+            with admission.acquire(MODEL):
+                await admission.acquire_async(MODEL)
+
+        with self.assertRaises(AdmissionRejected):
+            asyncio.run(run())
+
+    def test_cancelled_waiter_releases_slot(self):
+        admission = AdmissionController(model_concurrency=1, queue_timeout=5)
+        ticket = admission.acquire(MODEL)
+
+        async def run():
+            waiting = asyncio.ensure_future(admission.acquire_async(MODEL))
+            await asyncio.sleep(0.05)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            ticket.release()
+            # 排队的线程取得名额后立即释放
+            deadline = time.monotonic() + 2
+            while admission.stats()["models"][MODEL]["admitted"] < 2 and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+        self.assertEqual(admission.stats()["models"][MODEL]["admitted"], 2)
+        self.assertEqual(_active(admission), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""批量对话：单个请求的错误只影响该请求的结果"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.batch import arun_batch, run_batch  # noqa: E402
+from api.async_meituan_agent import AsyncAgentRunner  # noqa: E402
+
+
+def _echo(item):
+    if item.get("fail"):
+        raise ValueError("失败")
+    return {"reply": item["message"]}
+
+
+class RunBatchTest(unittest.TestCase):
+
+    def test_results_keep_index_and_id(self):
+        items = [{"id": "a", "message": "你好"}, {"message": "再见"}]
+        results = sorted(run_batch(items, _echo, 2), key=lambda result: result["index"])
+        self.assertEqual([result["reply"] for result in results], ["你好", "再见"])
+        self.assertEqual(results[0]["id"], "a")
+        self.assertNotIn("id", results[1])
+
+    def test_handler_error_is_per_item(self):
+        results = sorted(run_batch([{"fail": True, "id": 1}, {"message": "你好"}], _echo, 2),
+                         key=lambda result: result["index"])
+        self.assertEqual(results[0]["error"], "ValueError: 失败")
+        self.assertEqual(results[0]["id"], 1)
+        self.assertEqual(results[1]["reply"], "你好")
+
+    def test_non_dict_items(self):
+        items = [1, "id", None, ["id"], {"message": "你好"}]
+        results = sorted(run_batch(items, _echo, 4), key=lambda result: result["index"])
+        self.assertEqual(len(results), 5)
+        for result in results[:4]:
+            self.assertIn("error", result)
+            self.assertNotIn("id", result)
+        self.assertEqual(results[4]["reply"], "你好")
+
+
+
+class AsyncRunBatchTest(unittest.TestCase):
+
+    def test_concurrency_bound(self):
+        running = []
+        peak = []
+
+        async def handler(item):
+            running.append(item)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(item)
+            return {"reply": item["message"]}
+
+        async def collect():
+            return [result async for result in arun_batch([{"message": i} for i in range(20)] + [1], handler, 4)]
+
+        results = asyncio.run(collect())
+        self.assertEqual(len(results), 21)
+        self.assertEqual(max(peak), 4)
+        self.assertEqual(sorted(result["reply"] for result in results if "reply" in result), list(range(20)))
+        self.assertEqual([result["index"] for result in results if "error" in result], [20])
+
+    def test_runner_batch_does_not_use_a_thread_per_item(self):
+        runner = AsyncAgentRunner()
+        try:
+            async def handler(item):
+                await asyncio.sleep(0.2)
+                return {"reply": item["message"]}
+
+            threads = threading.active_count()
+            start = time.monotonic()
+            results = list(runner.run_batch([{"message": i} for i in range(100)], handler, 100))
+            # 100个请求同时进行，没有为每个请求创建线程
+            self.assertLess(time.monotonic() - start, 1.5)
+            self.assertEqual(len(results), 100)
+            self.assertLessEqual(threading.active_count(), threads)
+        finally:
+            runner.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""配置存储：写入持有文件锁，配置文件缺失时不会自锁；并发修改不会互相覆盖；监视器发现外部修改后重新加载"""
+
+import os
+import sys
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.config import ConfigStore, ConfigWatcher  # noqa: E402
+
+
+def _in_thread(fn, timeout=5.0):
+    """在线程中执行fn，超时未返回时视为死锁"""
+    errors = []
+
+    def run():
+        try:
+            fn()
+        except BaseException as e:
+            errors.append(e)
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    worker.join(timeout)
+    return not worker.is_alive(), errors
+
+
+def _set(key, value):
+    def mutate(config):
+        config[key] = value
+    return mutate
+
+
+class ConfigStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "config.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _file(self):
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_update_without_config_file(self):
+        store = ConfigStore(self.path, check_interval=0, batch_window=0)
+        finished, errors = _in_thread(lambda: store.update(_set("tenant_id", "t1")))
+        self.assertTrue(finished, "配置文件不存在时update死锁")
+        self.assertEqual(errors, [])
+        self.assertEqual(self._file()["tenant_id"], "t1")
+
+    def test_update_after_config_file_deleted(self):
+        store = ConfigStore(self.path, check_interval=0, batch_window=0)
+        store.update(_set("tenant_id", "t1"))
+        os.unlink(self.path)
+        finished, errors = _in_thread(lambda: store.update(_set("app_id", "a1")))
+        self.assertTrue(finished, "配置文件被删除后update死锁")
+        self.assertEqual(errors, [])
+        self.assertEqual(self._file()["app_id"], "a1")
+        # 读取不被卡住的写入阻塞
+        finished, _ = _in_thread(store.get)
+        self.assertTrue(finished)
+
+    def test_concurrent_updates_from_two_stores(self):
+        # 两个存储实例模拟两个工作进程，各自的缓存可能过期
+        first = ConfigStore(self.path, check_interval=0, batch_window=0)
+        second = ConfigStore(self.path, check_interval=0, batch_window=0)
+        first.get()
+        second.get()
+        workers = [threading.Thread(target=store.update, args=(_set(f"key_{i}", i),))
+                   for i in range(10) for store in (first, second)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(5)
+        config = self._file()
+        self.assertEqual([config.get(f"key_{i}") for i in range(10)], list(range(10)))
+
+    def test_reload_on_external_change_notifies(self):
+        store = ConfigStore(self.path, check_interval=0, batch_window=0)
+        store.update(_set("tenant_id", "t1"))
+        changes = []
+        store.subscribe(lambda previous, current: changes.append(current.raw.get("tenant_id")))
+        config = self._file()
+        config["tenant_id"] = "t2"
+        # 其他进程写入的新文件，inode变化
+        tmp_path = self.path.with_name("other.json")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        os.replace(tmp_path, self.path)
+        self.assertEqual(store.get()["tenant_id"], "t2")
+        self.assertEqual(changes, ["t2"])
+
+    def test_unchanged_update_does_not_write(self):
+        store = ConfigStore(self.path, check_interval=0, batch_window=0)
+        store.update(_set("tenant_id", "t1"))
+        writes = store.writes
+        store.update(_set("tenant_id", "t1"))
+        self.assertEqual(store.writes, writes)
+
+    def test_watcher_reloads_external_change(self):
+        # 检查间隔很长，读取时不会自行重新加载，只能由监视器发现修改
+        store = ConfigStore(self.path, check_interval=3600, batch_window=0)
+        store.update(_set("tenant_id", "t1"))
+        changed = threading.Event()
+        store.subscribe(lambda previous, current: changed.set())
+        watcher = ConfigWatcher(store, interval=0.02)
+        watcher.start()
+        try:
+            config = self._file()
+            config["tenant_id"] = "t2"
+            tmp_path = self.path.with_name("other.json")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(config, f)
+            os.replace(tmp_path, self.path)
+            self.assertTrue(changed.wait(2))
+            self.assertEqual(store.get()["tenant_id"], "t2")
+        finally:
+            watcher.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""token计数：编码在启动任务中加载，加载期间请求不等待"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.context_manager import TokenCounter  # noqa: E402
+
+
+class TokenCounterTest(unittest.TestCase):
+
+    def test_count_does_not_wait_for_loading(self):
+        counter = TokenCounter()
+        text = "你好，请问怎么申请退款？"
+        # 模拟启动任务正在下载词表
+        counter._load_lock.acquire()
+        try:
+            result = []
+            worker = threading.Thread(target=lambda: result.append(counter.count_text(text)))
+            worker.start()
+            worker.join(2)
+            self.assertFalse(worker.is_alive())
+            self.assertEqual(result, [TokenCounter.estimate_tokens(text)])
+        finally:
+            counter._load_lock.release()
+        # 估算值没有被缓存，加载完成后按编码重新计数
+        counter.load()
+        self.assertNotIn(text, counter._cache)
+        counter.count_text(text)
+        self.assertIn(text, counter._cache)
+
+    def test_load_once(self):
+        counter = TokenCounter()
+        counter.load()
+        encoding = counter._encoding
+        counter.load()
+        self.assertIs(counter._encoding, encoding)
+        self.assertTrue(counter._encoding_loaded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""自动保存：后台线程不等待请求占用的会话锁"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.conversation_manager import ConversationManager  # noqa: E402
+from api.session_store import Session  # noqa: E402
+
+
+def _wait(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+class AutosaveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = ConversationManager(self.tmp.name, backend="journal", fsync_interval=0, autosave=True,
+                                           autosave_interval=0.1, search=False)
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmp.cleanup()
+
+    def _turn(self, session, text):
+        with session.lock:
+            session.append({"role": "user", "content": text})
+            session.append({"role": "assistant", "content": "好的"})
+            self.manager.mark_dirty(session)
+
+    def test_busy_session_does_not_block_others(self):
+        busy = Session("busy", "你是助手")
+        idle = Session("idle", "你是助手")
+        self._turn(busy, "第一轮")
+
+        # 模拟流式响应长时间持有会话锁
+        held = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with busy.lock:
+                held.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        held.wait()
+        try:
+            self._turn(idle, "你好")
+            self.assertTrue(_wait(lambda: idle.conversation_name is not None))
+            # 持有锁的会话也已保存，只是对话标识尚未写回
+            self.assertTrue(_wait(lambda: len(self.manager.list_conversations()) == 2))
+            self.assertIsNone(busy.conversation_name)
+        finally:
+            release.set()
+            holder.join()
+
+        # 下一轮继续保存到同一个对话，不会产生重复的对话
+        self._turn(busy, "第二轮")
+        self.assertIsNotNone(busy.conversation_name)
+        self.manager.flush_pending()
+        conversations = self.manager.list_conversations()
+        self.assertEqual(len(conversations), 2)
+        self.assertEqual(len(self.manager.load_conversation(busy.conversation_name)), 5)
+
+    def test_register_during_first_save(self):
+        self.manager.close()
+        self.manager = ConversationManager(self.tmp.name, backend="journal", fsync_interval=0, autosave=True,
+                                           autosave_interval=60, search=False)
+        session = Session("new", "你是助手")
+        self._turn(session, "第一轮")
+
+        # 第一次保存进行中（已从待保存队列取出，对话标识仍为None）时会话又登记了一次
+        saving = threading.Event()
+        resume = threading.Event()
+        save = self.manager.store.save
+
+        def slow_save(*args, **kwargs):
+            if not saving.is_set():
+                saving.set()
+                resume.wait(5)
+            return save(*args, **kwargs)
+
+        self.manager.store.save = slow_save
+        flusher = threading.Thread(target=self.manager.flush_pending)
+        flusher.start()
+        self.assertTrue(saving.wait(2))
+        self._turn(session, "第二轮")
+        resume.set()
+        flusher.join()
+
+        self.manager.flush_pending()
+        conversations = self.manager.list_conversations()
+        self.assertEqual(len(conversations), 1)
+        self.assertEqual(len(self.manager.load_conversation(session.conversation_name)), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""对话日志存储：只追加新增消息、重放truncate记录、截掉不完整的末尾记录和压缩"""
+
+import os
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import conversation_journal  # noqa: E402
+from api.conversation_journal import JournalConversationStore, replay  # noqa: E402
+
+
+def _message(i, size=10):
+    return {"role": "user" if i % 2 == 0 else "assistant", "content": f"{i}:" + "x" * size}
+
+
+def _line(record):
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+HEADER = {"timestamp": 1, "datetime": "", "title": "测试", "role": None, "model": None}
+
+
+class ReplayTest(unittest.TestCase):
+
+    def test_truncate(self):
+        data = _line(HEADER) + b"".join(_line({"message": _message(i)}) for i in range(3))
+        data += _line({"truncate": 1}) + _line({"message": _message(9)})
+        header, messages, line_sizes, valid, dead_bytes = replay(data)
+        self.assertEqual(header["title"], "测试")
+        self.assertEqual(messages, [_message(0), _message(9)])
+        self.assertEqual(valid, len(data))
+        dropped = [_line({"message": _message(i)}) for i in (1, 2)] + [_line({"truncate": 1})]
+        self.assertEqual(dead_bytes, sum(len(line) for line in dropped))
+        self.assertEqual(len(line_sizes), 2)
+
+    def test_meta_updates_header(self):
+        data = _line(HEADER) + _line({"meta": {"model": "gpt-4o"}})
+        header, messages, _, _, dead_bytes = replay(data)
+        self.assertEqual(header["model"], "gpt-4o")
+        self.assertEqual(messages, [])
+        self.assertGreater(dead_bytes, 0)
+
+    def test_incomplete_tail_ignored(self):
+        complete = _line(HEADER) + _line({"message": _message(0)})
+        data = complete + _line({"message": _message(1)})[:-5]
+        _, messages, _, valid, _ = replay(data)
+        self.assertEqual(messages, [_message(0)])
+        self.assertEqual(valid, len(complete))
+
+    def test_not_a_journal(self):
+        with self.assertRaises(ValueError):
+            replay(_line({"messages": []}))
+        with self.assertRaises(ValueError):
+            replay(b"")
+
+
+class JournalStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = JournalConversationStore(Path(self.tmp.name), fsync_interval=0)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_append_only_new_messages(self):
+        messages = [_message(0), _message(1)]
+        path = self.store.save(messages, title="测试")
+        size = os.path.getsize(path)
+        messages.append(_message(2))
+        self.assertEqual(self.store.save(messages, name=path), path)
+        self.assertEqual(self.store.appended_bytes, os.path.getsize(path) - size)
+        self.assertEqual(self.store.appended_bytes, len(_line({"message": _message(2)})))
+        self.assertEqual(self.store.load(path), messages)
+
+    def test_edited_history_truncates(self):
+        path = self.store.save([_message(0), _message(1), _message(2)], title="测试")
+        self.store.save([_message(0), _message(5)], name=path)
+        self.assertEqual(self.store.load(path), [_message(0), _message(5)])
+        self.assertEqual(self.store.metadata(path)["message_count"], 2)
+
+    def test_incomplete_tail_truncated_before_append(self):
+        messages = [_message(0)]
+        path = self.store.save(messages, title="测试")
+        # 模拟写入时进程崩溃留下的半行
+        with open(path, "ab") as f:
+            f.write(_line({"message": _message(1)})[:-5])
+        messages.append(_message(2))
+        self.store.save(messages, name=path)
+        self.assertEqual(self.store.load(path), messages)
+        with open(path, "rb") as f:
+            _, _, _, valid, _ = replay(f.read())
+        self.assertEqual(valid, os.path.getsize(path))
+
+    def test_external_append_reloaded(self):
+        path = self.store.save([_message(0)], title="测试")
+        other = JournalConversationStore(Path(self.tmp.name), fsync_interval=0)
+        try:
+            other.save([_message(0), _message(1)], name=path)
+        finally:
+            other.close()
+        self.store.save([_message(0), _message(1), _message(2)], name=path)
+        self.assertEqual(self.store.load(path), [_message(0), _message(1), _message(2)])
+
+    def test_compaction(self):
+        original = conversation_journal.MIN_COMPACT_BYTES
+        conversation_journal.MIN_COMPACT_BYTES = 1024
+        try:
+            path = self.store.save([_message(0)], title="测试")
+            # 反复改写最后一条消息，被截断的记录不断累积
+            for i in range(1, 20):
+                self.store.save([_message(0), _message(i, size=200)], name=path)
+        finally:
+            conversation_journal.MIN_COMPACT_BYTES = original
+        self.assertGreaterEqual(self.store.compactions, 1)
+        expected = [_message(0), _message(19, size=200)]
+        self.assertEqual(self.store.load(path), expected)
+        with open(path, "rb") as f:
+            _, _, _, _, dead_bytes = replay(f.read())
+        self.assertLess(dead_bytes, 1024)
+        self.assertLess(os.path.getsize(path), 10 * len(_line({"message": _message(19, size=200)})))
+
+    def test_save_after_delete_creates_new(self):
+        path = self.store.save([_message(0)], title="测试")
+        self.assertTrue(self.store.delete(path))
+        new_path = self.store.save([_message(0), _message(1)], name=path)
+        self.assertEqual(self.store.load(new_path), [_message(0), _message(1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
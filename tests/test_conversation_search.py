@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""对话搜索：中文子串匹配，继续保存同一个对话时只索引新增的消息"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.conversation_manager import ConversationManager  # noqa: E402
+
+SYSTEM = {"role": "system", "content": "你是外卖助手"}
+
+
+class ConversationSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = ConversationManager(self.tmp.name, backend="journal", fsync_interval=0)
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmp.cleanup()
+
+    def test_search_and_delete(self):
+        path = self.manager.save_conversation(
+            [SYSTEM, {"role": "user", "content": "请帮我查询外卖订单的配送进度"}], "订单查询")
+        self.manager.save_conversation([SYSTEM, {"role": "user", "content": "今天天气怎么样"}], "天气")
+
+        results = self.manager.search_conversations("外卖 配送")
+        self.assertEqual([r["title"] for r in results], ["订单查询"])
+        self.assertEqual(results[0]["message_index"], 1)
+        snippet, (start, end) = results[0]["snippet"], results[0]["highlights"][0]
+        self.assertEqual(snippet[start:end], "外卖")
+        # 系统消息不参与搜索
+        self.assertEqual(self.manager.search_conversations("外卖助手"), [])
+
+        self.manager.delete_conversation(path)
+        self.assertEqual(self.manager.search_conversations("外卖"), [])
+
+    def test_incremental_update(self):
+        index = self.manager.search_index
+        messages = [SYSTEM, {"role": "user", "content": "第一个问题"}]
+        name = os.path.basename(self.manager.save_conversation(list(messages), "对话"))
+        self.assertEqual(index.stats()["entries"], 2)
+
+        # 没有变化时不写入
+        metadata = self.manager.store.metadata(name)
+        self.assertEqual(index.update(name, metadata, list(messages)), 0)
+
+        # 追加的消息只写入新增的一行
+        messages.append({"role": "assistant", "content": "回答火锅"})
+        self.assertEqual(index.update(name, metadata, list(messages)), 1)
+
+        # 修改的消息被替换，旧内容不再命中
+        messages[-1] = {"role": "assistant", "content": "回答烧烤"}
+        self.manager.save_conversation(list(messages), name=name)
+        self.assertEqual(self.manager.search_conversations("火锅"), [])
+        self.assertEqual(len(self.manager.search_conversations("烧烤")), 1)
+        self.assertEqual(index.stats()["dead"], 1)
+
+        self.manager.rebuild_search_index()
+        self.assertEqual(index.stats(), {"conversations": 1, "entries": 3, "dead": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""请求对冲：备份请求需要取得准入名额，不会让模型超过并发上限"""
+
+import os
+import sys
+import time
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.admission import AdmissionController  # noqa: E402
+from api.hedging import Hedger  # noqa: E402
+
+MODEL = "gpt-4o-mini"
+
+
+def _hedger(admission):
+    hedger = Hedger(min_samples=1, admission=admission)
+    hedger.observe(MODEL, "chat", 0.01)
+    hedger.observe(MODEL, "stream", 0.01)
+    return hedger
+
+
+def _slow(target):
+    time.sleep(0.1)
+    return {"content": target}
+
+
+class HedgingAdmissionTest(unittest.TestCase):
+
+    def test_backup_skipped_without_free_slot(self):
+        admission = AdmissionController(model_concurrency=1)
+        hedger = _hedger(admission)
+        with admission.acquire(MODEL):
+            self.assertEqual(hedger.call(MODEL, _slow), {"content": MODEL})
+        stats = hedger.stats()
+        self.assertEqual(stats["hedged"], 0)
+        self.assertEqual(stats["no_slot"], 1)
+        self.assertEqual(admission.stats()["models"][MODEL]["active"], 0)
+
+    def test_backup_releases_slot(self):
+        admission = AdmissionController(model_concurrency=2)
+        hedger = _hedger(admission)
+        with admission.acquire(MODEL):
+            hedger.call(MODEL, _slow)
+        self.assertEqual(hedger.stats()["hedged"], 1)
+        # 落败的备份请求在线程中结束后释放名额
+        deadline = time.monotonic() + 2
+        while admission.stats()["models"][MODEL]["active"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(admission.stats()["models"][MODEL]["active"], 0)
+
+    def test_stream_backup_releases_slot(self):
+        admission = AdmissionController(model_concurrency=2)
+        hedger = _hedger(admission)
+
+        def stream(target):
+            time.sleep(0.1)
+            yield {"type": "delta", "content": target}
+            yield {"type": "done"}
+
+        with admission.acquire(MODEL):
+            events = list(hedger.stream(MODEL, stream))
+        self.assertEqual(events[-1]["type"], "done")
+        self.assertEqual(hedger.stats()["hedged"], 1)
+        deadline = time.monotonic() + 2
+        while admission.stats()["models"][MODEL]["active"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(admission.stats()["models"][MODEL]["active"], 0)
+
+    def test_cancelled_async_backup_releases_slot(self):
+        admission = AdmissionController(model_concurrency=2)
+        hedger = _hedger(admission)
+
+        async def slow(target):
+            await asyncio.sleep(0.1)
+            return {"content": target}
+
+        async def run():
+            with admission.acquire(MODEL):
+                result = await hedger.acall(MODEL, slow)
+            await asyncio.sleep(0)
+            return result
+
+        self.assertEqual(asyncio.run(run()), {"content": MODEL})
+        self.assertEqual(admission.stats()["models"][MODEL]["active"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
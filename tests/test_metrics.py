@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""监控指标：短生命周期线程的分片在没有抓取时也会被合并"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.metrics import MIN_PRUNE_SHARDS, Counter  # noqa: E402
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_dead_thread_shards_are_pruned_without_scrape(self):
+        counter = Counter("test_requests_total", "测试", ("route",))
+
+        def record():
+            counter.inc(route="/api/chat")
+
+        for _ in range(2000):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+
+        self.assertLessEqual(len(counter._shards), MIN_PRUNE_SHARDS)
+        self.assertIn('test_requests_total{route="/api/chat"} 2000', counter.expose())
+
+
+if __name__ == "__main__":
+    unittest.main()
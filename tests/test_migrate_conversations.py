@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""对话迁移：格式不正确的文件被跳过，不影响同一批的其他对话"""
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api.conversation_store import SQLiteConversationStore  # noqa: E402
+
+_spec = importlib.util.spec_from_file_location("migrate_conversations",
+                                               os.path.join(ROOT, "scripts", "migrate_conversations.py"))
+migrate = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(migrate)
+
+
+class MigrateConversationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def test_malformed_files_are_skipped(self):
+        conversation = {"timestamp": 1, "datetime": "2024-01-01 00:00:00", "title": "你好",
+                        "messages": [{"role": "user", "content": "你好"}]}
+        paths = [
+            self._write("a.json", json.dumps(conversation, ensure_ascii=False)),
+            self._write("b.json", "[1, 2]"),
+            self._write("c.json", "\"text\""),
+            self._write("d.json", "{broken"),
+            self._write("e.json", json.dumps({"messages": "不是列表"})),
+            self._write("f.json", json.dumps(conversation, ensure_ascii=False)),
+        ]
+        batches = list(migrate.read_batches(paths, 10))
+        self.assertEqual([[name for name, _ in batch] for batch in batches], [["a.json", "f.json"]])
+
+        store = SQLiteConversationStore(os.path.join(self.tmp.name, "conversations.sqlite3"))
+        try:
+            stats = store.import_conversations(batches[0])
+            self.assertEqual(stats, {"imported": 2, "skipped": 0})
+            self.assertEqual(store.load("a.json"), conversation["messages"])
+        finally:
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""重试和熔断：Retry-After解析、退避时间和熔断器状态转换"""
+
+import os
+import sys
+import time
+import unittest
+import email.utils
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.resilience import (  # noqa: E402
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers, RetryPolicy, parse_retry_after
+)
+
+
+class ParseRetryAfterTest(unittest.TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertEqual(parse_retry_after("-1"), 0.0)
+
+    def test_http_date(self):
+        value = email.utils.formatdate(time.time() + 10, usegmt=True)
+        self.assertAlmostEqual(parse_retry_after(value), 10, delta=1.5)
+
+    def test_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after(""))
+        self.assertIsNone(parse_retry_after("soon"))
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_backoff_bounds(self):
+        policy = RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=1.5)
+        for attempt, limit in enumerate((0.5, 1.0, 1.5, 1.5)):
+            for _ in range(20):
+                delay = policy.backoff(attempt)
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, limit)
+
+    def test_no_retry_after_last_attempt(self):
+        policy = RetryPolicy(max_attempts=2)
+        self.assertIsNotNone(policy.backoff(0))
+        self.assertIsNone(policy.backoff(1))
+        self.assertIsNone(RetryPolicy(max_attempts=1).backoff(0))
+
+    def test_retry_after(self):
+        policy = RetryPolicy(base_delay=0.5, max_retry_after=30)
+        delay = policy.backoff(0, retry_after=2)
+        self.assertGreaterEqual(delay, 2)
+        self.assertLessEqual(delay, 2.5)
+        # 上游要求等待太久时不重试
+        self.assertIsNone(policy.backoff(0, retry_after=60))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=30)
+        for _ in range(2):
+            self.assertTrue(breaker.allow())
+            breaker.record("5xx")
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record("timeout")
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.snapshot()["rejected"], 1)
+        self.assertGreater(breaker.retry_in(), 0)
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.record("5xx")
+        breaker.record("2xx")
+        breaker.record("5xx")
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_client_errors_not_counted(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record("4xx")
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_half_open_probe_recovers(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+        breaker.record("error")
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        # 半开状态只放行一个探测请求
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record("2xx")
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_half_open_probe_failure_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=0.05)
+        for _ in range(3):
+            breaker.record("5xx")
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record("timeout")
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.snapshot()["times_opened"], 2)
+
+    def test_breakers_per_model(self):
+        breakers = CircuitBreakers(failure_threshold=1)
+        breakers.get("a").record("5xx")
+        self.assertFalse(breakers.get("a").allow())
+        self.assertTrue(breakers.get("b").allow())
+        breakers.reset("a")
+        self.assertTrue(breakers.get("a").allow())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""响应缓存：命中统计和磁盘层"""
+
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import response_cache  # noqa: E402
+from api.response_cache import ResponseCache, make_cache_key  # noqa: E402
+
+MODEL = "gpt-4o-mini"
+MESSAGES = [{"role": "user", "content": "你好"}]
+RESPONSE = {"choices": [{"message": {"role": "assistant", "content": "你好！"}}]}
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_precheck_miss_is_not_counted_twice(self):
+        cache = ResponseCache()
+        key = make_cache_key(MODEL, MESSAGES, 0.7)
+        # 取得准入名额前的检查未命中，随后chat再次查找
+        self.assertIsNone(cache.get(key, record_miss=False))
+        self.assertIsNone(cache.get(key))
+        cache.set(key, RESPONSE)
+        self.assertEqual(cache.get(key, record_miss=False), RESPONSE)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def _disk_rows(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_disk_tier_purges_expired_entries_on_write(self):
+        path = os.path.join(self.tmp.name, "responses.sqlite")
+        cache = ResponseCache(max_entries=10, ttl=0.01, disk_path=path)
+        for i in range(response_cache.PURGE_EVERY_WRITES - 1):
+            cache.set(f"old-{i}", RESPONSE)
+        self.assertEqual(self._disk_rows(path), response_cache.PURGE_EVERY_WRITES - 1)
+        time.sleep(0.02)
+        cache.ttl = 3600
+        # 第PURGE_EVERY_WRITES次写入时清理过期条目
+        cache.set("fresh", RESPONSE)
+        self.assertEqual(self._disk_rows(path), 1)
+        self.assertEqual(cache.stats()["purged"], response_cache.PURGE_EVERY_WRITES - 1)
+        self.assertEqual(cache.get("fresh"), RESPONSE)
+
+    def test_purge_expired_keeps_live_entries(self):
+        path = os.path.join(self.tmp.name, "responses.sqlite")
+        cache = ResponseCache(ttl=0.01, disk_path=path)
+        cache.set("old", RESPONSE)
+        time.sleep(0.02)
+        cache.ttl = 3600
+        cache.set("live", RESPONSE)
+        self.assertEqual(cache.purge_expired(), 1)
+        self.assertEqual(self._disk_rows(path), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
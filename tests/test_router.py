@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""模型路由：候选模型排序、失败切换和全部未准入时的拒绝"""
+
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.admission import AdmissionRejected  # noqa: E402
+from api.context_manager import ContextManager, TokenCounter  # noqa: E402
+from api.router import ModelRouter  # noqa: E402
+
+FAST = "gpt-4o-mini"
+SLOW = "deepseek-chat"
+SMALL = "gpt-3.5-turbo-0613"
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def _router(models, **kwargs):
+    # 不存在的编码名使计数器直接使用估算值，测试不需要下载词表
+    context = ContextManager(counter=TokenCounter("unavailable"))
+    return ModelRouter(context, groups={"test": models}, **kwargs)
+
+
+def _reply(model, reason=None):
+    if reason is None:
+        return {"content": model}
+    return {"content": "提示", "fallback": True, "fallback_reason": reason}
+
+
+class CandidatesTest(unittest.TestCase):
+
+    def test_lower_latency_first(self):
+        router = _router([SLOW, FAST])
+        router.observe(SLOW, "ok", 3.0)
+        router.observe(FAST, "ok", 0.5)
+        self.assertEqual(router.candidates("test", MESSAGES), [FAST, SLOW])
+
+    def test_errors_demote_model(self):
+        router = _router([FAST, SLOW])
+        router.observe(FAST, "ok", 1.0)
+        router.observe(SLOW, "ok", 1.5)
+        for _ in range(3):
+            router.observe(FAST, "5xx")
+        self.assertEqual(router.candidates("test", MESSAGES), [SLOW, FAST])
+
+    def test_model_without_room_last(self):
+        router = _router([SMALL, FAST])
+        router.observe(SMALL, "ok", 0.1)
+        long_history = [{"role": "user", "content": "长" * 5000}]
+        # 小窗口模型虽然更快，但需要裁剪历史
+        self.assertEqual(router.candidates("test", long_history), [FAST, SMALL])
+
+    def test_max_attempts(self):
+        router = _router([FAST, SLOW, SMALL], max_attempts=2)
+        self.assertEqual(len(router.candidates("test", MESSAGES)), 2)
+
+
+class RouteTest(unittest.TestCase):
+
+    def test_failover_to_next_model(self):
+        router = _router([FAST, SLOW])
+        response, info = router.route("test", MESSAGES,
+                                      lambda model: _reply(model, "timeout" if model == FAST else None))
+        self.assertEqual(response, {"content": SLOW})
+        self.assertEqual(info["model"], SLOW)
+        self.assertEqual([a["outcome"] for a in info["attempts"]], ["timeout", "ok"])
+        self.assertEqual(router.stats()["models"][FAST]["failures"], 1)
+
+    def test_client_error_not_retried(self):
+        router = _router([FAST, SLOW])
+        response, info = router.route("test", MESSAGES, lambda model: _reply(model, "4xx"))
+        self.assertEqual(info["model"], FAST)
+        self.assertEqual(len(info["attempts"]), 1)
+
+    def test_all_failed_returns_last_reply(self):
+        router = _router([FAST, SLOW])
+        response, info = router.route("test", MESSAGES, lambda model: _reply(model, "5xx"))
+        self.assertTrue(response["fallback"])
+        self.assertEqual(info["model"], SLOW)
+
+    def test_rejected_model_skipped(self):
+        router = _router([FAST, SLOW])
+
+        def send(model):
+            if model == FAST:
+                raise AdmissionRejected(model, "queue_full", 1)
+            return _reply(model)
+
+        response, info = router.route("test", MESSAGES, send)
+        self.assertEqual(info["model"], SLOW)
+        self.assertEqual(info["attempts"][0]["outcome"], "queue_full")
+
+    def test_all_rejected_raises(self):
+        router = _router([FAST, SLOW])
+
+        def send(model):
+            raise AdmissionRejected(model, "queue_timeout", 2)
+
+        with self.assertRaises(AdmissionRejected) as ctx:
+            router.route("test", MESSAGES, send)
+        self.assertEqual(ctx.exception.model, SLOW)
+
+    def test_aroute(self):
+        router = _router([FAST, SLOW])
+
+        async def send(model):
+            await asyncio.sleep(0)
+            return _reply(model, "circuit_open" if model == FAST else None)
+
+        response, info = asyncio.run(router.aroute("test", MESSAGES, send))
+        self.assertEqual(response, {"content": SLOW})
+        self.assertEqual([a["model"] for a in info["attempts"]], [FAST, SLOW])
+
+
+if __name__ == "__main__":
+    unittest.main()
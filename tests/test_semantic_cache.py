@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""语义缓存：字面相近但意思不同的问题不能互相命中"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.semantic_cache import SemanticCache  # noqa: E402
+
+MODEL = "gpt-4o-mini"
+
+
+def _messages(question):
+    return [{"role": "system", "content": "你是助手"}, {"role": "user", "content": question}]
+
+
+class SemanticCacheTest(unittest.TestCase):
+
+    def _hits(self, stored, asked):
+        cache = SemanticCache(max_entries=16)
+        cache.store(MODEL, _messages(stored), {"choices": [{"message": {"content": stored}}]})
+        return cache.lookup(MODEL, _messages(asked)) is not None
+
+    def test_similar_questions_hit(self):
+        self.assertTrue(self._hits("你好，请问怎么申请退款？", "你好 请问怎么申请退款"))
+        self.assertTrue(self._hits("What is the capital of France?", "what is the capital of france"))
+        self.assertTrue(self._hits("北京今天天气怎么样", "北京今天的天气怎么样"))
+
+    def test_operators_do_not_hit(self):
+        self.assertFalse(self._hits("What is 2+2?", "What is 2*2?"))
+        self.assertFalse(self._hits("计算 10-3", "计算 10+3"))
+        self.assertFalse(self._hits("What is 12 squared?", "What is 13 squared?"))
+
+    def test_negations_do_not_hit(self):
+        self.assertFalse(self._hits("Is it safe to take aspirin?", "Is it unsafe to take aspirin?"))
+        self.assertFalse(self._hits("Should I take aspirin?", "Should I not take aspirin?"))
+        self.assertFalse(self._hits("Can I take aspirin with food?", "Can't I take aspirin with food?"))
+        self.assertFalse(self._hits("我应该买这只股票吗", "我不应该买这只股票吗"))
+        self.assertFalse(self._hits("这个药可以和酒一起吃吗", "这个药不可以和酒一起吃吗"))
+
+
+if __name__ == "__main__":
+    unittest.main()
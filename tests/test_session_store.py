@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""会话存储：LRU淘汰、空闲过期和内存上限"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.session_store import SessionStore  # noqa: E402
+
+
+class SessionStoreTest(unittest.TestCase):
+
+    def test_sessions_are_isolated(self):
+        store = SessionStore()
+        first, created = store.get_or_create("a", "你是助手")
+        self.assertTrue(created)
+        second, _ = store.get_or_create("b", "你是助手")
+        first.append({"role": "user", "content": "你好"})
+        self.assertEqual(len(first.messages), 2)
+        self.assertEqual(len(second.messages), 1)
+        again, created = store.get_or_create("a", "你是助手")
+        self.assertIs(again, first)
+        self.assertFalse(created)
+
+    def test_lru_eviction(self):
+        store = SessionStore(max_sessions=2)
+        store.get_or_create("a", "")
+        store.get_or_create("b", "")
+        # 访问a后b成为最久未使用的会话
+        store.get("a")
+        store.get_or_create("c", "")
+        self.assertIsNotNone(store.get("a"))
+        self.assertIsNone(store.get("b"))
+        self.assertEqual(store.stats()["evicted"], 1)
+
+    def test_idle_sessions_expire(self):
+        store = SessionStore(idle_ttl=60)
+        session, _ = store.get_or_create("a", "")
+        session.last_access -= 120
+        self.assertIsNone(store.get("a"))
+        _, created = store.get_or_create("a", "")
+        self.assertTrue(created)
+
+    def test_memory_limit_keeps_recent_session(self):
+        store = SessionStore(max_memory_bytes=10000)
+        old, _ = store.get_or_create("old", "")
+        old.append({"role": "user", "content": "x" * 2000})
+        new, _ = store.get_or_create("new", "")
+        new.append({"role": "user", "content": "x" * 2000})
+        store.enforce_limits()
+        self.assertIsNone(store.get("old"))
+        self.assertIs(store.get("new"), new)
+        self.assertLessEqual(store.stats()["memory_bytes"], 10000)
+
+    def test_memory_accounting_follows_messages(self):
+        store = SessionStore()
+        session, _ = store.get_or_create("a", "系统")
+        base = store.stats()["memory_bytes"]
+        session.append({"role": "user", "content": "你好"})
+        self.assertGreater(store.stats()["memory_bytes"], base)
+        session.pop()
+        self.assertEqual(store.stats()["memory_bytes"], base)
+        store.remove("a")
+        self.assertEqual(store.stats()["memory_bytes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""请求合并：同时进行的相同请求只执行一次"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.single_flight import AsyncSingleFlight, SingleFlight  # noqa: E402
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_request(self):
+        flight = SingleFlight()
+        calls = []
+
+        def request():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"content": "你好"}
+
+        results = []
+        workers = [threading.Thread(target=lambda: results.append(flight.do("key", request))) for _ in range(5)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(coalesced for _, coalesced in results), [False, True, True, True, True])
+        self.assertTrue(all(result == {"content": "你好"} for result, _ in results))
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_error_is_shared_and_not_cached(self):
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError("上游错误")
+
+        errors = []
+
+        def call():
+            try:
+                flight.do("key", failing)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 2)
+        # 失败的请求不会留下结果，之后的相同请求重新执行
+        self.assertEqual(flight.do("key", lambda: 1), (1, False))
+
+    def test_stream_late_subscriber_replays_from_start(self):
+        flight = SingleFlight()
+        first_event = threading.Event()
+        resume = threading.Event()
+
+        def upstream():
+            yield {"type": "delta", "content": "你"}
+            first_event.set()
+            resume.wait(2)
+            yield {"type": "delta", "content": "好"}
+            yield {"type": "done", "message": "你好"}
+
+        leader_events = []
+        leader = threading.Thread(target=lambda: leader_events.extend(flight.stream("key", upstream)))
+        leader.start()
+        first_event.wait(2)
+        follower = flight.stream("key", upstream)
+        first = next(follower)
+        resume.set()
+        follower_events = [first] + list(follower)
+        leader.join()
+        self.assertEqual([event for event, _ in follower_events], [event for event, _ in leader_events])
+        self.assertTrue(all(coalesced for _, coalesced in follower_events))
+        self.assertEqual(flight.stats()["stream_calls"], 1)
+
+    def test_async_calls_share_one_request(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def request():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "你好"
+
+        async def run():
+            return await asyncio.gather(*(flight.do("key", request) for _ in range(5)))
+
+        results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([result for result, _ in results], ["你好"] * 5)
+        self.assertEqual(sum(coalesced for _, coalesced in results), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -45,6 +45,13 @@ const { Header, Content, Footer } = Layout;
 const { TextArea } = Input;
 const { Option } = Select;
 
+// 每个浏览器标签页使用独立的会话ID，后端按会话ID隔离对话历史
+const SESSION_ID =
+  sessionStorage.getItem("sessionId") ||
+  `${Date.now().toString(36)}${Math.random().toString(36).slice(2)}`;
+sessionStorage.setItem("sessionId", SESSION_ID);
+axios.defaults.headers.common["X-Session-Id"] = SESSION_ID;
+
 // 创建axios实例
 const api = axios.create();
 
@@ -112,6 +119,7 @@ function App() {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
+            "X-Session-Id": SESSION_ID,
           },
         });
 
@@ -123,7 +131,9 @@ function App() {
 
           // 获取当前角色
           try {
-            const roleResponse = await fetch(`${baseUrl}/api/role`);
+            const roleResponse = await fetch(`${baseUrl}/api/role`, {
+              headers: { "X-Session-Id": SESSION_ID },
+            });
             if (roleResponse.ok) {
               const roleData = await roleResponse.json();
               setCurrentRole({
@@ -138,7 +148,9 @@ function App() {
 
           // 获取模型列表
           try {
-            const modelsResponse = await fetch(`${baseUrl}/api/models`);
+            const modelsResponse = await fetch(`${baseUrl}/api/models`, {
+              headers: { "X-Session-Id": SESSION_ID },
+            });
             if (modelsResponse.ok) {
               const modelsData = await modelsResponse.json();
 
@@ -383,36 +395,67 @@ function App() {
     setLoading(true);
 
     try {
-      // 使用选定的模型发送请求
-      const response = await api.post("/api/chat", {
-        message: userMessage,
-        model: selectedModel, // 添加模型参数
-        web_search: webSearchEnabled, // 添加联网参数
+      // 使用流式接口发送请求，收到增量内容后立即显示
+      const response = await fetch(`${apiBaseUrl}/api/chat/stream`, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "X-Session-Id": SESSION_ID,
+        },
+        body: JSON.stringify({
+          message: userMessage,
+          model: selectedModel, // 添加模型参数
+          web_search: webSearchEnabled, // 添加联网参数
+        }),
       });
 
-      if (response.data.message) {
-        // 检查是否有联网搜索结果
-        const hasSearchResults =
-          response.data.search_results &&
-          response.data.search_results.length > 0;
-
-        // 添加AI回复到列表，包含搜索结果信息
-        setMessages((prev) => [
-          ...prev,
-          {
-            role: "assistant",
-            content: response.data.message,
-            search_results: hasSearchResults
-              ? response.data.search_results
-              : null,
-          },
-        ]);
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.error || `HTTP ${response.status}`);
+      }
+
+      // 先添加一条空的AI回复，随后逐步追加内容
+      setMessages((prev) => [...prev, { role: "assistant", content: "" }]);
+      const updateReply = (update) =>
+        setMessages((prev) => {
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, ...update(last) }];
+        });
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder("utf-8");
+      let buffer = "";
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // SSE事件以空行分隔
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+          const rawEvent = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+
+          let eventType = "message";
+          let data = "";
+          rawEvent.split("\n").forEach((line) => {
+            if (line.startsWith("event:")) eventType = line.slice(6).trim();
+            else if (line.startsWith("data:")) data += line.slice(5).trim();
+          });
+          if (!data) continue;
+
+          const payload = JSON.parse(data);
+          if (eventType === "delta") {
+            updateReply((last) => ({ content: last.content + payload.content }));
+          } else if (eventType === "done") {
+            updateReply(() => ({ content: payload.message }));
+          }
+        }
       }
     } catch (error) {
       console.error("发送消息失败:", error);
-      message.error(
-        "发送消息失败: " + (error.response?.data?.error || error.message)
-      );
+      message.error("发送消息失败: " + error.message);
     } finally {
       setLoading(false);
     }